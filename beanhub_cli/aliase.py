@@ -1,3 +1,5 @@
+import importlib
+
 import click
 from click.core import Context
 
@@ -8,17 +10,39 @@ CMD_ALIAS_MAP = {
 
 
 class AliasedGroup(click.Group):
+    def __init__(self, *args, lazy_commands: dict[str, str] | None = None, **kwargs):
+        """Group with command aliases and prefix matching
+
+        :param lazy_commands: map from command name to the import path of the
+            command, like `package.module:attr`, which is only imported when the
+            command is looked up
+        """
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = lazy_commands or {}
+
+    def list_commands(self, ctx: Context) -> list[str]:
+        return sorted(set(super().list_commands(ctx)) | self.lazy_commands.keys())
+
+    def _get_command(self, ctx: Context, cmd_name: str) -> click.Command | None:
+        rv = click.Group.get_command(self, ctx, cmd_name)
+        if rv is not None or cmd_name not in self.lazy_commands:
+            return rv
+        module_name, attr_name = self.lazy_commands[cmd_name].split(":", 1)
+        cmd = getattr(importlib.import_module(module_name), attr_name)
+        self.add_command(cmd, name=cmd_name)
+        return cmd
+
     def get_command(self, ctx: Context, cmd_name: str):
         if cmd_name in CMD_ALIAS_MAP:
             cmd_name = CMD_ALIAS_MAP[cmd_name]
-        rv = click.Group.get_command(self, ctx, cmd_name)
+        rv = self._get_command(ctx, cmd_name)
         if rv is not None:
             return rv
         matches = [x for x in self.list_commands(ctx) if x.startswith(cmd_name)]
         if not matches:
             return None
         elif len(matches) == 1:
-            return click.Group.get_command(self, ctx, matches[0])
+            return self._get_command(ctx, matches[0])
         ctx.fail(f"Too many matches: {', '.join(sorted(matches))}")
 
     def resolve_command(self, ctx: Context, args: list[str]):
@@ -0,0 +1,333 @@
+import concurrent.futures
+import dataclasses
+import hashlib
+import json
+import logging
+import pathlib
+import typing
+
+from beancount_parser.parser import extract_includes
+from beanhub_import import constants
+from beanhub_import.post_processor import parse_override_flags
+from lark import Lark
+from lark import Tree
+
+from .file_io import write_atomic
+from .format_cache import make_config_hash
+from .import_records import ExistingRecord
+from .includes import collect_bean_files
+from .includes import scan_includes
+from .workers import get_parser
+from .workers import submit_largest_first
+
+INDEX_FILENAME = "existing-txns.json"
+# Bump this whenever the layout of the index file changes
+INDEX_FORMAT_VERSION = 2
+
+
+@dataclasses.dataclass(frozen=True)
+class IndexedTransaction:
+    lineno: int
+    id: str
+    # raw value of the import-override metadata field
+    override: str | None = None
+
+
+@dataclasses.dataclass(frozen=True)
+class BeanFileEntry:
+    size: int
+    mtime_ns: int
+    hash: str
+    # (include path value, lineno) of include statements in the file
+    includes: list[tuple[str, int]]
+    txns: list[IndexedTransaction]
+
+    def to_json(self) -> dict:
+        return dict(
+            size=self.size,
+            mtime_ns=self.mtime_ns,
+            hash=self.hash,
+            includes=[list(include) for include in self.includes],
+            txns=[[txn.lineno, txn.id, txn.override] for txn in self.txns],
+        )
+
+    @classmethod
+    def from_json(cls, payload: dict) -> "BeanFileEntry":
+        return cls(
+            size=payload["size"],
+            mtime_ns=payload["mtime_ns"],
+            hash=payload["hash"],
+            includes=[(value, lineno) for value, lineno in payload["includes"]],
+            txns=[
+                IndexedTransaction(lineno=lineno, id=txn_id, override=override)
+                for lineno, txn_id, override in payload["txns"]
+            ],
+        )
+
+
+def extract_indexed_transactions(
+    tree: Tree,
+) -> typing.Generator[IndexedTransaction, None, None]:
+    """Extract imported transactions from the tree of a single bean file, same as
+    what `extract_existing_transactions` does but without following includes
+
+    :param tree: parsed tree of the bean file
+    """
+    last_txn = None
+    import_id = None
+    import_override = None
+    if tree.data != "start":
+        raise ValueError("Expected start")
+    for child in tree.children:
+        if child is None:
+            continue
+        if child.data != "statement":
+            raise ValueError("Expected statement")
+        first_child = child.children[0]
+        if not isinstance(first_child, Tree):
+            continue
+        if first_child.data == "date_directive":
+            date_directive = first_child.children[0]
+            if date_directive.data.value != "txn":
+                continue
+            if last_txn is not None and import_id is not None:
+                yield IndexedTransaction(
+                    lineno=last_txn.meta.line, id=import_id, override=import_override
+                )
+            import_id = None
+            import_override = None
+            last_txn = date_directive
+        elif first_child.data == "metadata_item":
+            metadata_key = first_child.children[0].value
+            metadata_value = first_child.children[1]
+            if metadata_value.type == "ESCAPED_STRING":
+                metadata_value_str = json.loads(metadata_value.value)
+                if metadata_key == constants.IMPORT_ID_KEY:
+                    import_id = metadata_value_str
+                elif metadata_key == constants.IMPORT_OVERRIDE_KEY:
+                    import_override = metadata_value_str
+    if last_txn is not None and import_id is not None:
+        yield IndexedTransaction(
+            lineno=last_txn.meta.line, id=import_id, override=import_override
+        )
+
+
+def scan_bean_file(parser: Lark, bean_file: pathlib.Path) -> BeanFileEntry:
+    stat = bean_file.stat()
+    content = bean_file.read_bytes()
+    tree = parser.parse(content.decode("utf8"))
+    return BeanFileEntry(
+        size=stat.st_size,
+        mtime_ns=stat.st_mtime_ns,
+        hash=hashlib.sha256(content).hexdigest(),
+        includes=list(extract_includes(tree)),
+        txns=list(extract_indexed_transactions(tree)),
+    )
+
+
+def scan_bean_file_worker(bean_file: pathlib.Path) -> BeanFileEntry:
+    return scan_bean_file(parser=get_parser(), bean_file=bean_file)
+
+
+class ExistingTransactionIndex:
+    """Persistent index of imported transactions in bean files.
+
+    Entries are validated by the size and mtime of a bean file first, then by the
+    hash of its content, and a bean file is only parsed again when its content
+    actually changed.
+
+    The hash of the formatter output last written to a bean file is recorded as
+    well, so that we know if the file is still in the exact form the formatter
+    would output without parsing and formatting it.
+    """
+
+    def __init__(
+        self,
+        index_path: pathlib.Path | None = None,
+        logger: logging.Logger | None = None,
+    ):
+        self.index_path = index_path
+        self.logger = logger or logging.getLogger(__name__)
+        self.entries: dict[str, BeanFileEntry] = {}
+        # path -> hash of the formatter output last written to the file
+        self.formatted_hashes: dict[str, str] = {}
+        self.formatter_hash = make_config_hash()
+        self.scanned_count = 0
+        self._dirty = False
+        if index_path is not None and index_path.exists():
+            self._load(index_path)
+
+    def _load(self, index_path: pathlib.Path):
+        try:
+            payload = json.loads(index_path.read_text())
+            if payload.get("version") != INDEX_FORMAT_VERSION:
+                return
+            self.entries = {
+                key: BeanFileEntry.from_json(value)
+                for key, value in payload["files"].items()
+            }
+            # a different formatter may output differently
+            if payload["formatter"] == self.formatter_hash:
+                self.formatted_hashes = dict(payload["formatted"])
+        except (ValueError, KeyError, TypeError):
+            self.logger.warning(
+                "Invalid existing transaction index %s, ignored", index_path
+            )
+            self.entries = {}
+            self.formatted_hashes = {}
+
+    def get(self, bean_file: pathlib.Path) -> BeanFileEntry | None:
+        """Get the entry of a bean file if it's still up-to-date with the file"""
+        key = bean_file.as_posix()
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        stat = bean_file.stat()
+        if stat.st_size != entry.size:
+            return None
+        if stat.st_mtime_ns == entry.mtime_ns:
+            return entry
+        # touched but maybe not changed, let's check the content hash
+        if hashlib.sha256(bean_file.read_bytes()).hexdigest() != entry.hash:
+            return None
+        entry = dataclasses.replace(entry, mtime_ns=stat.st_mtime_ns)
+        self.put(bean_file, entry)
+        return entry
+
+    def put(self, bean_file: pathlib.Path, entry: BeanFileEntry):
+        self.entries[bean_file.as_posix()] = entry
+        self._dirty = True
+
+    def get_formatted_hash(self, bean_file: pathlib.Path) -> str | None:
+        """Get the hash of the formatter output last written to a bean file"""
+        return self.formatted_hashes.get(bean_file.as_posix())
+
+    def put_formatted_hash(self, bean_file: pathlib.Path, content_hash: str):
+        key = bean_file.as_posix()
+        if self.formatted_hashes.get(key) == content_hash:
+            return
+        self.formatted_hashes[key] = content_hash
+        self._dirty = True
+
+    def save(self, visited_files: typing.Iterable[pathlib.Path] | None = None):
+        """Save the index to disk
+
+        :param visited_files: if provided, only keep entries of these files
+        """
+        if visited_files is not None:
+            keys = frozenset(bean_file.as_posix() for bean_file in visited_files)
+            if keys != frozenset(self.entries):
+                self.entries = {
+                    key: entry for key, entry in self.entries.items() if key in keys
+                }
+                self._dirty = True
+            if not keys.issuperset(self.formatted_hashes):
+                self.formatted_hashes = {
+                    key: content_hash
+                    for key, content_hash in self.formatted_hashes.items()
+                    if key in keys
+                }
+                self._dirty = True
+        if self.index_path is None or not self._dirty:
+            return
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        write_atomic(
+            self.index_path,
+            json.dumps(
+                dict(
+                    version=INDEX_FORMAT_VERSION,
+                    files={key: entry.to_json() for key, entry in self.entries.items()},
+                    formatter=self.formatter_hash,
+                    formatted=self.formatted_hashes,
+                )
+            ),
+        )
+        self._dirty = False
+
+
+def extract_existing_transactions(
+    parser: Lark,
+    index: ExistingTransactionIndex,
+    bean_file: pathlib.Path,
+    root_dir: pathlib.Path | None = None,
+    executor: concurrent.futures.Executor | None = None,
+) -> typing.Generator[ExistingRecord, None, None]:
+    """Same as `beanhub_import.post_processor.extract_existing_transactions` but
+    reuses index entries of unchanged bean files instead of parsing them again.
+
+    The include graph is discovered first, with a cheap scan of include statements
+    for changed files, then all the changed files are parsed at once, on the
+    executor if one is provided.
+
+    :param parser: parser for parsing changed bean files without executor
+    :param index: the existing transaction index
+    :param bean_file: the entry bean file
+    :param root_dir: root dir of the project, includes going above it are ignored
+    :param executor: executor for parsing changed bean files in parallel
+    """
+    if root_dir is None:
+        root_dir = bean_file.parent
+    root_dir = root_dir.resolve().absolute()
+    scanned_entries: dict[pathlib.Path, BeanFileEntry] = {}
+
+    def get_entry(current_file: pathlib.Path) -> BeanFileEntry | None:
+        entry = scanned_entries.get(current_file)
+        if entry is not None:
+            return entry
+        return index.get(current_file)
+
+    def get_includes(current_file: pathlib.Path) -> list[tuple[str, int]]:
+        entry = get_entry(current_file)
+        if entry is not None:
+            return entry.includes
+        return scan_includes(current_file.read_text())
+
+    while True:
+        bean_files = collect_bean_files(
+            get_includes=get_includes,
+            bean_file=bean_file,
+            root_dir=root_dir,
+            logger=index.logger,
+        )
+        changed_files = [
+            current_file
+            for current_file in bean_files
+            if get_entry(current_file) is None
+        ]
+        if not changed_files:
+            break
+        if executor is None or len(changed_files) == 1:
+            entries = (
+                scan_bean_file(parser=parser, bean_file=current_file)
+                for current_file in changed_files
+            )
+        else:
+            entries = (
+                future.result()
+                for future in submit_largest_first(
+                    executor,
+                    scan_bean_file_worker,
+                    changed_files,
+                    size=lambda current_file: current_file.stat().st_size,
+                )
+            )
+        for current_file, entry in zip(changed_files, entries):
+            index.logger.debug("Scanned bean file %s", current_file)
+            scanned_entries[current_file] = entry
+            index.put(current_file, entry)
+            index.scanned_count += 1
+        # Loop again in case the actual include statements are different from what
+        # the cheap scan found, all the files scanned are reused in the next round
+
+    for current_file in bean_files:
+        entry = get_entry(current_file)
+        for txn in entry.txns:
+            yield ExistingRecord(
+                file=current_file,
+                lineno=txn.lineno,
+                id=txn.id,
+                override=parse_override_flags(txn.override)
+                if txn.override is not None
+                else None,
+            )
+    index.save(visited_files=bean_files)
@@ -0,0 +1,171 @@
+import hashlib
+import importlib.metadata
+import json
+import logging
+import pathlib
+import typing
+
+from beanhub_import.data_types import DeletedTransaction
+from beanhub_import.data_types import GeneratedTransaction
+from beanhub_import.data_types import UnprocessedTransaction
+from beanhub_import.processor import ImportFile
+from beanhub_import.processor import ImportProcessResult
+from beanhub_import.processor import parse_extractor_uri
+from pydantic import TypeAdapter
+
+from .file_io import write_atomic
+
+# Bump this whenever the layout of the cached payloads changes
+CACHE_FORMAT_VERSION = 1
+HASH_CHUNK_SIZE = 1024 * 1024
+
+UnprocessedTransactionAdapter = TypeAdapter(UnprocessedTransaction)
+
+
+def hash_file(filepath: pathlib.Path) -> str:
+    digest = hashlib.sha256()
+    with filepath.open("rb") as fo:
+        while chunk := fo.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_json(value: typing.Any) -> str:
+    payload = json.dumps(value, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf8")).hexdigest()
+
+
+def get_package_version(name: str) -> str | None:
+    try:
+        return importlib.metadata.version(name)
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+
+def dump_import_result(result: ImportProcessResult) -> dict:
+    if isinstance(result, GeneratedTransaction):
+        return dict(type="generated", value=result.model_dump(mode="json"))
+    elif isinstance(result, DeletedTransaction):
+        return dict(type="deleted", value=result.model_dump(mode="json"))
+    elif isinstance(result, UnprocessedTransaction):
+        return dict(
+            type="unprocessed",
+            value=UnprocessedTransactionAdapter.dump_python(result, mode="json"),
+        )
+    raise ValueError(f"Unexpected type {type(result)}")
+
+
+def load_import_result(payload: dict) -> ImportProcessResult:
+    result_type = payload["type"]
+    if result_type == "generated":
+        return GeneratedTransaction.model_validate(payload["value"])
+    elif result_type == "deleted":
+        return DeletedTransaction.model_validate(payload["value"])
+    elif result_type == "unprocessed":
+        return UnprocessedTransactionAdapter.validate_python(payload["value"])
+    raise ValueError(f"Unexpected result type {result_type}")
+
+
+def save_import_results(entry_path: pathlib.Path, results: list[ImportProcessResult]):
+    """Write an import cache entry, it can be called from worker processes"""
+    entry_path.parent.mkdir(parents=True, exist_ok=True)
+    write_atomic(entry_path, json.dumps(list(map(dump_import_result, results))))
+
+
+class ImportResultCache:
+    """Content-addressed cache of `process_import_file` results.
+
+    Each entry is keyed by the hash of the input file content, its relative path,
+    the rendered input config, the import rules and the versions of the packages
+    producing the results, so any change to those yields a different key.
+    """
+
+    def __init__(
+        self,
+        cache_dir: pathlib.Path,
+        config_file: pathlib.Path,
+        logger: logging.Logger | None = None,
+    ):
+        """Cache of the results imported with the given import config file
+
+        :param cache_dir: the cache folder of the BeanHub project
+        :param config_file: the import config file, entries are kept in a folder
+            per config file, so that pruning the entries not used with one config
+            file doesn't drop the ones of the others
+        """
+        self.cache_dir = (
+            cache_dir / "imports" / hash_json(config_file.resolve().as_posix())[:16]
+        )
+        self.logger = logger or logging.getLogger(__name__)
+        self.used_keys: set[str] = set()
+        self._versions = dict(
+            format=CACHE_FORMAT_VERSION,
+            beanhub_import=get_package_version("beanhub-import"),
+            beanhub_extract=get_package_version("beanhub-extract"),
+        )
+
+    def make_key(self, import_file: ImportFile) -> str | None:
+        input_config = import_file.rendered_input_config.input_config
+        extractor = (
+            input_config.config.extractor if input_config.config is not None else None
+        )
+        if extractor is not None:
+            uri_type, _ = parse_extractor_uri(extractor)
+            if uri_type == "module":
+                # we have no idea when the code of a custom extractor changes
+                return None
+        rendered_filter = import_file.rendered_input_config.filter
+        return hash_json(
+            dict(
+                versions=self._versions,
+                file=import_file.filepath.relative_to(import_file.input_dir).as_posix(),
+                file_hash=hash_file(import_file.filepath),
+                extractor=extractor,
+                input_config=input_config.model_dump(mode="json"),
+                filter=[
+                    operation.model_dump(mode="json") for operation in rendered_filter
+                ]
+                if rendered_filter is not None
+                else None,
+                values=import_file.rendered_input_config.values,
+                import_rules=[
+                    import_rule.model_dump(mode="json")
+                    for import_rule in import_file.import_rules
+                ],
+                context=import_file.context,
+            )
+        )
+
+    def entry_path(self, key: str) -> pathlib.Path:
+        return self.cache_dir / f"{key}.json"
+
+    def mark_used(self, key: str):
+        self.used_keys.add(key)
+
+    def load(self, key: str) -> list[ImportProcessResult] | None:
+        entry_path = self.entry_path(key)
+        if not entry_path.exists():
+            return None
+        try:
+            payload = json.loads(entry_path.read_text())
+            results = list(map(load_import_result, payload))
+        except (ValueError, KeyError):
+            self.logger.warning("Invalid import cache entry %s, ignored", entry_path)
+            return None
+        self.used_keys.add(key)
+        return results
+
+    def prune(self) -> int:
+        """Remove entries not loaded or saved since this cache object was created
+
+        :return: number of removed entries
+        """
+        if not self.cache_dir.exists():
+            return 0
+        removed = 0
+        for entry_path in self.cache_dir.glob("*.json"):
+            if entry_path.stem in self.used_keys:
+                continue
+            entry_path.unlink(missing_ok=True)
+            removed += 1
+        return removed
@@ -1,5 +1,6 @@
 import logging
 import os
+import pathlib
 
 import click
 from rich.logging import Console
@@ -10,9 +11,29 @@ from .environment import Environment
 from .environment import LOG_LEVEL_MAP
 from .environment import LogLevel
 from .environment import pass_env
+from .profiling import make_profiler
+from .profiling import ProfileConfig
+from .profiling import ProfileFormat
+from .profiling import set_worker_profile_config
 
+# subcommands are only imported when invoked, so that commands like `bh format` don't
+# pay for importing the web stack of the others at startup
+LAZY_COMMANDS = {
+    "connect": "beanhub_cli.connect.main:cli",
+    "form": "beanhub_cli.forms.main:cli",
+    "format": "beanhub_cli.format:main",
+    "import": "beanhub_cli.import_cli:main",
+    "inbox": "beanhub_cli.inbox.main:cli",
+    "login": "beanhub_cli.login:main",
+    "mcp": "beanhub_cli.mcp.main:cli",
+}
 
-@click.group(help="Command line tools for BeanHub", cls=AliasedGroup)
+
+@click.group(
+    help="Command line tools for BeanHub",
+    cls=AliasedGroup,
+    lazy_commands=LAZY_COMMANDS,
+)
 @click.option(
     "-l",
     "--log-level",
@@ -21,9 +42,32 @@ from .environment import pass_env
     ),
     default=lambda: os.environ.get("LOG_LEVEL", "INFO"),
 )
+@click.option(
+    "--profile",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Profile the command and write the profile to the given file",
+)
+@click.option(
+    "--profile-format",
+    type=click.Choice([item.value for item in ProfileFormat], case_sensitive=False),
+    default=ProfileFormat.PSTATS.value,
+    show_default=True,
+    help="Format of the profile, speedscope requires pyinstrument installed",
+)
+@click.option(
+    "--profile-workers",
+    is_flag=True,
+    help="Also profile worker processes, each into a file named after the profile file with the worker pid appended",
+)
 @click.version_option(prog_name="beanhub-cli", package_name="beanhub-cli")
 @pass_env
-def cli(env: Environment, log_level: str):
+def cli(
+    env: Environment,
+    log_level: str,
+    profile: str | None,
+    profile_format: str,
+    profile_workers: bool,
+):
     env.log_level = LogLevel(log_level)
     FORMAT = "%(message)s"
     console = Console(stderr=True)
@@ -38,3 +82,29 @@ def cli(env: Environment, log_level: str):
     httpx_logger.level = logging.WARNING
     beancount_black_logger = logging.getLogger("beancount_black.formatter")
     beancount_black_logger.level = logging.WARNING
+
+    set_worker_profile_config(None)
+    if profile is None:
+        if profile_workers:
+            raise click.UsageError("--profile-workers requires --profile")
+        return
+    profile_config = ProfileConfig(
+        output_path=pathlib.Path(profile),
+        format=ProfileFormat(profile_format.lower()),
+    )
+    try:
+        profiler = make_profiler(profile_config.format)
+    except ValueError as exc:
+        raise click.UsageError(str(exc))
+    if profile_workers:
+        set_worker_profile_config(profile_config)
+
+    def write_profile():
+        profiler.stop()
+        profiler.write(profile_config.output_path)
+        env.logger.info("Wrote profile to %s", profile_config.output_path)
+
+    # the context of this group is closed after the subcommand and its resources,
+    # such as worker pools, are done
+    click.get_current_context().call_on_close(write_profile)
+    profiler.start()
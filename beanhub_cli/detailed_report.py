@@ -0,0 +1,200 @@
+import csv
+import dataclasses
+import itertools
+import pathlib
+import typing
+
+import rich
+from beanhub_import.data_types import ChangeSet
+from rich import box
+from rich.markup import escape
+from rich.padding import Padding
+from rich.table import Table
+
+from .import_records import DeletedRecord
+from .import_records import GeneratedRecord
+from .import_records import UnprocessedRecord
+
+TABLE_HEADER_STYLE = "yellow"
+TABLE_COLUMN_STYLE = "cyan"
+DEFAULT_MAX_ROWS = 100
+CSV_FIELDS = [
+    "section",
+    "file",
+    "line",
+    "id",
+    "source",
+    "extractor",
+    "date",
+    "narration",
+    "desc",
+    "bank_desc",
+    "amount",
+    "currency",
+]
+
+
+@dataclasses.dataclass(frozen=True)
+class ReportColumn:
+    # key of the column in the CSV output
+    key: str
+    header: str
+    justify: str = "left"
+
+
+@dataclasses.dataclass(frozen=True)
+class ReportSection:
+    name: str
+    title: str
+    columns: list[ReportColumn]
+    # rows are generated lazily, so that a section never sits in memory as a whole
+    rows: typing.Callable[[], typing.Iterator[tuple]]
+
+
+def _to_cell(value: typing.Any) -> str:
+    if value is None:
+        return ""
+    return str(value)
+
+
+def make_report_sections(
+    change_sets: dict[pathlib.Path, ChangeSet],
+    generated_txns: list[GeneratedRecord],
+    deleted_txns: list[DeletedRecord],
+    unprocessed_txns: list[UnprocessedRecord],
+    imported_txns_with_override: frozenset[str],
+    remove_dangling: bool,
+) -> list[ReportSection]:
+    deleted_txn_ids = frozenset(txn.id for txn in deleted_txns)
+
+    def iter_deleted_rows() -> typing.Iterator[tuple]:
+        for target_file, change_set in change_sets.items():
+            for txn in change_set.remove:
+                if txn.id not in deleted_txn_ids:
+                    continue
+                yield target_file, txn.lineno, txn.id
+
+    def iter_dangling_rows() -> typing.Iterator[tuple]:
+        for target_file, change_set in change_sets.items():
+            for txn in change_set.dangling or ():
+                yield target_file, txn.lineno, txn.id
+
+    def iter_generated_rows() -> typing.Iterator[tuple]:
+        for txn in generated_txns:
+            yield (
+                txn.file,
+                txn.id,
+                ":".join(txn.sources) if txn.sources is not None else None,
+                txn.date,
+                txn.narration,
+            )
+
+    def iter_open_rows() -> typing.Iterator[tuple]:
+        for txn in unprocessed_txns:
+            if txn.import_id in imported_txns_with_override:
+                continue
+            yield (
+                txn.file,
+                txn.lineno,
+                txn.import_id,
+                txn.extractor,
+                txn.date,
+                txn.desc,
+                txn.bank_desc,
+                txn.amount,
+                txn.currency,
+            )
+
+    location_columns = [
+        ReportColumn("file", "File"),
+        ReportColumn("line", "Line"),
+        ReportColumn("id", "Id"),
+    ]
+    dangling_action = "Delete" if remove_dangling else "Ignored"
+    return [
+        ReportSection(
+            name="deleted",
+            title="Deleted transactions",
+            columns=location_columns,
+            rows=iter_deleted_rows,
+        ),
+        ReportSection(
+            name="dangling",
+            title=f"Dangling Transactions ({dangling_action})",
+            columns=location_columns,
+            rows=iter_dangling_rows,
+        ),
+        ReportSection(
+            name="generated",
+            title="Generated transactions",
+            columns=[
+                ReportColumn("file", "File"),
+                ReportColumn("id", "Id"),
+                ReportColumn("source", "Source"),
+                ReportColumn("date", "Date"),
+                ReportColumn("narration", "Narration"),
+            ],
+            rows=iter_generated_rows,
+        ),
+        ReportSection(
+            name="open",
+            title="Open transactions",
+            columns=[
+                ReportColumn("file", "File"),
+                ReportColumn("line", "Line"),
+                ReportColumn("id", "Id"),
+                ReportColumn("extractor", "Extractor"),
+                ReportColumn("date", "Date"),
+                ReportColumn("desc", "Desc"),
+                ReportColumn("bank_desc", "Bank Desc"),
+                ReportColumn("amount", "Amount", justify="right"),
+                ReportColumn("currency", "Currency"),
+            ],
+            rows=iter_open_rows,
+        ),
+    ]
+
+
+def print_report_sections(sections: list[ReportSection], max_rows: int | None):
+    """Print report sections as tables, with at most `max_rows` rows each
+
+    :param sections: report sections to print
+    :param max_rows: max number of rows to print for each section, None for no limit
+    """
+    for section in sections:
+        table = Table(
+            title=section.title,
+            box=box.SIMPLE,
+            header_style=TABLE_HEADER_STYLE,
+            expand=True,
+        )
+        for column in section.columns:
+            table.add_column(
+                column.header, style=TABLE_COLUMN_STYLE, justify=column.justify
+            )
+        rows = section.rows()
+        for row in itertools.islice(rows, max_rows):
+            table.add_row(*(escape(_to_cell(value)) for value in row))
+        remaining_count = sum(1 for _ in rows)
+        if remaining_count:
+            table.caption = (
+                f"{remaining_count} more rows not shown, "
+                "write the full report with --detailed-report-csv"
+            )
+        rich.print(Padding(table, (1, 0, 0, 4)))
+
+
+def write_report_csv(sections: list[ReportSection], output_file: typing.TextIO):
+    """Write all rows of report sections into a CSV file row by row
+
+    :param sections: report sections to write
+    :param output_file: the output CSV file
+    """
+    writer = csv.DictWriter(output_file, fieldnames=CSV_FIELDS, restval="")
+    writer.writeheader()
+    for section in sections:
+        keys = [column.key for column in section.columns]
+        for row in section.rows():
+            writer.writerow(
+                dict(section=section.name, **dict(zip(keys, map(_to_cell, row))))
+            )
@@ -1,9 +1,15 @@
 import io
 import logging
+import os
 import pathlib
+import secrets
+import shutil
 import sys
 import tarfile
 
+BEANHUB_DIR = pathlib.Path(".beanhub")
+CACHE_DIR = BEANHUB_DIR / "cache"
+
 
 def extract_tar(input_file: io.BytesIO, logger: logging.Logger):
     with tarfile.open(fileobj=input_file, mode="r:gz") as tar_file:
@@ -53,3 +59,84 @@ def extract_inbox_tar(
                 set_attrs=False,
                 filter="data" if has_data_filter else None,
             )
+
+
+def write_atomic(target: pathlib.Path, content: str | bytes):
+    """Write content into a sibling temp file first, then swap it in place with
+    `os.replace`, so that readers never see a partially written file. The file
+    mode and owner of the existing target file are preserved.
+
+    Symlinks are followed, so that the file they point to gets written instead of
+    the links being replaced by regular files. Files with hardlinks are written in
+    place, as swapping them would break the links.
+
+    :param target: path of file to write
+    :param content: content to write, text or bytes
+    """
+    mode = "wb" if isinstance(content, bytes) else "wt"
+    target = pathlib.Path(os.path.realpath(target))
+    try:
+        target_stat = target.stat()
+    except FileNotFoundError:
+        target_stat = None
+    if target_stat is not None and target_stat.st_nlink > 1:
+        with target.open(mode) as fo:
+            fo.write(content)
+        return
+    while True:
+        tmp_path = target.parent / f".{target.name}.{secrets.token_hex(4)}.tmp"
+        try:
+            # unlike mkstemp, the default file mode follows umask as usual
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        except FileExistsError:
+            continue
+        break
+    try:
+        with os.fdopen(fd, mode) as fo:
+            fo.write(content)
+        if target_stat is not None:
+            shutil.copymode(target, tmp_path)
+            tmp_stat = tmp_path.stat()
+            if hasattr(os, "chown") and (tmp_stat.st_uid, tmp_stat.st_gid) != (
+                target_stat.st_uid,
+                target_stat.st_gid,
+            ):
+                try:
+                    os.chown(tmp_path, target_stat.st_uid, target_stat.st_gid)
+                except PermissionError:
+                    # only root can give files away, keep our own then
+                    pass
+        os.replace(tmp_path, target)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def write_if_changed(target: pathlib.Path, content: str) -> bool:
+    """Write content to the target file atomically, but only if it's different
+    from the current content of the file
+
+    :param target: path of file to write
+    :param content: content to write
+    :return: True if the file was written
+    """
+    data = content.encode("utf8")
+    if target.exists():
+        if target.stat().st_size == len(data) and target.read_bytes() == data:
+            return False
+    write_atomic(target, data)
+    return True
+
+
+def get_cache_dir(workdir: pathlib.Path) -> pathlib.Path:
+    """Get the cache folder of a BeanHub project, create it if it doesn't exist yet
+
+    :param workdir: the BeanHub project path
+    :return: path of the cache folder
+    """
+    cache_dir = workdir / CACHE_DIR
+    if not cache_dir.exists():
+        cache_dir.mkdir(parents=True)
+        # keep the cache out of git, just like what .pytest_cache does
+        (cache_dir / ".gitignore").write_text("*\n")
+    return cache_dir
@@ -1,25 +1,35 @@
-import copy
+import collections
+import concurrent.futures
+import contextlib
+import difflib
 import functools
+import io
 import logging
 import pathlib
 import shutil
 import sys
-import tempfile
 import typing
 
 import click
 from beancount_black.formatter import Formatter
-from beancount_parser.parser import make_parser
-from beancount_parser.parser import traverse
+from beancount_parser.parser import extract_includes
 from lark import Lark
 from lark import Token
 from lark import Tree
 
-from .cli import cli
 from .environment import Environment
 from .environment import pass_env
-
-TreeOrToken = Token | Tree
+from .file_io import BEANHUB_DIR
+from .file_io import get_cache_dir
+from .file_io import write_atomic
+from .format_cache import FORMAT_CACHE_FILENAME
+from .format_cache import FormatCache
+from .format_cache import hash_content
+from .format_cache import make_config_hash
+from .includes import iter_included_files
+from .workers import get_parser
+from .workers import submit_largest_first
+from .workers import WorkerPool
 
 
 def create_backup(src: pathlib.Path, suffix: str) -> pathlib.Path:
@@ -41,79 +51,250 @@ def create_backup(src: pathlib.Path, suffix: str) -> pathlib.Path:
         return backup_path
 
 
-def file_tree_iterator(
-    parser: Lark, filenames: list[pathlib.Path]
-) -> typing.Generator[tuple[pathlib.Path, Tree], None, None]:
-    for filename in filenames:
-        with open(filename, "rt") as input_file:
-            input_content = input_file.read()
-            tree = parser.parse(input_content)
-            yield filename, tree
+class TokenRename(typing.NamedTuple):
+    # type of tokens to rename, such as ACCOUNT or CURRENCY
+    token_type: str
+    # map from the old value to the new value
+    replacements: dict[str, str]
+
+
+@functools.cache
+def find_rules_containing(parser: Lark, token_types: frozenset[str]) -> frozenset[str]:
+    """Find names of tree nodes which may have tokens of the given types in their
+    subtrees, based on the grammar
+
+    :param parser: the parser
+    :param token_types: types of tokens to find
+    :return: names of the tree nodes
+    """
+    symbols: dict[str, set[str]] = collections.defaultdict(set)
+    for rule in parser.rules:
+        expansion = {str(symbol.name) for symbol in rule.expansion}
+        symbols[str(rule.origin.name)].update(expansion)
+        if rule.alias is not None:
+            symbols[str(rule.alias)].update(expansion)
+    found = set(token_types)
+    changed = True
+    while changed:
+        changed = False
+        for name, expansion in symbols.items():
+            if name not in found and not expansion.isdisjoint(found):
+                found.add(name)
+                changed = True
+    return frozenset(found - token_types)
 
 
 def walk_tree(
-    tree_or_token: TreeOrToken,
-    processor: typing.Callable[[TreeOrToken], TreeOrToken | None],
+    tree: Tree,
+    processor: typing.Callable[[Token], Token | None],
+    rule_names: frozenset[str] | None = None,
 ):
-    result = processor(tree_or_token)
-    if result is not None:
-        # processor returned, let's use it instead
-        return result
-    if isinstance(tree_or_token, Tree):
-        return Tree(
-            data=tree_or_token.data,
-            children=list(
-                map(
-                    functools.partial(walk_tree, processor=processor),
-                    tree_or_token.children,
-                )
-            ),
-            meta=tree_or_token.meta,
-        )
-    return copy.deepcopy(tree_or_token)
+    """Walk the tree and replace tokens in place with the ones returned by the
+    processor, the tree is not copied
 
-
-def rename_account_transform(
-    replacements: dict[str, str], tree_or_token: TreeOrToken
-) -> TreeOrToken | None:
-    if not isinstance(tree_or_token, Token):
-        return
-    if tree_or_token.type != "ACCOUNT":
-        return
-    if tree_or_token.value not in replacements:
-        return
-    new_token = copy.deepcopy(tree_or_token)
-    new_token.value = replacements[tree_or_token.value]
-    return new_token
+    :param tree: the tree to walk
+    :param processor: function returns a new token to replace the given one, or None
+        to keep it
+    :param rule_names: only walk into subtrees with these names if provided
+    """
+    for index, child in enumerate(tree.children):
+        if isinstance(child, Tree):
+            if rule_names is None or child.data in rule_names:
+                walk_tree(child, processor, rule_names=rule_names)
+        elif isinstance(child, Token):
+            result = processor(child)
+            if result is not None:
+                tree.children[index] = result
 
 
-def rename_commodity_transform(
-    replacements: dict[str, str], tree_or_token: TreeOrToken
-) -> TreeOrToken | None:
-    if not isinstance(tree_or_token, Token):
-        return
-    if tree_or_token.type != "CURRENCY":
-        return
-    if tree_or_token.value not in replacements:
-        return
-    new_token = copy.deepcopy(tree_or_token)
-    new_token.value = replacements[tree_or_token.value]
-    return new_token
-
-
-def combine_transforms(
-    funcs: list[typing.Callable], tree_or_token: TreeOrToken
-) -> TreeOrToken | None:
-    transformed = False
-    for func in funcs:
-        result = func(tree_or_token)
-        if result is None:
+def rename_token(renames: list[TokenRename], token: Token) -> Token | None:
+    value = token.value
+    for rename in renames:
+        if token.type != rename.token_type:
             continue
-        transformed = True
-        tree_or_token = result
-    if not transformed:
+        value = rename.replacements.get(value, value)
+    if value == token.value:
         return
-    return tree_or_token
+    return token.update(value=value)
+
+
+def rename_tree(tree: Tree, renames: list[TokenRename]):
+    walk_tree(
+        tree,
+        functools.partial(rename_token, renames),
+        rule_names=find_rules_containing(
+            get_parser(), frozenset(rename.token_type for rename in renames)
+        ),
+    )
+
+
+def may_need_rename(content: str, renames: list[TokenRename]) -> bool:
+    """Check if the raw content contains any value to rename at all"""
+    return any(
+        old_value in content for rename in renames for old_value in rename.replacements
+    )
+
+
+class FormatTask(typing.NamedTuple):
+    filepath: pathlib.Path
+    renames: list[TokenRename]
+
+
+class FormatResult(typing.NamedTuple):
+    # formatted content, None if the file is already formatted
+    output_content: str | None
+    # (include path value, lineno) of include statements in the file
+    includes: list[tuple[str, int]]
+    # the file is known to be formatted from the cache, it was not parsed at all
+    cached: bool = False
+    # renames were applied to the tree of the file
+    renamed: bool = False
+
+
+def format_file(task: FormatTask) -> FormatResult:
+    """Parse, transform and format a bean file, called in worker processes when
+    formatting in parallel
+
+    :param task: the format task
+    :return: the format result
+    """
+    input_content = task.filepath.read_text()
+    tree = get_parser().parse(input_content)
+    includes = list(extract_includes(tree))
+    # files without any of the values to rename don't need walking through at all
+    renamed = may_need_rename(input_content, task.renames)
+    if renamed:
+        rename_tree(tree, task.renames)
+    output_file = io.StringIO()
+    # a new formatter for every file, as older beancount-black versions keep the
+    # column widths of the last file in the formatter
+    Formatter().format(tree, output_file)
+    output_content = output_file.getvalue()
+    return FormatResult(
+        output_content=output_content if input_content != output_content else None,
+        includes=includes,
+        renamed=renamed,
+    )
+
+
+def iter_format_results(
+    filepaths: list[pathlib.Path],
+    renames: list[TokenRename],
+    root_dir: pathlib.Path | None = None,
+    executor: concurrent.futures.Executor | None = None,
+    cache: FormatCache | None = None,
+    logger: logging.Logger | None = None,
+) -> typing.Generator[tuple[pathlib.Path, FormatResult], None, None]:
+    """Format the given bean files, yield the results in the order of the given
+    files. When formatting in parallel, the files are submitted to the executor
+    as soon as they are known, while the results are still yielded in order.
+
+    :param filepaths: bean files to format
+    :param renames: renames to apply to the parsed trees
+    :param root_dir: follow includes of the bean files under this root dir if
+        provided, the same way `traverse` does
+    :param executor: executor for formatting the files in parallel
+    :param cache: files found in the cache are not parsed nor formatted, and files
+        found already formatted are added to it
+    :param logger: logger
+    """
+    logger = logger or logging.getLogger(__name__)
+    pending_files = collections.deque(filepaths)
+    seen_files = set(filepaths)
+    futures: dict[pathlib.Path, concurrent.futures.Future[FormatResult]] = {}
+    cached_results: dict[pathlib.Path, FormatResult] = {}
+    content_hashes: dict[pathlib.Path, str] = {}
+    rename_values = [
+        old_value.encode("utf8")
+        for rename in renames
+        for old_value in rename.replacements
+    ]
+
+    def submit(new_files: list[pathlib.Path]):
+        if cache is not None:
+            uncached_files = []
+            for filepath in new_files:
+                content = filepath.read_bytes()
+                content_hash = hash_content(content)
+                includes = cache.get(filepath, content_hash)
+                # a formatted file is still formatted after renaming, as long as
+                # nothing in it would be renamed
+                if includes is not None and not any(
+                    value in content for value in rename_values
+                ):
+                    cached_results[filepath] = FormatResult(
+                        output_content=None, includes=includes, cached=True
+                    )
+                    continue
+                content_hashes[filepath] = content_hash
+                uncached_files.append(filepath)
+            new_files = uncached_files
+        if executor is None:
+            return
+        futures.update(
+            zip(
+                new_files,
+                submit_largest_first(
+                    executor,
+                    format_file,
+                    [
+                        FormatTask(filepath=filepath, renames=renames)
+                        for filepath in new_files
+                    ],
+                    size=lambda task: task.filepath.stat().st_size,
+                ),
+            )
+        )
+
+    submit(filepaths)
+    try:
+        while pending_files:
+            filepath = pending_files.popleft()
+            if filepath in cached_results:
+                result = cached_results.pop(filepath)
+            elif executor is None:
+                result = format_file(FormatTask(filepath=filepath, renames=renames))
+            else:
+                result = futures.pop(filepath).result()
+            content_hash = content_hashes.pop(filepath, None)
+            if cache is not None and content_hash is not None:
+                if result.output_content is None:
+                    cache.put(filepath, content_hash, result.includes)
+            yield filepath, result
+            if root_dir is None:
+                continue
+            new_files = []
+            for included_file in iter_included_files(
+                current_file=filepath,
+                includes=result.includes,
+                root_dir=root_dir,
+                logger=logger,
+            ):
+                if included_file in seen_files:
+                    continue
+                seen_files.add(included_file)
+                new_files.append(included_file)
+            pending_files.extend(new_files)
+            submit(new_files)
+    finally:
+        # stopped early, no need to format the rest of the files
+        for future in futures.values():
+            future.cancel()
+
+
+def make_diff(
+    filepath: pathlib.Path, input_content: str, output_content: str
+) -> typing.Generator[str, None, None]:
+    """Make unified diff lines between the input and output content of a file"""
+    for line in difflib.unified_diff(
+        input_content.splitlines(keepends=True),
+        output_content.splitlines(keepends=True),
+        fromfile=str(filepath),
+        tofile=str(filepath),
+    ):
+        yield line
+        if not line.endswith("\n"):
+            yield "\n\\ No newline at end of file\n"
 
 
 def format_beancount(
@@ -123,75 +304,120 @@ def format_beancount(
     rename_currency: list[tuple[str, str]] | None = None,
     stdin_mode: bool = False,
     backup: bool = False,
+    executor: concurrent.futures.Executor | None = None,
+    cache: FormatCache | None = None,
+    check: bool = False,
+    diff: bool = False,
+    fail_fast: bool = False,
     logger: logging.Logger | None = None,
-):
+) -> list[pathlib.Path]:
+    """Format bean files with beancount-black
+
+    :param filenames: bean files to format, traverse from main.bean in the current
+        folder and follow its includes if not provided
+    :param backup_suffix: suffix of backup files
+    :param rename_account: account names to rename from and to
+    :param rename_currency: currency names to rename from and to
+    :param stdin_mode: read bean file content from stdin and write the result to
+        stdout
+    :param backup: create backup files before writing changed files
+    :param executor: executor for formatting the files in parallel
+    :param cache: cache of files known to be formatted
+    :param check: only check the files, without writing any of them
+    :param diff: write unified diffs of files would be changed to stdout in check
+        mode
+    :param fail_fast: stop at the first file would be changed in check mode
+    :param logger: logger
+    :return: files changed, or would be changed in check mode
+    """
     logger = logger or logging.getLogger(__name__)
-    tree_transformers: list[typing.Callable] = []
+    changed_files: list[pathlib.Path] = []
+    renames: list[TokenRename] = []
     if rename_account:
         for from_val, to_val in rename_account:
             logger.info("Renaming account from %s to %s", from_val, to_val)
-        tree_transformers.append(
-            functools.partial(rename_account_transform, dict(rename_account))
+        renames.append(
+            TokenRename(token_type="ACCOUNT", replacements=dict(rename_account))
         )
     if rename_currency:
         for from_val, to_val in rename_currency:
             logger.info("Renaming currency from %s to %s", from_val, to_val)
-        tree_transformers.append(
-            functools.partial(rename_commodity_transform, dict(rename_currency))
+        renames.append(
+            TokenRename(token_type="CURRENCY", replacements=dict(rename_currency))
         )
 
     # TODO: support follow include statements
-    parser = make_parser()
     if stdin_mode:
         logger.info("Processing in stdin mode")
         input_content = sys.stdin.read()
-        tree = parser.parse(input_content)
-        formatter = Formatter()
-        formatter.format(tree, sys.stdout)
+        tree = get_parser().parse(input_content)
+        Formatter().format(tree, sys.stdout)
     else:
         if filenames:
-            iterator = file_tree_iterator(
-                parser=parser,
-                filenames=filenames,
+            results = iter_format_results(
+                filepaths=filenames,
+                renames=renames,
+                executor=executor,
+                cache=cache,
+                logger=logger,
             )
         else:
             logger.info("No files provided, traverse starting from main.bean")
-            iterator = traverse(
-                parser=parser,
-                bean_file=pathlib.Path("main.bean"),
+            results = iter_format_results(
+                filepaths=[pathlib.Path("main.bean").absolute()],
+                renames=renames,
                 root_dir=pathlib.Path.cwd(),
+                executor=executor,
+                cache=cache,
+                logger=logger,
             )
-        for filepath, tree in iterator:
-            logger.info("Processing file %s", filepath)
-            if tree_transformers:
-                logger.info(
-                    "Running %s transforms against file %s ...",
-                    len(tree_transformers),
-                    filepath,
-                )
-                tree = walk_tree(
-                    tree,
-                    functools.partial(combine_transforms, tree_transformers),
-                )
-            with tempfile.NamedTemporaryFile(mode="wt+", suffix=".bean") as output_file:
-                formatter = Formatter()
-                formatter.format(tree, output_file)
-                output_file.seek(0)
-                output_content = output_file.read()
-                input_content = filepath.read_text()
-                if input_content == output_content:
+        # results come in order, so that logs and backups are in the same order as
+        # formatting sequentially
+        with contextlib.closing(results):
+            for filepath, result in results:
+                if result.cached:
+                    logger.info(
+                        "File %s is formatted according to the cache, skip", filepath
+                    )
+                    continue
+                logger.info("Processing file %s", filepath)
+                if result.renamed:
+                    logger.info("Applied renames to file %s", filepath)
+                if result.output_content is None:
                     logger.info("File %s is not changed, skip", filepath)
                     continue
+                changed_files.append(filepath)
+                if check:
+                    logger.warning("File %s would be reformatted", filepath)
+                    if diff:
+                        sys.stdout.writelines(
+                            make_diff(
+                                filepath=filepath,
+                                input_content=filepath.read_text(),
+                                output_content=result.output_content,
+                            )
+                        )
+                    if fail_fast:
+                        break
+                    continue
                 if backup:
                     backup_path = create_backup(src=filepath, suffix=backup_suffix)
                     logger.info("File %s changed, backup to %s", filepath, backup_path)
-                output_file.seek(0)
-                with open(filepath, "wt") as input_file:
-                    shutil.copyfileobj(output_file, input_file)
+                write_atomic(filepath, result.output_content)
+        if check:
+            if changed_files:
+                logger.warning(
+                    "%s files would be reformatted%s",
+                    len(changed_files),
+                    ", stopped at the first one" if fail_fast else "",
+                )
+            else:
+                logger.info("All files are formatted")
     logger.info("done")
+    return changed_files
 
 
-@cli.command(name="format", help="Format Beancount files with beancount-black")
+@click.command(name="format", help="Format Beancount files with beancount-black")
 @click.argument("filename", type=click.Path(exists=False, dir_okay=False), nargs=-1)
 @click.option(
     "--backup-suffix", type=str, default=".backup", help="suffix of backup file"
@@ -219,6 +445,34 @@ def format_beancount(
     help="Read beancount file data from stdin and output result to stdout",
 )
 @click.option("-b", "--backup", is_flag=True, help="Create backup file")
+@click.option(
+    "--check",
+    is_flag=True,
+    help="Only check if the files are formatted without writing them, exit with a non-zero code if any file would be reformatted",
+)
+@click.option(
+    "--diff",
+    is_flag=True,
+    help="Print unified diffs of the files would be reformatted in check mode",
+)
+@click.option(
+    "--fail-fast",
+    is_flag=True,
+    help="Stop at the first file would be reformatted in check mode",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    help="Parse and format all the files without looking them up in the format cache",
+)
+@click.option(
+    "-j",
+    "--workers",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of workers for formatting files in parallel",
+)
 @pass_env
 def main(
     env: Environment,
@@ -228,13 +482,46 @@ def main(
     rename_currency: list[tuple[str, str]],
     stdin_mode: bool,
     backup: bool,
+    workers: int,
+    check: bool,
+    diff: bool,
+    fail_fast: bool,
+    no_cache: bool,
 ):
-    format_beancount(
+    ctx = click.get_current_context()
+    if not check:
+        if diff:
+            raise click.UsageError("--diff requires --check")
+        if fail_fast:
+            raise click.UsageError("--fail-fast requires --check")
+    elif stdin_mode:
+        raise click.UsageError("--check cannot be used with --stdin-mode")
+    pool = ctx.with_resource(WorkerPool(max_workers=workers))
+    cache = None
+    project_dir = pathlib.Path.cwd()
+    # only in the root folder of a BeanHub project, so that formatting files
+    # elsewhere doesn't leave cache folders behind
+    if not no_cache and not stdin_mode and (project_dir / BEANHUB_DIR).is_dir():
+        cache = ctx.with_resource(
+            FormatCache(
+                cache_path=get_cache_dir(project_dir) / FORMAT_CACHE_FILENAME,
+                config_hash=make_config_hash(),
+                logger=env.logger,
+            )
+        )
+    changed_files = format_beancount(
         filenames=list(map(lambda item: pathlib.Path(str(item)), filename)),
         backup_suffix=backup_suffix,
         rename_account=rename_account,
         rename_currency=rename_currency,
         stdin_mode=stdin_mode,
         backup=backup,
+        executor=pool.executor if workers > 1 and not stdin_mode else None,
+        cache=cache,
+        check=check,
+        diff=diff,
+        fail_fast=fail_fast,
         logger=env.logger,
     )
+    if check and changed_files:
+        ctx.exit(-1)
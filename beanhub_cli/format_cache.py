@@ -0,0 +1,136 @@
+import hashlib
+import importlib.metadata
+import json
+import logging
+import pathlib
+
+from .file_io import write_atomic
+
+FORMAT_CACHE_FILENAME = "format.json"
+# Bump this whenever the layout of the cache file changes
+FORMAT_CACHE_VERSION = 1
+
+
+def hash_content(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def make_config_hash() -> str:
+    """Hash of everything besides the file content affecting the formatted output.
+    Renames are not part of it, as a formatted file is still formatted after
+    renaming as long as it has nothing to rename.
+
+    :return: the hash
+    """
+    payload = dict(
+        beancount_black=importlib.metadata.version("beancount-black"),
+        beancount_parser=importlib.metadata.version("beancount-parser"),
+    )
+    return hash_content(json.dumps(payload, sort_keys=True).encode("utf8"))
+
+
+class FormatCache:
+    """Persistent cache of bean files known to be already formatted.
+
+    An entry is keyed by the path of a bean file, and only valid as long as the hash
+    of the file content stays the same. The include statements of the file are
+    kept as well, so that following includes doesn't need to parse the file. The
+    whole cache is discarded when the config hash changes, and entries not used
+    nor added in a run are dropped when saving.
+    """
+
+    def __init__(
+        self,
+        cache_path: pathlib.Path,
+        config_hash: str,
+        logger: logging.Logger | None = None,
+    ):
+        self.cache_path = cache_path
+        self.config_hash = config_hash
+        self.logger = logger or logging.getLogger(__name__)
+        # path -> (content hash, includes)
+        self.entries: dict[str, tuple[str, list[tuple[str, int]]]] = {}
+        self.used_keys: set[str] = set()
+        self.hit_count = 0
+        self._dirty = False
+        if cache_path.exists():
+            self._load(cache_path)
+
+    def _load(self, cache_path: pathlib.Path):
+        try:
+            payload = json.loads(cache_path.read_text())
+            if payload.get("version") != FORMAT_CACHE_VERSION:
+                return
+            if payload.get("config_hash") != self.config_hash:
+                return
+            self.entries = {
+                key: (
+                    content_hash,
+                    [(value, lineno) for value, lineno in includes],
+                )
+                for key, (content_hash, includes) in payload["files"].items()
+            }
+        except (ValueError, KeyError, TypeError):
+            self.logger.warning("Invalid format cache %s, ignored", cache_path)
+            self.entries = {}
+
+    def get(
+        self, filepath: pathlib.Path, content_hash: str
+    ) -> list[tuple[str, int]] | None:
+        """Get the include statements of a bean file if it's known to be formatted
+
+        :param filepath: path of the bean file
+        :param content_hash: hash of the current content of the bean file
+        :return: include statements of the file, or None if it's not in the cache
+        """
+        key = filepath.absolute().as_posix()
+        entry = self.entries.get(key)
+        if entry is None or entry[0] != content_hash:
+            return None
+        self.used_keys.add(key)
+        self.hit_count += 1
+        return entry[1]
+
+    def put(
+        self,
+        filepath: pathlib.Path,
+        content_hash: str,
+        includes: list[tuple[str, int]],
+    ):
+        key = filepath.absolute().as_posix()
+        self.entries[key] = (content_hash, includes)
+        self.used_keys.add(key)
+        self._dirty = True
+
+    def save(self):
+        """Save the cache to disk, only with the entries used or added"""
+        if not self.used_keys.issuperset(self.entries):
+            self.entries = {
+                key: entry
+                for key, entry in self.entries.items()
+                if key in self.used_keys
+            }
+            self._dirty = True
+        if not self._dirty:
+            return
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        write_atomic(
+            self.cache_path,
+            json.dumps(
+                dict(
+                    version=FORMAT_CACHE_VERSION,
+                    config_hash=self.config_hash,
+                    files={
+                        key: [content_hash, [list(include) for include in includes]]
+                        for key, (content_hash, includes) in self.entries.items()
+                    },
+                )
+            ),
+        )
+        self._dirty = False
+
+    def __enter__(self) -> "FormatCache":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.save()
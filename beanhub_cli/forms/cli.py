@@ -1,8 +1,9 @@
+import click
+
 from ..aliase import AliasedGroup
-from ..cli import cli as root_cli
 
 
-@root_cli.group(
+@click.group(
     name="form",
     help="Validating BeanHub Forms and running a simple web app.",
     cls=AliasedGroup,
@@ -1,126 +1,173 @@
-import concurrent.futures
-import multiprocessing
+import difflib
+import io
 import os
 import pathlib
 import sys
 import time
+import tracemalloc
+import typing
 
 import click
-import rich
 import yaml
 from beancount_black.formatter import Formatter
-from beancount_parser.parser import make_parser
 from beanhub_extract.utils import strip_base_path
 from beanhub_import.data_types import ChangeSet
-from beanhub_import.data_types import DeletedTransaction
-from beanhub_import.data_types import GeneratedTransaction
 from beanhub_import.data_types import ImportDoc
-from beanhub_import.data_types import UnprocessedTransaction
 from beanhub_import.post_processor import apply_change_set
 from beanhub_import.post_processor import compute_changes
-from beanhub_import.post_processor import extract_existing_transactions
 from beanhub_import.post_processor import txn_to_text
 from beanhub_import.processor import collect_import_files
-from beanhub_import.processor import process_import_file
-from rich import box
-from rich.markup import escape
-from rich.padding import Padding
 from rich.progress import BarColumn
 from rich.progress import Progress
 from rich.progress import SpinnerColumn
 from rich.progress import TextColumn
-from rich.table import Table
 
-from .cli import cli
+from .bean_index import ExistingTransactionIndex
+from .bean_index import extract_existing_transactions
+from .bean_index import INDEX_FILENAME
+from .cache import ImportResultCache
+from .detailed_report import DEFAULT_MAX_ROWS
+from .detailed_report import make_report_sections
+from .detailed_report import print_report_sections
+from .detailed_report import write_report_csv
 from .environment import Environment
 from .environment import pass_env
+from .file_io import get_cache_dir
+from .file_io import write_if_changed
+from .format_cache import hash_content
+from .import_records import DeletedRecord
+from .import_records import encode_result
+from .import_records import GeneratedRecord
+from .import_records import ImportRecord
+from .import_records import ImportTask
+from .import_records import make_record
+from .import_records import materialize_change_set
+from .import_records import process_import_task
+from .import_records import UnprocessedRecord
+from .import_report import ImportFileReport
+from .import_report import ImportReport
+from .import_report import PhaseTimer
+from .import_rules import ImportRuleMatcher
+from .splice import try_splice_change_set
+from .watch import take_snapshot
+from .watch import wait_for_changes
+from .workers import get_parser
+from .workers import submit_largest_first
+from .workers import WorkerPool
 
 IMPORT_DOC_FILE = pathlib.Path(".beanhub") / "imports.yaml"
-TABLE_HEADER_STYLE = "yellow"
-TABLE_COLUMN_STYLE = "cyan"
 DEFAULT_WORKERS = os.cpu_count() or 1
+DEFAULT_WATCH_INTERVAL = 2.0
 
 
-def _process_context() -> multiprocessing.context.BaseContext:
-    if hasattr(os, "fork"):
-        return multiprocessing.get_context("forkserver")
-    return multiprocessing.get_context("spawn")
-
-
-def _apply_change_set_to_file(
+def _render_change_set(
     target_file: pathlib.Path,
     change_set: ChangeSet,
     remove_dangling: bool,
-) -> None:
-    parser = make_parser()
+    formatted_hash: str | None = None,
+) -> str:
+    """Render the new content of a bean file with the change set applied
+
+    :param target_file: the bean file to apply the change set to
+    :param change_set: change set to apply
+    :param remove_dangling: remove dangling transactions or not
+    :param formatted_hash: hash of the formatter output last written to the file,
+        new transactions are only spliced into the file without parsing and
+        formatting it when the content of the file still has this hash
+    :return: the new content
+    """
+    parser = get_parser()
+    change_set = materialize_change_set(change_set)
     if not target_file.exists():
         if change_set.remove or change_set.update:
             raise ValueError("Expect new transactions to add only")
         bean_content = "\n\n".join(map(txn_to_text, change_set.add))
         new_tree = parser.parse(bean_content)
     else:
-        tree = parser.parse(target_file.read_text())
+        content = target_file.read_text()
+        if (
+            formatted_hash is not None
+            and hash_content(content.encode("utf8")) == formatted_hash
+        ):
+            new_content = try_splice_change_set(
+                content, change_set=change_set, remove_dangling=remove_dangling
+            )
+            if new_content is not None:
+                return new_content
+        tree = parser.parse(content)
         new_tree = apply_change_set(
             tree=tree, change_set=change_set, remove_dangling=remove_dangling
         )
 
-    with target_file.open("wt") as fo:
-        formatter = Formatter()
-        formatter.format(new_tree, fo)
+    output = io.StringIO()
+    # a new formatter for every file, as older beancount-black versions keep the
+    # column widths of the last file in the formatter
+    Formatter().format(new_tree, output)
+    return output.getvalue()
 
 
-@cli.command(
-    name="import",
-    help="Import data into Beancount files based on the beanhub-import config file",
-)
-@click.option(
-    "-c",
-    "--config",
-    type=click.Path(exists=True, dir_okay=False),
-    default=".beanhub/imports.yaml",
-    help="The path to import config file",
-)
-@click.option(
-    "-w",
-    "--workdir",
-    type=click.Path(exists=True, dir_okay=True, file_okay=False),
-    default=str(pathlib.Path.cwd()),
-    help="The BeanHub project path to work on",
-)
-@click.option(
-    "-b",
-    "--beanfile",
-    type=click.Path(dir_okay=False, file_okay=True),
-    default="main.bean",
-    help="The path to main entry beancount file, relative to workdir",
-)
-@click.option(
-    "--remove-dangling",
-    is_flag=True,
-    help="Remove dangling transactions (existing imported transactions in Beancount files without corresponding generated transactions)",
-)
-@click.option(
-    "-j",
-    "--workers",
-    type=click.IntRange(min=1),
-    default=DEFAULT_WORKERS,
-    show_default=True,
-    help="Number of workers for import processing and change-set application",
-)
-@click.option(
-    "-v",
-    "--verbose",
-    is_flag=True,
-    help="Log each generated, deleted, and skipped transaction",
-)
-@click.option(
-    "--detailed-report",
-    is_flag=True,
-    help="Show detailed transaction tables in the import report",
-)
-@pass_env
-def main(
+def _apply_change_set_to_file(
+    target_file: pathlib.Path,
+    change_set: ChangeSet,
+    remove_dangling: bool,
+    formatted_hash: str | None = None,
+) -> tuple[bool, str]:
+    """Apply the change set to a bean file
+
+    :return: (the file was written or not, hash of the new content)
+    """
+    new_content = _render_change_set(
+        target_file,
+        change_set=change_set,
+        remove_dangling=remove_dangling,
+        formatted_hash=formatted_hash,
+    )
+    written = write_if_changed(target_file, new_content)
+    return written, hash_content(new_content.encode("utf8"))
+
+
+def _diff_change_set_to_file(
+    target_file: pathlib.Path,
+    change_set: ChangeSet,
+    remove_dangling: bool,
+    formatted_hash: str | None = None,
+) -> str:
+    content = target_file.read_text() if target_file.exists() else ""
+    new_content = _render_change_set(
+        target_file,
+        change_set=change_set,
+        remove_dangling=remove_dangling,
+        formatted_hash=formatted_hash,
+    )
+    return "".join(
+        difflib.unified_diff(
+            content.splitlines(keepends=True),
+            new_content.splitlines(keepends=True),
+            fromfile=str(target_file),
+            tofile=str(target_file),
+        )
+    )
+
+
+def _format_size(size: int | None) -> str:
+    if size is None:
+        return "n/a"
+    return f"{size / (1024 * 1024):.1f} MiB"
+
+
+def _change_set_size(change_set: ChangeSet) -> int:
+    return (
+        len(change_set.add)
+        + len(change_set.update)
+        + len(change_set.remove)
+        + len(change_set.dangling or ())
+    )
+
+
+def _run_import(
     env: Environment,
+    pool: WorkerPool,
+    existing_txn_index: ExistingTransactionIndex,
     config: str,
     workdir: str,
     beanfile: str,
@@ -128,8 +175,24 @@ def main(
     workers: int,
     verbose: bool,
     detailed_report: bool,
-):
+    detailed_report_rows: int,
+    detailed_report_csv: str | None,
+    dry_run: bool,
+    diff: bool,
+    report_json: str | None,
+    no_cache: bool,
+    profile_memory: bool,
+) -> tuple[ImportDoc, list[pathlib.Path]]:
+    """Run the import once
+
+    :return: the import doc loaded and the bean files changes were computed for
+    """
     start_time = time.perf_counter()
+    if diff:
+        dry_run = True
+    report = ImportReport(dry_run=dry_run)
+    phase_timer = PhaseTimer(profile_memory=profile_memory)
+    phase_timer.start("load_config")
     config_path = pathlib.Path(config)
     with config_path.open("rt") as fo:
         doc_payload = yaml.safe_load(fo)
@@ -141,14 +204,12 @@ def main(
         extra={"markup": True, "highlighter": None},
     )
 
-    generated_txns: list[GeneratedTransaction] = []
-    deleted_txns: list[DeletedTransaction] = []
-    unprocessed_txns: list[UnprocessedTransaction] = []
+    generated_txns: list[GeneratedRecord] = []
+    deleted_txns: list[DeletedRecord] = []
+    unprocessed_txns: list[UnprocessedRecord] = []
 
-    def handle_import_txn(
-        txn: GeneratedTransaction | DeletedTransaction | UnprocessedTransaction,
-    ) -> None:
-        if isinstance(txn, GeneratedTransaction):
+    def handle_import_txn(txn: ImportRecord) -> None:
+        if isinstance(txn, GeneratedRecord):
             if verbose:
                 generated_file_path = (workdir_path / txn.file).resolve()
                 env.logger.info(
@@ -158,7 +219,7 @@ def main(
                     extra={"markup": True, "highlighter": None},
                 )
             generated_txns.append(txn)
-        elif isinstance(txn, DeletedTransaction):
+        elif isinstance(txn, DeletedRecord):
             if verbose:
                 env.logger.info(
                     "Deleted transaction [green]%s[/]",
@@ -166,19 +227,33 @@ def main(
                     extra={"markup": True, "highlighter": None},
                 )
             deleted_txns.append(txn)
-        elif isinstance(txn, UnprocessedTransaction):
+        elif isinstance(txn, UnprocessedRecord):
             if verbose:
                 env.logger.info(
                     "Skipped input transaction %s at [green]%s[/]:[blue]%s[/]",
                     txn.import_id,
-                    txn.txn.file,
-                    txn.txn.lineno,
+                    txn.file,
+                    txn.lineno,
                     extra={"markup": True, "highlighter": None},
                 )
             unprocessed_txns.append(txn)
         else:
             raise ValueError(f"Unexpected type {type(txn)}")
 
+    def handle_import_results(
+        import_file_report: ImportFileReport, results: typing.Iterable[ImportRecord]
+    ) -> None:
+        generated_count = len(generated_txns)
+        deleted_count = len(deleted_txns)
+        unprocessed_count = len(unprocessed_txns)
+        for txn in results:
+            handle_import_txn(txn)
+        import_file_report.generated = len(generated_txns) - generated_count
+        import_file_report.deleted = len(deleted_txns) - deleted_count
+        import_file_report.unprocessed = len(unprocessed_txns) - unprocessed_count
+        report.import_files.append(import_file_report)
+
+    phase_timer.start("collect_import_files")
     import_files = collect_import_files(import_doc=import_doc, input_dir=workdir_path)
     env.logger.info("Collected %s import files", len(import_files))
     if verbose:
@@ -189,25 +264,93 @@ def main(
                 extra={"markup": True, "highlighter": None},
             )
 
+    phase_timer.start("process_import_files")
+    result_cache: ImportResultCache | None = None
+    cache_keys: list[str | None] = [None] * len(import_files)
+    cached_results: list[list | None] = [None] * len(import_files)
+    if not no_cache:
+        result_cache = ImportResultCache(
+            cache_dir=get_cache_dir(workdir_path),
+            config_file=config_path,
+            logger=env.logger,
+        )
+        cache_keys = list(map(result_cache.make_key, import_files))
+        cached_results = [
+            result_cache.load(key) if key is not None else None for key in cache_keys
+        ]
+        env.logger.info(
+            "Reused cached results for %s of %s import files",
+            sum(1 for results in cached_results if results is not None),
+            len(import_files),
+        )
+
+    # compile the import rules once and share them with all the tasks
+    matcher = ImportRuleMatcher(import_doc.imports)
+
     def iter_import_results():
-        with concurrent.futures.ProcessPoolExecutor(
-            max_workers=workers,
-            mp_context=_process_context(),
-        ) as executor:
-            yield from zip(
-                import_files,
-                executor.map(process_import_file, import_files, chunksize=1),
+        pending_tasks = [
+            ImportTask(
+                import_file=import_file,
+                cache_entry_path=result_cache.entry_path(cache_key)
+                if cache_key is not None
+                else None,
+                matcher=matcher,
+            )
+            for import_file, cache_key, results in zip(
+                import_files, cache_keys, cached_results
+            )
+            if results is None
+        ]
+        processed_results = iter(())
+        # when all hit the cache, no need to spin up the process pool at all
+        if pending_tasks:
+            processed_results = (
+                future.result()
+                for future in submit_largest_first(
+                    pool.executor,
+                    process_import_task,
+                    pending_tasks,
+                    size=lambda task: task.import_file.filepath.stat().st_size,
+                )
             )
+        for import_file, cache_key, results in zip(
+            import_files, cache_keys, cached_results
+        ):
+            file_path = strip_base_path(
+                workdir_path.resolve(), import_file.filepath.resolve()
+            )
+            if results is None:
+                # the cache entry was already written by the worker
+                if cache_key is not None:
+                    result_cache.mark_used(cache_key)
+                task_result = next(processed_results)
+                phase_timer.record_worker_max_rss(task_result.max_rss)
+                yield (
+                    import_file,
+                    ImportFileReport(
+                        file=file_path,
+                        cached=False,
+                        wall_time=task_result.wall_time,
+                        cpu_time=task_result.cpu_time,
+                        max_rss=task_result.max_rss,
+                    ),
+                    map(make_record, task_result.results),
+                )
+            else:
+                yield (
+                    import_file,
+                    ImportFileReport(file=file_path, cached=True),
+                    map(make_record, map(encode_result, results)),
+                )
 
     if verbose:
-        for import_file, results in iter_import_results():
+        for import_file, import_file_report, results in iter_import_results():
             env.logger.info(
                 "Processing import file [green]%s[/]",
                 strip_base_path(workdir_path.resolve(), import_file.filepath.resolve()),
                 extra={"markup": True, "highlighter": None},
             )
-            for txn in results:
-                handle_import_txn(txn)
+            handle_import_results(import_file_report, results)
     else:
         with Progress(
             SpinnerColumn(),
@@ -217,9 +360,8 @@ def main(
             transient=True,
         ) as progress:
             task = progress.add_task("Processing imports", total=len(import_files))
-            for _import_file, results in iter_import_results():
-                for txn in results:
-                    handle_import_txn(txn)
+            for _import_file, import_file_report, results in iter_import_results():
+                handle_import_results(import_file_report, results)
                 progress.advance(task)
                 progress.update(
                     task,
@@ -230,6 +372,10 @@ def main(
                         f"{len(unprocessed_txns)} skipped)"
                     ),
                 )
+    if result_cache is not None:
+        pruned_count = result_cache.prune()
+        if pruned_count:
+            env.logger.info("Pruned %s stale import cache entries", pruned_count)
     beanfile_path = (workdir_path / pathlib.Path(beanfile)).resolve()
     if not beanfile_path.is_relative_to(workdir_path.resolve()):
         env.logger.error(
@@ -245,17 +391,25 @@ def main(
         )
         sys.exit(-1)
 
+    phase_timer.start("extract_existing_transactions")
     env.logger.info(
         "Collecting existing imported transactions from Beancount books ..."
     )
-    parser = make_parser()
+    parser = get_parser()
+    existing_txn_index.scanned_count = 0
     existing_txns = list(
         extract_existing_transactions(
             parser=parser,
+            index=existing_txn_index,
             bean_file=beanfile_path,
             root_dir=workdir_path,
+            executor=pool.executor if workers > 1 else None,
         )
     )
+    env.logger.info(
+        "Scanned %s changed Beancount files for existing imported transactions",
+        existing_txn_index.scanned_count,
+    )
     imported_txns_with_override = frozenset(
         txn.id for txn in existing_txns if txn.override is not None
     )
@@ -265,46 +419,75 @@ def main(
         len(imported_txns_with_override),
     )
 
+    phase_timer.start("compute_changes")
     change_sets = compute_changes(
         generated_txns=generated_txns,
         imported_txns=existing_txns,
         deleted_txns=deleted_txns,
         work_dir=workdir_path,
     )
-    with concurrent.futures.ProcessPoolExecutor(
-        max_workers=workers,
-        mp_context=_process_context(),
-    ) as executor:
-        futures = []
-        for target_file, change_set in change_sets.items():
-            if not target_file.exists():
-                if change_set.remove or change_set.update:
-                    raise ValueError("Expect new transactions to add only")
-                env.logger.info(
-                    "Create new bean file %s with %s transactions",
-                    target_file,
-                    len(change_set.add),
-                )
-            else:
-                env.logger.info(
-                    "Applying change sets (add=%s, update=%s, remove=%s, dangling=%s) with remove_dangling=%s to %s",
-                    len(change_set.add),
-                    len(change_set.update),
-                    len(change_set.remove),
-                    len(change_set.dangling),
-                    remove_dangling,
-                    target_file,
-                )
-            futures.append(
-                executor.submit(
-                    _apply_change_set_to_file,
-                    target_file,
-                    change_set,
-                    remove_dangling,
-                )
+    phase_timer.start("apply_change_sets")
+    futures = {}
+    bean_file_reports = {}
+    action = "Would apply" if dry_run else "Applying"
+    # submit the largest change sets first to keep the tail of the pool busy
+    for target_file, change_set in sorted(
+        change_sets.items(),
+        key=lambda item: (-_change_set_size(item[1]), item[0]),
+    ):
+        if not target_file.exists():
+            if change_set.remove or change_set.update:
+                raise ValueError("Expect new transactions to add only")
+            env.logger.info(
+                "%s new bean file %s with %s transactions",
+                "Would create" if dry_run else "Create",
+                target_file,
+                len(change_set.add),
             )
-        for future in concurrent.futures.as_completed(futures):
-            future.result()
+        else:
+            env.logger.info(
+                "%s change sets (add=%s, update=%s, remove=%s, dangling=%s) with remove_dangling=%s to %s",
+                action,
+                len(change_set.add),
+                len(change_set.update),
+                len(change_set.remove),
+                len(change_set.dangling),
+                remove_dangling,
+                target_file,
+            )
+        bean_file_reports[target_file] = report.add_bean_file(target_file, change_set)
+        if dry_run and not diff:
+            continue
+        futures[target_file] = pool.executor.submit(
+            _diff_change_set_to_file if dry_run else _apply_change_set_to_file,
+            target_file,
+            change_set,
+            remove_dangling,
+            existing_txn_index.get_formatted_hash(target_file),
+        )
+    if diff:
+        for target_file in sorted(futures):
+            file_diff = futures[target_file].result()
+            if file_diff:
+                click.echo(file_diff, nl=False)
+    elif not dry_run:
+        for target_file, future in futures.items():
+            written, content_hash = future.result()
+            bean_file_reports[target_file].written = written
+            existing_txn_index.put_formatted_hash(target_file, content_hash)
+        existing_txn_index.save()
+        written_count = sum(
+            1
+            for bean_file_report in bean_file_reports.values()
+            if bean_file_report.written
+        )
+        env.logger.info(
+            "Wrote %s of %s bean files, the others are unchanged",
+            written_count,
+            len(futures),
+        )
+    if dry_run:
+        env.logger.info("Dry run, no Beancount files were changed")
 
     dangling_count = sum(
         len(change_set.dangling or []) for change_set in change_sets.values()
@@ -319,98 +502,245 @@ def main(
     env.logger.info("Skipped %s transactions", len(unprocessed_txns))
     env.logger.info("Dangling %s transactions", dangling_count)
     env.logger.info("Open %s transactions", open_txn_count)
-
-    if not detailed_report:
-        env.logger.info("done in %.2fs", time.perf_counter() - start_time)
-        return
-
-    table = Table(
-        title="Deleted transactions",
-        box=box.SIMPLE,
-        header_style=TABLE_HEADER_STYLE,
-        expand=True,
+    report.counts = dict(
+        generated=len(generated_txns),
+        deleted=len(deleted_txns),
+        skipped=len(unprocessed_txns),
+        dangling=dangling_count,
+        open=open_txn_count,
+        existing=len(existing_txns),
     )
-    table.add_column("File", style=TABLE_COLUMN_STYLE)
-    table.add_column("Id", style=TABLE_COLUMN_STYLE)
-    deleted_txn_ids = frozenset(txn.id for txn in deleted_txns)
-    for target_file, change_set in change_sets.items():
-        for txn in change_set.remove:
-            if txn.id not in deleted_txn_ids:
-                continue
-            table.add_row(
-                escape(str(target_file)) + f":{txn.lineno}",
-                str(txn.id),
+
+    if detailed_report or detailed_report_csv is not None:
+        phase_timer.start("detailed_report")
+        report_sections = make_report_sections(
+            change_sets=change_sets,
+            generated_txns=generated_txns,
+            deleted_txns=deleted_txns,
+            unprocessed_txns=unprocessed_txns,
+            imported_txns_with_override=imported_txns_with_override,
+            remove_dangling=remove_dangling,
+        )
+        if detailed_report:
+            print_report_sections(
+                report_sections, max_rows=detailed_report_rows or None
             )
-    rich.print(Padding(table, (1, 0, 0, 4)))
-
-    dangling_action = "Delete" if remove_dangling else "Ignored"
-    table = Table(
-        title=f"Dangling Transactions ({dangling_action})",
-        box=box.SIMPLE,
-        header_style=TABLE_HEADER_STYLE,
-        expand=True,
-    )
-    table.add_column("File", style=TABLE_COLUMN_STYLE)
-    table.add_column("Id", style=TABLE_COLUMN_STYLE)
-    for target_file, change_set in change_sets.items():
-        for txn in change_set.dangling:
-            table.add_row(
-                escape(str(target_file)) + f":{txn.lineno}",
-                str(txn.id),
+        if detailed_report_csv is not None:
+            with open(detailed_report_csv, "wt", newline="") as fo:
+                write_report_csv(report_sections, fo)
+            env.logger.info("Wrote detailed report to %s", detailed_report_csv)
+    phase_timer.stop()
+
+    report.phases = phase_timer.phases
+    report.wall_time = time.perf_counter() - start_time
+    if profile_memory:
+        for phase in report.phases:
+            env.logger.info(
+                "Phase %s peak memory: traced %s, parent RSS %s, workers RSS %s",
+                phase.name,
+                _format_size(phase.memory.traced_peak),
+                _format_size(phase.memory.max_rss),
+                _format_size(phase.memory.workers_max_rss),
             )
-    rich.print(Padding(table, (1, 0, 0, 4)))
+    if report_json is not None:
+        report.write(pathlib.Path(report_json))
+        env.logger.info("Wrote import report to %s", report_json)
+    env.logger.info("done in %.2fs", report.wall_time)
+    return import_doc, list(change_sets.keys())
 
-    table = Table(
-        title="Generated transactions",
-        box=box.SIMPLE,
-        header_style=TABLE_HEADER_STYLE,
-        expand=True,
+
+@click.command(
+    name="import",
+    help="Import data into Beancount files based on the beanhub-import config file",
+)
+@click.option(
+    "-c",
+    "--config",
+    type=click.Path(exists=True, dir_okay=False),
+    default=".beanhub/imports.yaml",
+    help="The path to import config file",
+)
+@click.option(
+    "-w",
+    "--workdir",
+    type=click.Path(exists=True, dir_okay=True, file_okay=False),
+    default=str(pathlib.Path.cwd()),
+    help="The BeanHub project path to work on",
+)
+@click.option(
+    "-b",
+    "--beanfile",
+    type=click.Path(dir_okay=False, file_okay=True),
+    default="main.bean",
+    help="The path to main entry beancount file, relative to workdir",
+)
+@click.option(
+    "--remove-dangling",
+    is_flag=True,
+    help="Remove dangling transactions (existing imported transactions in Beancount files without corresponding generated transactions)",
+)
+@click.option(
+    "-j",
+    "--workers",
+    type=click.IntRange(min=1),
+    default=DEFAULT_WORKERS,
+    show_default=True,
+    help="Number of workers for import processing and change-set application",
+)
+@click.option(
+    "-v",
+    "--verbose",
+    is_flag=True,
+    help="Log each generated, deleted, and skipped transaction",
+)
+@click.option(
+    "--detailed-report",
+    is_flag=True,
+    help="Show detailed transaction tables in the import report",
+)
+@click.option(
+    "--detailed-report-rows",
+    type=click.IntRange(min=0),
+    default=DEFAULT_MAX_ROWS,
+    show_default=True,
+    help="Max number of rows to show in each table of the detailed report, 0 for no limit",
+)
+@click.option(
+    "--detailed-report-csv",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write all rows of the detailed report to the given CSV file",
+)
+@click.option(
+    "--dry-run",
+    is_flag=True,
+    help="Compute the changes to Beancount files and report them without changing any files",
+)
+@click.option(
+    "--diff",
+    is_flag=True,
+    help="Print the unified diff of changes to Beancount files, implies --dry-run",
+)
+@click.option(
+    "--report-json",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write a machine-readable report with counts, changes and timings of each phase to the given JSON file",
+)
+@click.option(
+    "--profile-memory",
+    is_flag=True,
+    help="Record the peak memory of each phase with tracemalloc and the peak RSS of the parent and worker processes, "
+    "written into the import report",
+)
+@click.option(
+    "--watch",
+    is_flag=True,
+    help="Keep running and import again whenever the import config, input files or Beancount files change",
+)
+@click.option(
+    "--watch-interval",
+    type=click.FloatRange(min=0, min_open=True),
+    default=DEFAULT_WATCH_INTERVAL,
+    show_default=True,
+    help="Seconds between polling for changes in watch mode",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    help="Process all import files and scan all Beancount files without reading or writing the cache",
+)
+@pass_env
+def main(
+    env: Environment,
+    config: str,
+    workdir: str,
+    beanfile: str,
+    remove_dangling: bool,
+    workers: int,
+    verbose: bool,
+    detailed_report: bool,
+    detailed_report_rows: int,
+    detailed_report_csv: str | None,
+    dry_run: bool,
+    diff: bool,
+    report_json: str | None,
+    profile_memory: bool,
+    watch: bool,
+    watch_interval: float,
+    no_cache: bool,
+):
+    workdir_path = pathlib.Path(workdir)
+    if profile_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        click.get_current_context().call_on_close(tracemalloc.stop)
+    # one pool for all the phases and runs, so that workers only warm up once
+    pool = click.get_current_context().with_resource(WorkerPool(max_workers=workers))
+    existing_txn_index = ExistingTransactionIndex(
+        index_path=None if no_cache else get_cache_dir(workdir_path) / INDEX_FILENAME,
+        logger=env.logger,
     )
-    # TODO: add src info
-    table.add_column("File", style=TABLE_COLUMN_STYLE)
-    table.add_column("Id", style=TABLE_COLUMN_STYLE)
-    table.add_column("Source", style=TABLE_COLUMN_STYLE)
-    table.add_column("Date", style=TABLE_COLUMN_STYLE)
-    table.add_column("Narration", style=TABLE_COLUMN_STYLE)
-    for txn in generated_txns:
-        table.add_row(
-            escape(str(txn.file)),
-            str(txn.id),
-            escape(str(":".join(txn.sources))),
-            escape(str(txn.date)),
-            escape(txn.narration),
+
+    def run_import() -> tuple[ImportDoc, list[pathlib.Path]]:
+        return _run_import(
+            env=env,
+            pool=pool,
+            existing_txn_index=existing_txn_index,
+            config=config,
+            workdir=workdir,
+            beanfile=beanfile,
+            remove_dangling=remove_dangling,
+            workers=workers,
+            verbose=verbose,
+            detailed_report=detailed_report,
+            detailed_report_rows=detailed_report_rows,
+            detailed_report_csv=detailed_report_csv,
+            dry_run=dry_run,
+            diff=diff,
+            report_json=report_json,
+            no_cache=no_cache,
+            profile_memory=profile_memory,
         )
-    rich.print(Padding(table, (1, 0, 0, 4)))
 
-    table = Table(
-        title="Open transactions",
-        box=box.SIMPLE,
-        header_style=TABLE_HEADER_STYLE,
-        expand=True,
-    )
-    table.add_column("File", style=TABLE_COLUMN_STYLE)
-    table.add_column("Line", style=TABLE_COLUMN_STYLE)
-    table.add_column("Id", style=TABLE_COLUMN_STYLE)
-    table.add_column("Extractor", style=TABLE_COLUMN_STYLE)
-    table.add_column("Date", style=TABLE_COLUMN_STYLE)
-    table.add_column("Desc", style=TABLE_COLUMN_STYLE)
-    table.add_column("Bank Desc", style=TABLE_COLUMN_STYLE)
-    table.add_column("Amount", style=TABLE_COLUMN_STYLE, justify="right")
-    table.add_column("Currency", style=TABLE_COLUMN_STYLE)
-    for txn in unprocessed_txns:
-        if txn.import_id in imported_txns_with_override:
-            continue
-        table.add_row(
-            escape(txn.txn.file),
-            str(txn.txn.lineno),
-            txn.import_id,
-            escape(str(txn.txn.extractor)),
-            escape(str(txn.txn.date)) if txn.txn.date is not None else "",
-            escape(txn.txn.desc) if txn.txn.desc is not None else "",
-            escape(txn.txn.bank_desc) if txn.txn.bank_desc is not None else "",
-            escape(str(txn.txn.amount)) if txn.txn.amount is not None else "",
-            escape(txn.txn.currency) if txn.txn.currency is not None else "",
+    import_doc, target_files = run_import()
+    if not watch:
+        return
+
+    def get_watched_paths() -> list[pathlib.Path]:
+        paths = [pathlib.Path(config).absolute()]
+        paths.extend(
+            import_file.filepath.absolute()
+            for import_file in collect_import_files(
+                import_doc=import_doc, input_dir=workdir_path
+            )
         )
-    rich.print(Padding(table, (1, 0, 0, 4)))
+        paths.extend(
+            pathlib.Path(key).absolute() for key in existing_txn_index.entries.keys()
+        )
+        # bean files created by the last run are not in the index yet
+        paths.extend(target_file.absolute() for target_file in target_files)
+        return paths
 
-    env.logger.info("done in %.2fs", time.perf_counter() - start_time)
+    snapshot = take_snapshot(get_watched_paths())
+    env.logger.info(
+        "Watching %s files for changes, press Ctrl+C to stop", len(snapshot)
+    )
+    try:
+        while True:
+            snapshot, changed_paths = wait_for_changes(
+                get_watched_paths, snapshot=snapshot, interval=watch_interval
+            )
+            env.logger.info(
+                "Detected changes in %s files, importing again", len(changed_paths)
+            )
+            for changed_path in changed_paths:
+                env.logger.debug("Changed file %s", changed_path)
+            try:
+                import_doc, target_files = run_import()
+            except (Exception, SystemExit):
+                # most likely a half-edited config or bean file, keep watching
+                # and try again once it changes
+                env.logger.exception("Failed to import, waiting for the next change")
+            # take a new snapshot, so that changes made by the import itself
+            # don't trigger another run
+            snapshot = take_snapshot(get_watched_paths())
+    except KeyboardInterrupt:
+        env.logger.info("Stopped watching")
@@ -0,0 +1,340 @@
+import dataclasses
+import datetime
+import decimal
+import pathlib
+import time
+import typing
+
+from beanhub_extract.data_types import Transaction
+from beanhub_import.data_types import Amount
+from beanhub_import.data_types import ChangeSet
+from beanhub_import.data_types import DeletedTransaction
+from beanhub_import.data_types import GeneratedPosting
+from beanhub_import.data_types import GeneratedTransaction
+from beanhub_import.data_types import ImportOverrideFlag
+from beanhub_import.data_types import MetadataItem
+from beanhub_import.data_types import UnprocessedTransaction
+from beanhub_import.processor import ImportFile
+from beanhub_import.processor import ImportProcessResult
+from beanhub_import.processor import process_import_file
+
+from . import import_rules
+from .cache import save_import_results
+from .import_report import get_max_rss
+
+GENERATED = "g"
+DELETED = "d"
+UNPROCESSED = "u"
+TRANSACTION_FIELDS = tuple(field.name for field in dataclasses.fields(Transaction))
+
+# Results are sent between processes as plain tuples instead of pydantic models,
+# which are way cheaper to pickle and unpickle.
+EncodedResult = tuple
+
+T = typing.TypeVar("T")
+
+
+def _encode_amount(amount: Amount | None) -> tuple[str, str] | None:
+    if amount is None:
+        return None
+    return amount.number, amount.currency
+
+
+def _decode_amount(value: tuple[str, str] | None) -> Amount | None:
+    if value is None:
+        return None
+    number, currency = value
+    return Amount.model_construct(number=number, currency=currency)
+
+
+def _encode_postings(postings: list[GeneratedPosting] | None) -> tuple | None:
+    if postings is None:
+        return None
+    return tuple(
+        (
+            posting.account,
+            _encode_amount(posting.amount),
+            _encode_amount(posting.price),
+            posting.cost,
+        )
+        for posting in postings
+    )
+
+
+def _decode_postings(value: tuple | None) -> list[GeneratedPosting] | None:
+    if value is None:
+        return None
+    return [
+        GeneratedPosting.model_construct(
+            account=account,
+            amount=_decode_amount(amount),
+            price=_decode_amount(price),
+            cost=cost,
+        )
+        for account, amount, price, cost in value
+    ]
+
+
+def _construct_dataclass(cls: type[T], values: dict) -> T:
+    """Create a dataclass instance without going through its `__init__`, like what
+    `model_construct` does for pydantic models
+    """
+    obj = cls.__new__(cls)
+    obj.__dict__.update(values)
+    return obj
+
+
+def _to_list(value: tuple | None) -> list | None:
+    if value is None:
+        return None
+    return list(value)
+
+
+def encode_result(result: ImportProcessResult) -> EncodedResult:
+    if isinstance(result, GeneratedTransaction):
+        return (
+            GENERATED,
+            result.file,
+            result.id,
+            tuple(result.sources) if result.sources is not None else None,
+            result.date,
+            result.flag,
+            result.narration,
+            result.payee,
+            tuple(result.tags) if result.tags is not None else None,
+            tuple(result.links) if result.links is not None else None,
+            tuple((item.name, item.value) for item in result.metadata)
+            if result.metadata is not None
+            else None,
+            _encode_postings(result.postings),
+        )
+    elif isinstance(result, DeletedTransaction):
+        return DELETED, result.id
+    elif isinstance(result, UnprocessedTransaction):
+        txn = result.txn
+        return (
+            UNPROCESSED,
+            result.import_id,
+            tuple(getattr(txn, name) for name in TRANSACTION_FIELDS),
+            result.output_file,
+            _encode_postings(result.prepending_postings),
+            _encode_postings(result.appending_postings),
+        )
+    raise ValueError(f"Unexpected type {type(result)}")
+
+
+def decode_generated_transaction(value: EncodedResult) -> GeneratedTransaction:
+    (
+        _,
+        file,
+        txn_id,
+        sources,
+        date,
+        flag,
+        narration,
+        payee,
+        tags,
+        links,
+        metadata,
+        postings,
+    ) = value
+    return GeneratedTransaction.model_construct(
+        file=file,
+        id=txn_id,
+        sources=_to_list(sources),
+        date=date,
+        flag=flag,
+        narration=narration,
+        payee=payee,
+        tags=_to_list(tags),
+        links=_to_list(links),
+        metadata=[
+            MetadataItem.model_construct(name=name, value=item_value)
+            for name, item_value in metadata
+        ]
+        if metadata is not None
+        else None,
+        postings=_decode_postings(postings),
+    )
+
+
+def decode_unprocessed_transaction(value: EncodedResult) -> UnprocessedTransaction:
+    _, import_id, txn_values, output_file, prepending_postings, appending_postings = (
+        value
+    )
+    return _construct_dataclass(
+        UnprocessedTransaction,
+        dict(
+            import_id=import_id,
+            txn=_construct_dataclass(
+                Transaction, dict(zip(TRANSACTION_FIELDS, txn_values))
+            ),
+            output_file=output_file,
+            prepending_postings=_decode_postings(prepending_postings),
+            appending_postings=_decode_postings(appending_postings),
+        ),
+    )
+
+
+def decode_result(value: EncodedResult) -> ImportProcessResult:
+    result_type = value[0]
+    if result_type == GENERATED:
+        return decode_generated_transaction(value)
+    elif result_type == DELETED:
+        return DeletedTransaction.model_construct(id=value[1])
+    elif result_type == UNPROCESSED:
+        return decode_unprocessed_transaction(value)
+    raise ValueError(f"Unexpected result type {result_type}")
+
+
+class ImportTask(typing.NamedTuple):
+    import_file: ImportFile
+    # path of the import result cache entry to write, None for not caching
+    cache_entry_path: pathlib.Path | None = None
+    # import rules compiled by the parent process, None for matching the rules
+    # with beanhub-import directly
+    matcher: import_rules.ImportRuleMatcher | None = None
+
+
+class ImportTaskResult(typing.NamedTuple):
+    results: list[EncodedResult]
+    # time spent on processing the import file in the worker
+    wall_time: float
+    cpu_time: float
+    # peak RSS of the worker after processing the import file
+    max_rss: int | None = None
+
+
+def process_import_task(task: ImportTask) -> ImportTaskResult:
+    """Process an import file in a worker process and send back the encoded
+    results. The cache entry is also written by the worker, so that the parent
+    doesn't need to serialize the results again.
+
+    :param task: the import task to process
+    :return: encoded results with the time spent
+    """
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    if task.matcher is not None:
+        results = import_rules.process_import_file(task.import_file, task.matcher)
+    else:
+        results = process_import_file(task.import_file)
+    if task.cache_entry_path is not None:
+        save_import_results(task.cache_entry_path, results)
+    return ImportTaskResult(
+        results=list(map(encode_result, results)),
+        wall_time=time.perf_counter() - wall_start,
+        cpu_time=time.process_time() - cpu_start,
+        max_rss=get_max_rss(),
+    )
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class GeneratedRecord:
+    """Compact in-memory record of a generated transaction. Only the fields needed
+    for computing changes are kept as attributes, the full transaction is kept in
+    its encoded form and only turned into a model when it needs to be rendered.
+    """
+
+    id: str
+    file: str
+    encoded: EncodedResult
+
+    @property
+    def sources(self) -> tuple[str, ...] | None:
+        return self.encoded[3]
+
+    @property
+    def date(self) -> str:
+        return self.encoded[4]
+
+    @property
+    def narration(self) -> str:
+        return self.encoded[6]
+
+    def to_model(self) -> GeneratedTransaction:
+        return decode_generated_transaction(self.encoded)
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class DeletedRecord:
+    id: str
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class UnprocessedRecord:
+    """Compact in-memory record of an unprocessed transaction, with only the
+    fields needed for reporting
+    """
+
+    import_id: str
+    file: str | None
+    lineno: int | None
+    extractor: str
+    date: datetime.date | None
+    desc: str | None
+    bank_desc: str | None
+    amount: decimal.Decimal | None
+    currency: str | None
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class ExistingRecord:
+    """Compact in-memory record of an existing imported transaction in a bean
+    file, it has the same fields as `BeancountTransaction`
+    """
+
+    file: pathlib.Path
+    lineno: int
+    id: str
+    override: frozenset[ImportOverrideFlag] | None = None
+
+
+ImportRecord = GeneratedRecord | DeletedRecord | UnprocessedRecord
+
+
+def make_record(value: EncodedResult) -> ImportRecord:
+    result_type = value[0]
+    if result_type == GENERATED:
+        return GeneratedRecord(id=value[2], file=value[1], encoded=value)
+    elif result_type == DELETED:
+        return DeletedRecord(id=value[1])
+    elif result_type == UNPROCESSED:
+        txn = dict(zip(TRANSACTION_FIELDS, value[2]))
+        return UnprocessedRecord(
+            import_id=value[1],
+            file=txn["file"],
+            lineno=txn["lineno"],
+            extractor=txn["extractor"],
+            date=txn["date"],
+            desc=txn["desc"],
+            bank_desc=txn["bank_desc"],
+            amount=txn["amount"],
+            currency=txn["currency"],
+        )
+    raise ValueError(f"Unexpected result type {result_type}")
+
+
+def materialize_change_set(change_set: ChangeSet) -> ChangeSet:
+    """Turn generated records in a change set into transaction models for
+    rendering
+
+    :param change_set: change set computed from records
+    :return: change set with generated transaction models
+    """
+
+    def to_model(
+        txn: GeneratedRecord | GeneratedTransaction,
+    ) -> GeneratedTransaction:
+        if isinstance(txn, GeneratedRecord):
+            return txn.to_model()
+        return txn
+
+    return dataclasses.replace(
+        change_set,
+        add=list(map(to_model, change_set.add)),
+        update={
+            lineno: dataclasses.replace(txn_update, txn=to_model(txn_update.txn))
+            for lineno, txn_update in change_set.update.items()
+        },
+    )
@@ -0,0 +1,172 @@
+import dataclasses
+import json
+import pathlib
+import sys
+import time
+import tracemalloc
+
+from beanhub_import.data_types import ChangeSet
+
+from .file_io import write_atomic
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    # not available on Windows
+    resource = None
+
+# Bump this whenever the layout of the report changes
+REPORT_FORMAT_VERSION = 1
+
+
+def get_max_rss(children: bool = False) -> int | None:
+    """Get the peak RSS in bytes of the current process, or of the largest child
+    process which has terminated
+
+    :param children: get the peak RSS of child processes instead
+    :return: the peak RSS in bytes, None if it's not available on this platform
+    """
+    if resource is None:
+        return None
+    usage = resource.getrusage(
+        resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    )
+    # it's in bytes on macOS but in kilobytes on Linux
+    if sys.platform == "darwin":
+        return usage.ru_maxrss
+    return usage.ru_maxrss * 1024
+
+
+@dataclasses.dataclass
+class PhaseMemory:
+    # peak size of memory blocks traced by tracemalloc in the parent process during
+    # the phase
+    traced_peak: int
+    # peak RSS of the parent process so far, in bytes
+    max_rss: int | None
+    # peak RSS of the largest worker process so far, in bytes, including workers
+    # still running which reported their peak RSS with task results
+    workers_max_rss: int | None
+
+
+@dataclasses.dataclass
+class PhaseTiming:
+    name: str
+    wall_time: float
+    cpu_time: float
+    # only recorded when profiling memory
+    memory: PhaseMemory | None = None
+
+
+@dataclasses.dataclass
+class ImportFileReport:
+    file: str
+    cached: bool
+    generated: int = 0
+    deleted: int = 0
+    unprocessed: int = 0
+    # processing time in the worker, None for cached results
+    wall_time: float | None = None
+    cpu_time: float | None = None
+    # peak RSS of the worker after processing the file, in bytes
+    max_rss: int | None = None
+
+
+@dataclasses.dataclass
+class BeanFileReport:
+    file: str
+    add: int
+    update: int
+    remove: int
+    dangling: int
+    # None for dry run
+    written: bool | None = None
+
+
+class PhaseTimer:
+    """Measure the wall time and the CPU time of the parent process spent in each
+    phase. Starting a phase ends the previous one.
+
+    With memory profiling, the peak memory of each phase is recorded as well, which
+    requires tracemalloc to be tracing already.
+    """
+
+    def __init__(self, profile_memory: bool = False):
+        self.profile_memory = profile_memory
+        self.phases: list[PhaseTiming] = []
+        self._current: tuple[str, float, float] | None = None
+        self._workers_max_rss: int | None = None
+
+    def start(self, name: str):
+        self.stop()
+        if self.profile_memory:
+            tracemalloc.reset_peak()
+            self._workers_max_rss = None
+        self._current = (name, time.perf_counter(), time.process_time())
+
+    def record_worker_max_rss(self, max_rss: int | None):
+        """Record the peak RSS reported by a worker still running"""
+        if max_rss is None:
+            return
+        if self._workers_max_rss is None or max_rss > self._workers_max_rss:
+            self._workers_max_rss = max_rss
+
+    def _measure_memory(self) -> PhaseMemory:
+        workers_max_rss = [
+            value
+            for value in (get_max_rss(children=True), self._workers_max_rss)
+            if value
+        ]
+        return PhaseMemory(
+            traced_peak=tracemalloc.get_traced_memory()[1],
+            max_rss=get_max_rss(),
+            workers_max_rss=max(workers_max_rss) if workers_max_rss else None,
+        )
+
+    def stop(self):
+        if self._current is None:
+            return
+        name, wall_start, cpu_start = self._current
+        wall_time = time.perf_counter() - wall_start
+        cpu_time = time.process_time() - cpu_start
+        self.phases.append(
+            PhaseTiming(
+                name=name,
+                wall_time=wall_time,
+                cpu_time=cpu_time,
+                memory=self._measure_memory() if self.profile_memory else None,
+            )
+        )
+        self._current = None
+
+
+@dataclasses.dataclass
+class ImportReport:
+    phases: list[PhaseTiming] = dataclasses.field(default_factory=list)
+    import_files: list[ImportFileReport] = dataclasses.field(default_factory=list)
+    bean_files: list[BeanFileReport] = dataclasses.field(default_factory=list)
+    counts: dict[str, int] = dataclasses.field(default_factory=dict)
+    dry_run: bool = False
+    wall_time: float | None = None
+
+    def add_bean_file(
+        self, target_file: pathlib.Path, change_set: ChangeSet
+    ) -> BeanFileReport:
+        bean_file = BeanFileReport(
+            file=str(target_file),
+            add=len(change_set.add),
+            update=len(change_set.update),
+            remove=len(change_set.remove),
+            dangling=len(change_set.dangling or ()),
+        )
+        self.bean_files.append(bean_file)
+        return bean_file
+
+    def to_json(self) -> dict:
+        return dict(
+            version=REPORT_FORMAT_VERSION,
+            **dataclasses.asdict(self),
+        )
+
+    def write(self, output_path: pathlib.Path):
+        write_atomic(output_path, json.dumps(self.to_json(), indent=2) + "\n")
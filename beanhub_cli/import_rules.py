@@ -0,0 +1,408 @@
+import dataclasses
+import logging
+import re
+import typing
+
+from beanhub_extract.data_types import Transaction
+from beanhub_extract.utils import strip_txn_base_path
+from beanhub_import.data_types import ImportRule
+from beanhub_import.data_types import SimpleTxnMatchRule
+from beanhub_import.data_types import StrContainsMatch
+from beanhub_import.data_types import StrExactMatch
+from beanhub_import.data_types import StrOneOfMatch
+from beanhub_import.data_types import StrPrefixMatch
+from beanhub_import.data_types import StrSuffixMatch
+from beanhub_import.processor import _collect_process_transaction_results
+from beanhub_import.processor import _resolve_extractor_cls
+from beanhub_import.processor import extend_import_match_rules
+from beanhub_import.processor import filter_transaction
+from beanhub_import.processor import ImportFile
+from beanhub_import.processor import ImportProcessResult
+from beanhub_import.processor import match_str
+from beanhub_import.processor import process_transaction
+from beanhub_import.processor import render_extra_attrs
+from beanhub_import.templates import make_environment
+from jinja2 import Template
+from jinja2.sandbox import SandboxedEnvironment
+
+# Fields having the same value for all the transactions extracted from a file,
+# their match results are memoized instead of being evaluated for every row
+MEMOIZED_FIELDS = frozenset(["extractor", "file"])
+
+ValueGetter = typing.Callable[[str], typing.Any]
+
+
+class CachedTemplateEnvironment(SandboxedEnvironment):
+    """Sandboxed environment parsing each template string only once. The import
+    rules render the same few template strings for every row.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._template_cache: dict[str, Template] = {}
+
+    def from_string(self, source, globals=None, template_class=None) -> Template:
+        if (
+            globals is not None
+            or template_class is not None
+            or not isinstance(source, str)
+        ):
+            return super().from_string(
+                source, globals=globals, template_class=template_class
+            )
+        template = self._template_cache.get(source)
+        if template is None:
+            template = super().from_string(source)
+            self._template_cache[source] = template
+        return template
+
+
+def make_template_environment() -> CachedTemplateEnvironment:
+    template_env = CachedTemplateEnvironment()
+    base_env = make_environment()
+    template_env.filters.update(base_env.filters)
+    template_env.tests.update(base_env.tests)
+    template_env.globals.update(base_env.globals)
+    return template_env
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class RegexMatcher:
+    pattern: re.Pattern
+
+    def __call__(self, value: str) -> bool:
+        return self.pattern.match(value) is not None
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class ExactMatcher:
+    equals: str
+
+    def __call__(self, value: str) -> bool:
+        return value == self.equals
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class PrefixMatcher:
+    prefix: str
+
+    def __call__(self, value: str) -> bool:
+        return value.startswith(self.prefix)
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class SuffixMatcher:
+    suffix: str
+
+    def __call__(self, value: str) -> bool:
+        return value.endswith(self.suffix)
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class ContainsMatcher:
+    contains: str
+
+    def __call__(self, value: str) -> bool:
+        return self.contains in value
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class OneOfMatcher:
+    one_of: frozenset[str]
+    ignore_case: bool
+
+    def __call__(self, value: str) -> bool:
+        if self.ignore_case:
+            value = value.lower()
+        return value in self.one_of
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class OneOfRegexMatcher:
+    patterns: tuple[re.Pattern, ...]
+
+    def __call__(self, value: str) -> bool:
+        return any(pattern.match(value) is not None for pattern in self.patterns)
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class FallbackMatcher:
+    """Match with `match_str` for patterns we don't compile, so that they behave
+    exactly the same, including raising errors for invalid patterns
+    """
+
+    pattern: typing.Any
+
+    def __call__(self, value: str) -> bool:
+        return match_str(self.pattern, value)[0]
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class MemoizedMatcher:
+    matcher: typing.Callable[[str], bool]
+    results: dict = dataclasses.field(default_factory=dict)
+
+    def __call__(self, value: str) -> bool:
+        result = self.results.get(value)
+        if result is None:
+            result = self.matcher(value)
+            self.results[value] = result
+        return result
+
+
+StrMatcher = (
+    RegexMatcher
+    | ExactMatcher
+    | PrefixMatcher
+    | SuffixMatcher
+    | ContainsMatcher
+    | OneOfMatcher
+    | OneOfRegexMatcher
+    | FallbackMatcher
+    | MemoizedMatcher
+)
+
+
+def compile_str_match(pattern: typing.Any) -> StrMatcher:
+    """Compile a `StrMatch` pattern into a matcher behaving the same as
+    `match_str`, except that it only tells whether the value matches or not
+
+    :param pattern: the pattern to compile
+    :return: the compiled matcher
+    """
+    if isinstance(pattern, str):
+        return RegexMatcher(re.compile(pattern))
+    elif isinstance(pattern, StrExactMatch):
+        return ExactMatcher(pattern.equals)
+    elif isinstance(pattern, StrPrefixMatch):
+        return PrefixMatcher(pattern.prefix)
+    elif isinstance(pattern, StrSuffixMatch):
+        return SuffixMatcher(pattern.suffix)
+    elif isinstance(pattern, StrContainsMatch):
+        return ContainsMatcher(pattern.contains)
+    elif isinstance(pattern, StrOneOfMatch):
+        if not pattern.regex:
+            if not pattern.ignore_case:
+                return OneOfMatcher(frozenset(pattern.one_of), ignore_case=False)
+            return OneOfMatcher(
+                frozenset(item.lower() for item in pattern.one_of), ignore_case=True
+            )
+        flags = re.IGNORECASE if pattern.ignore_case else 0
+        return OneOfRegexMatcher(
+            tuple(re.compile(item, flags=flags) for item in pattern.one_of)
+        )
+    return FallbackMatcher(pattern)
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class CompiledTxnMatchRule:
+    # (field name, matcher) pairs in the same order `match_transaction` checks
+    checks: tuple[tuple[str, StrMatcher], ...]
+
+    def __call__(self, get_value: ValueGetter) -> bool:
+        for key, matcher in self.checks:
+            value = get_value(key)
+            if value is None or not matcher(value):
+                return False
+        return True
+
+
+def compile_txn_match_rule(rule: SimpleTxnMatchRule) -> CompiledTxnMatchRule:
+    checks = []
+    for key, pattern in rule.model_dump().items():
+        if pattern is None:
+            continue
+        matcher = compile_str_match(getattr(rule, key))
+        if key in MEMOIZED_FIELDS:
+            matcher = MemoizedMatcher(matcher)
+        checks.append((key, matcher))
+    return CompiledTxnMatchRule(checks=tuple(checks))
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class CompiledImportRule:
+    import_rule: ImportRule
+    # only used by rules with a list of match conditions
+    common_cond: CompiledTxnMatchRule | None
+    conds: tuple[CompiledTxnMatchRule, ...]
+
+    def __call__(self, get_value: ValueGetter) -> bool:
+        if not self.conds:
+            return False
+        if self.common_cond is not None and not self.common_cond(get_value):
+            return False
+        return any(cond(get_value) for cond in self.conds)
+
+
+def compile_import_rule(
+    import_rule: ImportRule, extra_attrs: dict | None = None
+) -> CompiledImportRule:
+    extended_rule = extend_import_match_rules(
+        extra_attrs=extra_attrs, import_rule=import_rule
+    )
+    if isinstance(extended_rule.match, list):
+        return CompiledImportRule(
+            import_rule=import_rule,
+            common_cond=compile_txn_match_rule(extended_rule.common_cond)
+            if extended_rule.common_cond is not None
+            else None,
+            conds=tuple(
+                compile_txn_match_rule(match_rule.cond)
+                for match_rule in extended_rule.match
+            ),
+        )
+    return CompiledImportRule(
+        import_rule=import_rule,
+        common_cond=None,
+        conds=(compile_txn_match_rule(extended_rule.match),),
+    )
+
+
+class ImportRuleMatcher:
+    """Import rules compiled once for finding the first rule matching a
+    transaction, with regular expressions compiled and match conditions turned
+    into plain checks, instead of going through the pydantic models for every
+    rule and every row.
+
+    Rules are compiled without extra attributes up front. As extra attributes
+    change the types of the match fields, rules are compiled again for each set of
+    extra attributes the first time they are seen.
+    """
+
+    def __init__(self, import_rules: typing.Sequence[ImportRule]):
+        self.import_rules = tuple(import_rules)
+        self._compiled_rules: dict[tuple, tuple[CompiledImportRule, ...]] = {
+            (): tuple(map(compile_import_rule, self.import_rules))
+        }
+
+    def _get_compiled_rules(
+        self, extra_attrs: dict | None
+    ) -> tuple[CompiledImportRule, ...]:
+        key = ()
+        if extra_attrs:
+            key = tuple((name, type(value)) for name, value in extra_attrs.items())
+        compiled_rules = self._compiled_rules.get(key)
+        if compiled_rules is None:
+            compiled_rules = tuple(
+                compile_import_rule(import_rule, extra_attrs=extra_attrs)
+                for import_rule in self.import_rules
+            )
+            self._compiled_rules[key] = compiled_rules
+        return compiled_rules
+
+    def find_rule(
+        self,
+        txn: Transaction,
+        extra_attrs: dict | None = None,
+        rendered_extra_attrs: dict | None = None,
+    ) -> ImportRule | None:
+        """Find the first import rule matching the transaction, the same rule
+        `process_transaction` would pick
+
+        :param txn: the transaction to match
+        :param extra_attrs: extra attributes of the input config
+        :param rendered_extra_attrs: the extra attributes rendered for the
+            transaction
+        :return: the first matching import rule, or None if no rule matches
+        """
+
+        def get_value(key: str) -> typing.Any:
+            if rendered_extra_attrs is not None and key in rendered_extra_attrs:
+                return rendered_extra_attrs[key]
+            return getattr(txn, key, None)
+
+        for compiled_rule in self._get_compiled_rules(extra_attrs):
+            if compiled_rule(get_value):
+                return compiled_rule.import_rule
+        return None
+
+
+def _render_extra_attrs(
+    template_env: SandboxedEnvironment,
+    txn: Transaction,
+    extra_attrs: dict,
+    omit_token: str,
+    input_vars: dict | None,
+) -> dict:
+    # render the extra attributes with the same context `process_transaction` does
+    template_ctx = dataclasses.asdict(txn)
+    template_ctx["omit"] = omit_token
+    if input_vars is not None:
+        template_ctx |= input_vars
+
+    def render_str(value: str | None) -> str | None:
+        if value is None:
+            return None
+        result_value = template_env.from_string(value).render(**template_ctx)
+        if result_value == omit_token:
+            return None
+        return result_value
+
+    return render_extra_attrs(render_str=render_str, extra_attrs=extra_attrs)
+
+
+def process_import_file(
+    import_file: ImportFile, matcher: ImportRuleMatcher
+) -> list[ImportProcessResult]:
+    """Process an import file the same way as `process_import_file` of
+    beanhub-import does, but with the precompiled matcher finding the matching
+    rule for each transaction and with template strings only parsed once.
+
+    :param import_file: the import file to process
+    :param matcher: matcher compiled from the import rules of the import file
+    :return: the results of processing the import file
+    """
+    logger = logging.getLogger(__name__)
+    template_env = make_template_environment()
+    if import_file.context is not None:
+        template_env.globals.update(import_file.context)
+
+    input_config = import_file.rendered_input_config.input_config
+    input_vars = import_file.rendered_input_config.values
+    extra_attrs = input_config.extra_attrs
+    rel_filepath = import_file.filepath.relative_to(import_file.input_dir)
+    extractor_cls, extractor_name = _resolve_extractor_cls(
+        filepath=import_file.filepath,
+        input_dir=import_file.input_dir,
+        input_config=input_config,
+    )
+    logger.debug("Processing file %s with extractor %s", rel_filepath, extractor_name)
+    results: list[ImportProcessResult] = []
+    with import_file.filepath.open("rt") as fo:
+        extractor = extractor_cls(fo)
+        for transaction in extractor():
+            txn = strip_txn_base_path(import_file.input_dir, transaction)
+            if import_file.rendered_input_config.filter is not None and not all(
+                filter_transaction(operation=input_filter, txn=txn)
+                for input_filter in import_file.rendered_input_config.filter
+            ):
+                logger.debug("Txn %s does not meet filters, skip", txn)
+                continue
+            rendered_extra_attrs = None
+            if extra_attrs is not None:
+                rendered_extra_attrs = _render_extra_attrs(
+                    template_env=template_env,
+                    txn=txn,
+                    extra_attrs=extra_attrs,
+                    omit_token=import_file.omit_token,
+                    input_vars=input_vars,
+                )
+            import_rule = matcher.find_rule(
+                txn,
+                extra_attrs=extra_attrs,
+                rendered_extra_attrs=rendered_extra_attrs,
+            )
+            # only pass down the matching rule, so that the transaction is not
+            # matched against all the rules again
+            txn_generator = process_transaction(
+                template_env=template_env,
+                input_config=input_config.config,
+                import_rules=[import_rule] if import_rule is not None else [],
+                omit_token=import_file.omit_token,
+                default_import_id=getattr(extractor, "DEFAULT_IMPORT_ID", None),
+                txn=txn,
+                input_vars=input_vars,
+                extra_attrs=extra_attrs,
+            )
+            results.extend(_collect_process_transaction_results(txn_generator))
+    return results
@@ -1,8 +1,9 @@
+import click
+
 from ..aliase import AliasedGroup
-from ..cli import cli as root_cli
 
 
-@root_cli.group(
+@click.group(
     name="inbox",
     help="BeanHub inbox features, such as dump (login required) or extract.",
     cls=AliasedGroup,
@@ -0,0 +1,79 @@
+import collections
+import glob
+import json
+import logging
+import pathlib
+import re
+import typing
+
+INCLUDE_PATTERN = re.compile(r'^include[ \t]+("(?:[^"\\]|\\.)*")', re.MULTILINE)
+
+
+def scan_includes(content: str) -> list[tuple[str, int]]:
+    """Find include statements with a regular expression instead of a full parse"""
+    return [
+        (json.loads(match.group(1)), content.count("\n", 0, match.start()) + 1)
+        for match in INCLUDE_PATTERN.finditer(content)
+    ]
+
+
+def iter_included_files(
+    current_file: pathlib.Path,
+    includes: list[tuple[str, int]],
+    root_dir: pathlib.Path,
+    logger: logging.Logger,
+) -> typing.Generator[pathlib.Path, None, None]:
+    """Resolve include statements of a bean file the same way `traverse` does"""
+    for include, lineno in includes:
+        logger.debug(
+            "Process include at %s:%s with path value %s",
+            current_file,
+            lineno,
+            include,
+        )
+        target_file = current_file.parent / include
+        for matched_file in sorted(glob.glob(str(target_file))):
+            matched_file = pathlib.Path(matched_file).resolve().absolute()
+            if root_dir not in matched_file.parents:
+                logger.warning(
+                    "Matched file %s is not a sub-path of root %s, ignored",
+                    matched_file,
+                    root_dir,
+                )
+                # ensure include cannot go above the root folder, to avoid any potential security risk
+                continue
+            yield matched_file
+
+
+def collect_bean_files(
+    get_includes: typing.Callable[[pathlib.Path], list[tuple[str, int]]],
+    bean_file: pathlib.Path,
+    root_dir: pathlib.Path,
+    logger: logging.Logger,
+) -> list[pathlib.Path]:
+    """Follow include statements from the entry bean file, return all the reachable
+    bean files in the same order as `traverse` yields them
+
+    :param get_includes: function returns include statements of a given bean file
+    :param bean_file: the entry bean file
+    :param root_dir: root dir of the project, includes going above it are ignored
+    :param logger: logger
+    """
+    bean_files: list[pathlib.Path] = []
+    seen_files: set[pathlib.Path] = set()
+    pending_files = collections.deque([bean_file.absolute()])
+    while pending_files:
+        current_file = pending_files.popleft()
+        seen_files.add(current_file)
+        bean_files.append(current_file)
+        for included_file in iter_included_files(
+            current_file=current_file,
+            includes=get_includes(current_file),
+            root_dir=root_dir,
+            logger=logger,
+        ):
+            if included_file in seen_files:
+                continue
+            seen_files.add(included_file)
+            pending_files.append(included_file)
+    return bean_files
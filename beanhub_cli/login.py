@@ -4,8 +4,9 @@ import sys
 import time
 import webbrowser
 
+import click
+
 from .api_helpers import handle_api_exception
-from .cli import cli
 from .config import AccessToken
 from .config import Config
 from .config import get_config_path
@@ -73,7 +74,7 @@ def run_login(client: Client):
     logger.info("done")
 
 
-@cli.command(name="login", help="Login your BeanHub account")
+@click.command(name="login", help="Login your BeanHub account")
 @pass_env
 @handle_api_exception(logger)
 def main(env: Environment):
@@ -0,0 +1,119 @@
+import cProfile
+import enum
+import os
+import pathlib
+import typing
+from multiprocessing.util import Finalize
+
+
+@enum.unique
+class ProfileFormat(enum.Enum):
+    # cProfile stats, to be read with pstats, snakeviz and friends
+    PSTATS = "pstats"
+    # speedscope JSON rendered by pyinstrument, requires pyinstrument installed
+    SPEEDSCOPE = "speedscope"
+
+
+class ProfileConfig(typing.NamedTuple):
+    output_path: pathlib.Path
+    format: ProfileFormat
+
+
+class Profiler(typing.Protocol):
+    def start(self): ...
+
+    def stop(self): ...
+
+    def write(self, output_path: pathlib.Path): ...
+
+
+class CProfileProfiler:
+    def __init__(self):
+        self._profile = cProfile.Profile()
+
+    def start(self):
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+
+    def write(self, output_path: pathlib.Path):
+        self._profile.dump_stats(output_path)
+
+
+class PyinstrumentProfiler:
+    def __init__(self):
+        from pyinstrument import Profiler as _Profiler
+
+        self._profiler = _Profiler()
+
+    def start(self):
+        self._profiler.start()
+
+    def stop(self):
+        self._profiler.stop()
+
+    def write(self, output_path: pathlib.Path):
+        from pyinstrument.renderers import SpeedscopeRenderer
+
+        output_path.write_text(self._profiler.output(renderer=SpeedscopeRenderer()))
+
+
+# profile config for worker processes, None for not profiling workers
+_worker_profile_config: ProfileConfig | None = None
+
+
+def make_profiler(profile_format: ProfileFormat) -> Profiler:
+    """Make a profiler for the given output format
+
+    :param profile_format: format of the profile output
+    :return: the profiler
+    :raises ValueError: if the profiler for the format is not installed
+    """
+    if profile_format == ProfileFormat.PSTATS:
+        return CProfileProfiler()
+    elif profile_format == ProfileFormat.SPEEDSCOPE:
+        try:
+            return PyinstrumentProfiler()
+        except ImportError as exc:
+            raise ValueError(
+                "pyinstrument is required for speedscope output, "
+                'please install it with `pip install "beanhub-cli[profile]"`'
+            ) from exc
+    raise ValueError(f"Unexpected profile format {profile_format}")
+
+
+def worker_profile_path(output_path: pathlib.Path, pid: int) -> pathlib.Path:
+    """Path of the profile output of a worker process, next to the main one
+
+    :param output_path: path of the profile output of the main process
+    :param pid: process id of the worker
+    :return: path of the profile output of the worker
+    """
+    return output_path.with_name(f"{output_path.name}.worker-{pid}")
+
+
+def set_worker_profile_config(config: ProfileConfig | None):
+    """Set the profile config for worker processes started from now on"""
+    global _worker_profile_config
+    _worker_profile_config = config
+
+
+def get_worker_profile_config() -> ProfileConfig | None:
+    return _worker_profile_config
+
+
+def start_worker_profiler(config: ProfileConfig):
+    """Start profiling the current worker process until it exits, then write the
+    profile next to the main one
+    """
+    profiler = make_profiler(config.format)
+    output_path = worker_profile_path(config.output_path, os.getpid())
+
+    def write_profile():
+        profiler.stop()
+        profiler.write(output_path)
+
+    # atexit hooks don't run in multiprocessing workers, but finalizers do
+    Finalize(None, write_profile, exitpriority=0)
+    profiler.start()
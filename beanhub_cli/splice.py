@@ -0,0 +1,260 @@
+import datetime
+import decimal
+import json
+import re
+
+from beancount_black.formatter import BALANCE_PREFIX_WIDTH
+from beancount_black.formatter import DEFAULT_ACCOUNT_WIDTH
+from beancount_black.formatter import DEFAULT_INDENT_WIDTH
+from beancount_black.formatter import DEFAULT_NUMBER_WIDTH
+from beanhub_import import constants
+from beanhub_import.data_types import ChangeSet
+from beanhub_import.data_types import GeneratedPosting
+from beanhub_import.data_types import GeneratedTransaction
+from beanhub_import.data_types import ImportOverrideFlag
+
+INDENT = " " * DEFAULT_INDENT_WIDTH
+# padding added to the account column of postings with amount, so that they
+# line up with the account column of balance statements
+POSTING_ACCOUNT_PADDING = BALANCE_PREFIX_WIDTH - DEFAULT_INDENT_WIDTH
+# Entries of these directives are placed before all the other entries by the
+# formatter, their dates don't matter for appending new transactions
+LEADING_DIRECTIVES = frozenset(["open", "close", "commodity"])
+PLAIN_NUMBER_PATTERN = re.compile(r"^(-?)(\d+(?:\.\d+)?)$")
+DATE_LINE_PATTERN = re.compile(r"^(\d{4}-\d{2}-\d{2})[ \t]+(\S+)")
+POSTING_LINE_PATTERN = re.compile(
+    r"^[ \t]+(?:([!*#&?%PSTCURM])[ \t]+)?"
+    r"([A-Z][^\s:;]*(?::[^\s;]+)+)"
+    r"(?:[ \t]+([^\s;]+))?"
+)
+BALANCE_LINE_PATTERN = re.compile(
+    r"^\d{4}-\d{2}-\d{2}[ \t]+balance[ \t]+(\S+)[ \t]+([^\s;]+)"
+)
+
+
+def format_plain_number(number: str) -> str | None:
+    """Format a number the same way beancount-black does, or return None if it's
+    not a plain decimal number we know how to format
+    """
+    match = PLAIN_NUMBER_PATTERN.match(number)
+    if match is None:
+        return None
+    sign, value = match.groups()
+    return sign + f"{decimal.Decimal(value):,f}"
+
+
+def scan_column_widths(lines: list[str]) -> tuple[int, int] | None:
+    """Find the account and number column widths of already formatted bean file
+    lines, the same as what the formatter would compute from its parsed tree.
+
+    :param lines: lines of the bean file
+    :return: (account width, number width), or None if the lines don't look
+        like formatted by beancount-black
+    """
+    account_width = DEFAULT_ACCOUNT_WIDTH
+    number_width = DEFAULT_NUMBER_WIDTH
+    # (the end column of number, expected end column based on widths) pairs
+    aligned_numbers: list[tuple[int, int]] = []
+    for line in lines:
+        if not line or line.lstrip().startswith(";"):
+            continue
+        if line[0].isspace():
+            match = POSTING_LINE_PATTERN.match(line)
+            if match is None:
+                continue
+            flag, account, number = match.groups()
+            number_end = match.end(3)
+            number_offset = len(INDENT) + (len(flag) + 1 if flag is not None else 0)
+        else:
+            match = BALANCE_LINE_PATTERN.match(line)
+            if match is None:
+                continue
+            account, number = match.groups()
+            number_end = match.end(2)
+            number_offset = BALANCE_PREFIX_WIDTH - POSTING_ACCOUNT_PADDING
+        account_width = max(account_width, len(account))
+        if number is None:
+            continue
+        if format_plain_number(number.replace(",", "")) != number:
+            # expressions or numbers not in canonical format
+            return None
+        number_width = max(number_width, len(number))
+        aligned_numbers.append((number_end, number_offset))
+    for number_end, number_offset in aligned_numbers:
+        if number_end != (
+            number_offset + account_width + POSTING_ACCOUNT_PADDING + 1 + number_width
+        ):
+            return None
+    return account_width, number_width
+
+
+def render_posting(
+    posting: GeneratedPosting, account_width: int, number_width: int
+) -> str | None:
+    if posting.cost is not None or len(posting.account) > account_width:
+        return None
+    if posting.amount is None:
+        if posting.price is not None:
+            return None
+        return INDENT + posting.account
+    number = format_plain_number(posting.amount.number)
+    if number is None or len(number) > number_width:
+        return None
+    items = [
+        f"{posting.account:{account_width + POSTING_ACCOUNT_PADDING}}",
+        f"{number:>{number_width}}",
+        posting.amount.currency,
+    ]
+    if posting.price is not None:
+        price_number = format_plain_number(posting.price.number)
+        if price_number is None:
+            return None
+        items.extend(["@", price_number, posting.price.currency])
+    return INDENT + " ".join(items)
+
+
+def render_transaction(
+    txn: GeneratedTransaction, account_width: int, number_width: int
+) -> str | None:
+    """Render a generated transaction into the exact text beancount-black would
+    output for it with the given column widths, without parsing it.
+
+    :param txn: the generated transaction to render
+    :param account_width: the account column width of the target file
+    :param number_width: the number column width of the target file
+    :return: rendered text, or None if the transaction has anything we cannot
+        render exactly or anything going beyond the given column widths
+    """
+    columns = [
+        txn.date,
+        txn.flag,
+        *((json.dumps(txn.payee),) if txn.payee is not None else ()),
+        json.dumps(txn.narration),
+        *sorted("^" + link for link in (txn.links or ())),
+        *sorted("#" + tag for tag in (txn.tags or ())),
+    ]
+    lines = [
+        " ".join(columns),
+        f"{INDENT}{constants.IMPORT_ID_KEY}: {json.dumps(txn.id)}",
+    ]
+    if txn.sources is not None:
+        lines.append(
+            f"{INDENT}{constants.IMPORT_SRC_KEY}: {json.dumps(':'.join(txn.sources))}"
+        )
+    for item in txn.metadata or ():
+        if item.name in (constants.IMPORT_ID_KEY, constants.IMPORT_SRC_KEY):
+            return None
+        lines.append(f"{INDENT}{item.name}: {json.dumps(item.value)}")
+    for posting in txn.postings:
+        line = render_posting(
+            posting, account_width=account_width, number_width=number_width
+        )
+        if line is None:
+            return None
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def get_entry_text(lines: list[str], lineno: int) -> str:
+    """Get the text of the entry starting at the given 1-based line number"""
+    end = lineno
+    while end < len(lines) and lines[end].strip() and lines[end][0].isspace():
+        end += 1
+    return "\n".join(lines[lineno - 1 : end])
+
+
+def is_update_noop(
+    lines: list[str],
+    lineno: int,
+    txn: GeneratedTransaction,
+    override: frozenset[ImportOverrideFlag] | None,
+    account_width: int,
+    number_width: int,
+) -> bool:
+    if override is not None and ImportOverrideFlag.NONE in override:
+        return True
+    if override is not None and ImportOverrideFlag.ALL not in override:
+        # partial overrides, leave it to the full path
+        return False
+    if lineno < 1 or lineno > len(lines):
+        return False
+    text = render_transaction(
+        txn, account_width=account_width, number_width=number_width
+    )
+    return text is not None and text == get_entry_text(lines, lineno)
+
+
+def try_splice_change_set(
+    content: str, change_set: ChangeSet, remove_dangling: bool
+) -> str | None:
+    """Apply a change set to an already formatted bean file by only rendering the
+    new transactions and appending them to the end of the file.
+
+    The content must be exactly what the formatter outputs, like the content last
+    written by the formatter and not changed since then, only then the result is
+    the same as what parsing, applying the change set and formatting the whole
+    file would yield. The checks here only cover the column widths and the tail of
+    the file, but not the order of entries, blank lines, indents or whitespaces.
+
+    Only change sets adding transactions no earlier than the existing entries,
+    with updates not changing anything, are supported.
+
+    :param content: content of the bean file, in the exact form of formatter output
+    :param change_set: change set to apply
+    :param remove_dangling: remove dangling transactions or not
+    :return: the new content, or None if the change set cannot be applied this
+        way and the full path should be taken instead
+    """
+    if change_set.remove or (remove_dangling and change_set.dangling):
+        return None
+    if not content.endswith("\n") or content.endswith("\n\n"):
+        return None
+    lines = content.splitlines()
+    if lines[-1].lstrip().startswith(";") or lines[-1].startswith("*"):
+        # tailing comments are always placed after all the entries
+        return None
+    widths = scan_column_widths(lines)
+    if widths is None:
+        return None
+    account_width, number_width = widths
+    for lineno, txn_update in change_set.update.items():
+        if not is_update_noop(
+            lines,
+            lineno,
+            txn_update.txn,
+            override=txn_update.override,
+            account_width=account_width,
+            number_width=number_width,
+        ):
+            return None
+    if not change_set.add:
+        return content
+
+    last_date: datetime.date | None = None
+    for line in lines:
+        match = DATE_LINE_PATTERN.match(line)
+        if match is None or match.group(2) in LEADING_DIRECTIVES:
+            continue
+        date = datetime.date.fromisoformat(match.group(1))
+        if last_date is None or date > last_date:
+            last_date = date
+    try:
+        new_txns = sorted(
+            change_set.add, key=lambda txn: datetime.date.fromisoformat(txn.date)
+        )
+    except ValueError:
+        return None
+    if last_date is not None and (
+        datetime.date.fromisoformat(new_txns[0].date) < last_date
+    ):
+        # the formatter would sort new transactions in between existing ones
+        return None
+    entries = []
+    for txn in new_txns:
+        text = render_transaction(
+            txn, account_width=account_width, number_width=number_width
+        )
+        if text is None:
+            return None
+        entries.append(text)
+    return content + "\n" + "\n\n".join(entries) + "\n"
@@ -0,0 +1,48 @@
+import pathlib
+import time
+import typing
+
+# (mtime_ns, size) of files, None for missing files
+Snapshot = dict[pathlib.Path, tuple[int, int] | None]
+
+
+def take_snapshot(paths: typing.Iterable[pathlib.Path]) -> Snapshot:
+    snapshot: Snapshot = {}
+    for path in paths:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            snapshot[path] = None
+            continue
+        snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+
+def diff_snapshots(old: Snapshot, new: Snapshot) -> list[pathlib.Path]:
+    """Find paths added, removed or modified between two snapshots"""
+    return sorted(
+        path for path in old.keys() | new.keys() if old.get(path) != new.get(path)
+    )
+
+
+def wait_for_changes(
+    get_paths: typing.Callable[[], typing.Iterable[pathlib.Path]],
+    snapshot: Snapshot,
+    interval: float,
+    sleep: typing.Callable[[float], None] = time.sleep,
+) -> tuple[Snapshot, list[pathlib.Path]]:
+    """Poll the watched files until any of them changes
+
+    :param get_paths: function returns the paths to watch, it's called for every
+        poll so that new files can be picked up
+    :param snapshot: snapshot of the watched files to compare with
+    :param interval: seconds between polls
+    :param sleep: function to sleep between polls
+    :return: the new snapshot and the changed paths
+    """
+    while True:
+        sleep(interval)
+        new_snapshot = take_snapshot(get_paths())
+        changed_paths = diff_snapshots(snapshot, new_snapshot)
+        if changed_paths:
+            return new_snapshot, changed_paths
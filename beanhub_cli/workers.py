@@ -0,0 +1,113 @@
+import concurrent.futures
+import multiprocessing
+import os
+import typing
+
+from beancount_parser.parser import make_parser
+from lark import Lark
+
+from .profiling import get_worker_profile_config
+from .profiling import ProfileConfig
+from .profiling import start_worker_profiler
+
+# Modules to import once in the forkserver process, so that every worker forked
+# from it starts with them already loaded
+FORKSERVER_PRELOAD_MODULES = [
+    "beanhub_cli.workers",
+    "beanhub_cli.format",
+    "beanhub_cli.import_records",
+    "beanhub_cli.import_rules",
+    "beanhub_import.processor",
+    "beanhub_import.post_processor",
+]
+
+T = typing.TypeVar("T")
+R = typing.TypeVar("R")
+
+_parser: Lark | None = None
+
+
+def process_context() -> multiprocessing.context.BaseContext:
+    if hasattr(os, "fork"):
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(FORKSERVER_PRELOAD_MODULES)
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+def init_worker(profile_config: ProfileConfig | None = None):
+    """Initializer of worker processes, build the parser up front so that no task
+    pays for the grammar construction
+
+    :param profile_config: profile the worker process with this config if provided
+    """
+    global _parser
+    if profile_config is not None:
+        start_worker_profiler(profile_config)
+    _parser = make_parser()
+
+
+def get_parser() -> Lark:
+    global _parser
+    if _parser is None:
+        _parser = make_parser()
+    return _parser
+
+
+class WorkerPool:
+    """A process pool shared by all the phases of a command. Worker processes are
+    only started when the executor is used for the first time.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor: concurrent.futures.ProcessPoolExecutor | None = None
+
+    @property
+    def started(self) -> bool:
+        return self._executor is not None
+
+    @property
+    def executor(self) -> concurrent.futures.ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=process_context(),
+                initializer=init_worker,
+                initargs=(get_worker_profile_config(),),
+            )
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is None:
+            return
+        self._executor.shutdown()
+        self._executor = None
+
+    def __enter__(self) -> "WorkerPool":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+
+def submit_largest_first(
+    executor: concurrent.futures.Executor,
+    fn: typing.Callable[[T], R],
+    items: typing.Sequence[T],
+    size: typing.Callable[[T], int],
+) -> list[concurrent.futures.Future[R]]:
+    """Submit tasks in descending order of their size, so that a huge task submitted
+    last doesn't leave all the other workers idle at the tail
+
+    :param executor: executor to submit tasks to
+    :param fn: the function to call with each item
+    :param items: items to process
+    :param size: function returns the estimated size of an item
+    :return: futures in the same order as the given items
+    """
+    sizes = list(map(size, items))
+    futures: list[concurrent.futures.Future[R] | None] = [None] * len(items)
+    for index in sorted(range(len(items)), key=lambda i: sizes[i], reverse=True):
+        futures[index] = executor.submit(fn, items[index])
+    return futures
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""Compare a candidate pytest-benchmark run against a baseline run, print a
+markdown summary and exit with a non-zero code if any benchmark regressed.
+
+The baseline can be a JSON file written with `--benchmark-json` or
+`--benchmark-save`, or a `.benchmarks` directory, in which case the latest saved
+run in it is used.
+"""
+
+import argparse
+import dataclasses
+import json
+import pathlib
+import sys
+
+DEFAULT_STAT = "min"
+# relative change below this is considered noise
+DEFAULT_THRESHOLD = 0.10
+# absolute change in seconds below this is considered noise
+DEFAULT_MIN_DELTA = 0.001
+STATS = ("min", "max", "mean", "median")
+
+EXIT_REGRESSION = 1
+EXIT_INVALID_INPUT = 2
+
+
+@dataclasses.dataclass(frozen=True)
+class Comparison:
+    name: str
+    group: str | None
+    baseline: float | None
+    candidate: float | None
+    status: str
+
+    @property
+    def change(self) -> float | None:
+        if self.baseline is None or self.candidate is None or not self.baseline:
+            return None
+        return (self.candidate - self.baseline) / self.baseline
+
+
+def find_latest_run(benchmarks_dir: pathlib.Path) -> pathlib.Path | None:
+    # saved runs are named like 0001_<name>.json, the counter goes up per run
+    runs = sorted(
+        benchmarks_dir.rglob("*.json"), key=lambda path: (path.name, str(path))
+    )
+    if not runs:
+        return None
+    return runs[-1]
+
+
+def load_run(path: pathlib.Path, stat: str) -> dict[str, tuple[str | None, float]]:
+    if path.is_dir():
+        latest_run = find_latest_run(path)
+        if latest_run is None:
+            raise ValueError(f"No saved benchmark runs found in {path}")
+        path = latest_run
+    payload = json.loads(path.read_text(encoding="utf-8"))
+    return {
+        item["fullname"]: (item.get("group"), item["stats"][stat])
+        for item in payload.get("benchmarks", [])
+    }
+
+
+def compare_runs(
+    baseline: dict[str, tuple[str | None, float]],
+    candidate: dict[str, tuple[str | None, float]],
+    threshold: float,
+    min_delta: float,
+) -> list[Comparison]:
+    comparisons = []
+    for name in sorted(baseline.keys() | candidate.keys()):
+        baseline_group, baseline_value = baseline.get(name, (None, None))
+        candidate_group, candidate_value = candidate.get(name, (None, None))
+        group = candidate_group if name in candidate else baseline_group
+        if baseline_value is None:
+            status = "new"
+        elif candidate_value is None:
+            status = "missing"
+        else:
+            delta = candidate_value - baseline_value
+            if abs(delta) < min_delta or (
+                baseline_value and abs(delta) / baseline_value < threshold
+            ):
+                status = "unchanged"
+            elif delta > 0:
+                status = "regressed"
+            else:
+                status = "improved"
+        comparisons.append(
+            Comparison(
+                name=name,
+                group=group,
+                baseline=baseline_value,
+                candidate=candidate_value,
+                status=status,
+            )
+        )
+    return comparisons
+
+
+def format_seconds(value: float | None) -> str:
+    if value is None:
+        return "-"
+    return f"{value:.4f}s"
+
+
+def format_markdown(
+    comparisons: list[Comparison], stat: str, threshold: float, min_delta: float
+) -> str:
+    regressed_count = sum(1 for item in comparisons if item.status == "regressed")
+    lines = [
+        "## Benchmark comparison",
+        "",
+        f"Compared by `{stat}` time, changes within {threshold:.0%} or "
+        f"{min_delta * 1000:g}ms are treated as noise.",
+        "",
+        f"**{regressed_count} regressed** out of {len(comparisons)} benchmarks.",
+        "",
+        "| Benchmark | Group | Baseline | Candidate | Change | Status |",
+        "| --- | --- | ---: | ---: | ---: | --- |",
+    ]
+    for item in comparisons:
+        change = f"{item.change:+.1%}" if item.change is not None else "-"
+        lines.append(
+            f"| `{item.name}` | {item.group or '-'} "
+            f"| {format_seconds(item.baseline)} | {format_seconds(item.candidate)} "
+            f"| {change} | {item.status} |"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Compare benchmark results against a baseline"
+    )
+    parser.add_argument(
+        "baseline",
+        type=pathlib.Path,
+        help="baseline benchmark JSON file, or a .benchmarks directory",
+    )
+    parser.add_argument(
+        "candidate", type=pathlib.Path, help="candidate benchmark JSON file"
+    )
+    parser.add_argument(
+        "--stat",
+        choices=STATS,
+        default=DEFAULT_STAT,
+        help=f"statistic to compare (default: {DEFAULT_STAT})",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help=f"relative change treated as noise (default: {DEFAULT_THRESHOLD})",
+    )
+    parser.add_argument(
+        "--min-delta",
+        type=float,
+        default=DEFAULT_MIN_DELTA,
+        help=f"absolute change in seconds treated as noise (default: {DEFAULT_MIN_DELTA})",
+    )
+    parser.add_argument(
+        "--markdown",
+        type=pathlib.Path,
+        help="also write the markdown summary into this file",
+    )
+    args = parser.parse_args()
+
+    try:
+        baseline = load_run(args.baseline, stat=args.stat)
+        candidate = load_run(args.candidate, stat=args.stat)
+    except (OSError, ValueError, KeyError) as exc:
+        print(f"Failed to load benchmark results: {exc}", file=sys.stderr)
+        return EXIT_INVALID_INPUT
+
+    comparisons = compare_runs(
+        baseline,
+        candidate,
+        threshold=args.threshold,
+        min_delta=args.min_delta,
+    )
+    summary = format_markdown(
+        comparisons,
+        stat=args.stat,
+        threshold=args.threshold,
+        min_delta=args.min_delta,
+    )
+    print(summary, end="")
+    if args.markdown is not None:
+        args.markdown.write_text(summary, encoding="utf-8")
+    if any(item.status == "regressed" for item in comparisons):
+        return EXIT_REGRESSION
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
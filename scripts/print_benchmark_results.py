@@ -1,8 +1,28 @@
 #!/usr/bin/env python3
+import itertools
 import json
 import pathlib
 import sys
 
+# Phases of `bh import` in the order they run, other groups are printed after
+PHASE_ORDER = [
+    "startup",
+    "end_to_end",
+    "incremental_import",
+    "collect_import_files",
+    "process_import_file",
+    "extract_existing_transactions",
+    "compute_changes",
+    "apply_change_set",
+]
+UNGROUPED = "ungrouped"
+
+
+def group_sort_key(group: str) -> tuple[int, str]:
+    if group in PHASE_ORDER:
+        return PHASE_ORDER.index(group), group
+    return len(PHASE_ORDER), group
+
 
 def main() -> int:
     if len(sys.argv) != 2:
@@ -15,16 +35,30 @@ def main() -> int:
         print("No benchmark results found.")
         return 0
 
+    def get_group(entry: dict) -> str:
+        return entry.get("group") or UNGROUPED
+
     print("Benchmark summary (mean seconds):")
-    for item in sorted(benchmarks, key=lambda entry: entry["stats"]["mean"]):
-        stats = item["stats"]
-        print(
-            f"- {item['name']}: "
-            f"mean={stats['mean']:.4f}s "
-            f"min={stats['min']:.4f}s "
-            f"max={stats['max']:.4f}s "
-            f"rounds={stats['rounds']}"
-        )
+    for group, items in itertools.groupby(
+        sorted(
+            benchmarks,
+            key=lambda entry: (
+                group_sort_key(get_group(entry)),
+                entry["stats"]["mean"],
+            ),
+        ),
+        key=get_group,
+    ):
+        print(f"{group}:")
+        for item in items:
+            stats = item["stats"]
+            print(
+                f"- {item['name']}: "
+                f"mean={stats['mean']:.4f}s "
+                f"min={stats['min']:.4f}s "
+                f"max={stats['max']:.4f}s "
+                f"rounds={stats['rounds']}"
+            )
     return 0
 
 
@@ -1,13 +1,16 @@
 import dataclasses
+import json
 import os
 import pathlib
 import random
+import tracemalloc
 import typing
 
 import pytest
 import yaml
 from beanhub_import.data_types import ActionAddTxn
 from beanhub_import.data_types import AmountTemplate
+from beanhub_import.data_types import GeneratedTransaction
 from beanhub_import.data_types import ImportDoc
 from beanhub_import.data_types import ImportRule
 from beanhub_import.data_types import InputConfig
@@ -17,6 +20,21 @@ from beanhub_import.data_types import SimpleTxnMatchRule
 from beanhub_import.data_types import StrExactMatch
 from beanhub_import.data_types import StrRegexMatch
 from beanhub_import.data_types import TransactionTemplate
+from beanhub_import.post_processor import compute_changes
+from beanhub_import.processor import collect_import_files
+from beanhub_import.processor import ImportFile
+
+from beanhub_cli.bean_index import ExistingTransactionIndex
+from beanhub_cli.bean_index import extract_existing_transactions
+from beanhub_cli.import_cli import _render_change_set
+from beanhub_cli.import_records import ExistingRecord
+from beanhub_cli.import_records import GeneratedRecord
+from beanhub_cli.import_records import ImportTask
+from beanhub_cli.import_records import make_record
+from beanhub_cli.import_records import process_import_task
+from beanhub_cli.import_report import get_max_rss
+from beanhub_cli.import_rules import ImportRuleMatcher
+from beanhub_cli.workers import get_parser
 
 MERCURY_CSV_HEADER = (
     "Date (UTC),Description,Amount,Status,Source Account,Bank Description,"
@@ -28,6 +46,11 @@ CITI_CSV_HEADER = "Status,Date,Description,Debit,Credit,Member Name"
 
 BENCHMARK_NUM_TXNS = int(os.environ.get("BENCHMARK_NUM_TXNS", "50000"))
 BENCHMARK_RANDOM_SEED = int(os.environ.get("BENCHMARK_RANDOM_SEED", "42"))
+# record peak memory into the extra info of each benchmark
+BENCHMARK_PROFILE_MEMORY = os.environ.get("BENCHMARK_PROFILE_MEMORY", "") not in (
+    "",
+    "0",
+)
 
 BENCHMARK_FILE_NAME_TEMPLATES = (
     "2024-{month:02d}.csv",
@@ -317,6 +340,100 @@ def write_benchmark_import_project(
     main_bean.write_text("", encoding="utf-8")
 
 
+def process_benchmark_import_files(
+    import_files: list[ImportFile], import_doc: ImportDoc
+) -> list[GeneratedRecord]:
+    matcher = ImportRuleMatcher(import_doc.imports)
+    records: list[GeneratedRecord] = []
+    for import_file in import_files:
+        task_result = process_import_task(
+            ImportTask(import_file=import_file, matcher=matcher)
+        )
+        records.extend(map(make_record, task_result.results))
+    return records
+
+
+def write_benchmark_ledger(
+    workdir: pathlib.Path,
+    generated_records: list[GeneratedRecord | GeneratedTransaction],
+) -> pathlib.Path:
+    """Write formatted bean files with all the generated transactions imported,
+    the same as what running `bh import` against an empty ledger would produce
+
+    :param workdir: the directory to write the ledger into
+    :param generated_records: generated transactions to write
+    :return: path of the entry bean file
+    """
+    change_sets = compute_changes(
+        generated_txns=generated_records, imported_txns=[], work_dir=workdir
+    )
+    for target_file, change_set in change_sets.items():
+        target_file.write_text(
+            _render_change_set(target_file, change_set, remove_dangling=False),
+            encoding="utf-8",
+        )
+    main_bean = workdir / "main.bean"
+    main_bean.write_text(
+        "".join(
+            f'include "{target_file.name}"\n' for target_file in sorted(change_sets)
+        ),
+        encoding="utf-8",
+    )
+    return main_bean
+
+
+def extract_benchmark_ledger(bean_file: pathlib.Path) -> list[ExistingRecord]:
+    return list(
+        extract_existing_transactions(
+            parser=get_parser(),
+            index=ExistingTransactionIndex(index_path=None),
+            bean_file=bean_file,
+        )
+    )
+
+
+def import_memory_args(report_path: pathlib.Path) -> list[str]:
+    """Extra `bh import` arguments for recording the memory of each phase into the
+    given report file when memory profiling is enabled
+    """
+    if not BENCHMARK_PROFILE_MEMORY:
+        return []
+    return ["--profile-memory", "--report-json", str(report_path)]
+
+
+def record_import_memory(benchmark, report_path: pathlib.Path):
+    """Put the memory of each phase from the import report into the extra info of
+    the benchmark when memory profiling is enabled
+    """
+    if not BENCHMARK_PROFILE_MEMORY:
+        return
+    report = json.loads(report_path.read_text(encoding="utf-8"))
+    benchmark.extra_info["phase_memory"] = {
+        phase["name"]: phase["memory"] for phase in report["phases"]
+    }
+
+
+@pytest.fixture(autouse=True)
+def benchmark_memory(request: pytest.FixtureRequest):
+    if not BENCHMARK_PROFILE_MEMORY or "benchmark" not in request.fixturenames:
+        yield
+        return
+    benchmark = request.getfixturevalue("benchmark")
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    try:
+        yield
+    finally:
+        benchmark.extra_info["traced_peak"] = tracemalloc.get_traced_memory()[1]
+        benchmark.extra_info["max_rss"] = get_max_rss()
+        # only includes workers already shut down
+        benchmark.extra_info["children_max_rss"] = get_max_rss(children=True)
+        if not was_tracing:
+            tracemalloc.stop()
+
+
 @pytest.fixture(scope="session")
 def benchmark_num_txns() -> int:
     return BENCHMARK_NUM_TXNS
@@ -361,3 +478,30 @@ def benchmark_import_project(
 ) -> pathlib.Path:
     write_benchmark_import_project(benchmark_dataset.workdir, large_import_doc)
     return benchmark_dataset.workdir
+
+
+@pytest.fixture(scope="session")
+def benchmark_import_files(
+    large_import_dir: pathlib.Path, large_import_doc: ImportDoc
+) -> list[ImportFile]:
+    return collect_import_files(import_doc=large_import_doc, input_dir=large_import_dir)
+
+
+@pytest.fixture(scope="session")
+def benchmark_generated_records(
+    benchmark_import_files: list[ImportFile], large_import_doc: ImportDoc
+) -> list[GeneratedRecord]:
+    return process_benchmark_import_files(benchmark_import_files, large_import_doc)
+
+
+@pytest.fixture(scope="session")
+def benchmark_ledger(
+    tmp_path_factory, benchmark_generated_records: list[GeneratedRecord]
+) -> pathlib.Path:
+    workdir = tmp_path_factory.mktemp("benchmark_ledger")
+    return write_benchmark_ledger(workdir, benchmark_generated_records)
+
+
+@pytest.fixture(scope="session")
+def benchmark_existing_records(benchmark_ledger: pathlib.Path) -> list[ExistingRecord]:
+    return extract_benchmark_ledger(benchmark_ledger)
@@ -5,10 +5,12 @@ import pytest
 from click.testing import CliRunner
 from pytest_benchmark.fixture import BenchmarkFixture
 
+from .conftest import import_memory_args
+from .conftest import record_import_memory
 from beanhub_cli.main import cli
 
 
-@pytest.mark.benchmark
+@pytest.mark.benchmark(group="end_to_end")
 @pytest.mark.parametrize(
     "benchmark_workers", [1, 4, 8], ids=["workers-1", "workers-4", "workers-8"]
 )
@@ -18,8 +20,10 @@ def test_import_cli_large_csv(
     benchmark_num_txns: int,
     benchmark_workers: int,
     cli_runner: CliRunner,
+    tmp_path: pathlib.Path,
 ) -> None:
     config_path = benchmark_import_project / ".beanhub" / "imports.yaml"
+    report_path = tmp_path / "report.json"
     generated_txn_pattern = re.compile(r"Generated (\d+) transactions")
     output_files = tuple(benchmark_import_project.glob("*-output.bean"))
 
@@ -39,6 +43,8 @@ def test_import_cli_large_csv(
                 "main.bean",
                 "-j",
                 str(benchmark_workers),
+                "--no-cache",
+                *import_memory_args(report_path),
             ],
             catch_exceptions=False,
         )
@@ -50,3 +56,4 @@ def test_import_cli_large_csv(
         return generated_count
 
     benchmark.pedantic(run_import, rounds=1, iterations=1)
+    record_import_memory(benchmark, report_path)
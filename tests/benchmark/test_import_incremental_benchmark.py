@@ -0,0 +1,149 @@
+import dataclasses
+import json
+import pathlib
+import random
+import shutil
+
+import pytest
+from beanhub_import.data_types import GeneratedTransaction
+from beanhub_import.data_types import ImportDoc
+from click.testing import CliRunner
+from pytest_benchmark.fixture import BenchmarkFixture
+
+from .conftest import BENCHMARK_BANKS
+from .conftest import BENCHMARK_PROFILE_MEMORY
+from .conftest import BENCHMARK_RANDOM_SEED
+from .conftest import record_import_memory
+from .conftest import write_benchmark_import_project
+from .conftest import write_benchmark_ledger
+from beanhub_cli.import_records import GeneratedRecord
+from beanhub_cli.main import cli
+
+
+@dataclasses.dataclass(frozen=True)
+class IncrementalScenario:
+    # ratio of CSV rows not imported into the ledger yet
+    new_ratio: float
+    # ratio of extra imported transactions in the ledger without CSV rows
+    dangling_ratio: float = 0.0
+    remove_dangling: bool = False
+
+
+INCREMENTAL_SCENARIOS = {
+    "new-0%": IncrementalScenario(new_ratio=0.0),
+    "new-1%": IncrementalScenario(new_ratio=0.01),
+    "new-10%": IncrementalScenario(new_ratio=0.1),
+    "remove-dangling": IncrementalScenario(
+        new_ratio=0.01, dangling_ratio=0.01, remove_dangling=True
+    ),
+}
+
+
+@dataclasses.dataclass(frozen=True)
+class IncrementalProject:
+    workdir: pathlib.Path
+    new_count: int
+    dangling_count: int
+    # content of the output bean files to restore before each run
+    output_files: dict[pathlib.Path, str]
+
+    def restore(self):
+        for output_file, content in self.output_files.items():
+            output_file.write_text(content, encoding="utf-8")
+
+
+def make_incremental_project(
+    workdir: pathlib.Path,
+    input_dir: pathlib.Path,
+    import_doc: ImportDoc,
+    generated_records: list[GeneratedRecord],
+    scenario: IncrementalScenario,
+) -> IncrementalProject:
+    for bank in BENCHMARK_BANKS:
+        shutil.copytree(input_dir / bank.dirname, workdir / bank.dirname)
+    write_benchmark_import_project(workdir, import_doc)
+
+    rng = random.Random(BENCHMARK_RANDOM_SEED)
+    new_count = int(len(generated_records) * scenario.new_ratio)
+    new_ids = frozenset(
+        record.id for record in rng.sample(generated_records, new_count)
+    )
+    existing_txns: list[GeneratedRecord | GeneratedTransaction] = [
+        record for record in generated_records if record.id not in new_ids
+    ]
+    dangling_count = int(len(generated_records) * scenario.dangling_ratio)
+    for record in rng.sample(generated_records, dangling_count):
+        txn = record.to_model()
+        existing_txns.append(
+            txn.model_copy(update=dict(id=f"dangling:{txn.id}", sources=None))
+        )
+    write_benchmark_ledger(workdir, existing_txns)
+    return IncrementalProject(
+        workdir=workdir,
+        new_count=new_count,
+        dangling_count=dangling_count,
+        output_files={
+            output_file: output_file.read_text(encoding="utf-8")
+            for output_file in workdir.glob("*-output.bean")
+        },
+    )
+
+
+@pytest.mark.benchmark(group="incremental_import")
+@pytest.mark.parametrize("use_cache", [False, True], ids=["no-cache", "cache"])
+@pytest.mark.parametrize("scenario_name", list(INCREMENTAL_SCENARIOS))
+def test_import_cli_incremental(
+    benchmark: BenchmarkFixture,
+    tmp_path_factory: pytest.TempPathFactory,
+    large_import_dir: pathlib.Path,
+    large_import_doc: ImportDoc,
+    benchmark_generated_records: list[GeneratedRecord],
+    cli_runner: CliRunner,
+    scenario_name: str,
+    use_cache: bool,
+) -> None:
+    scenario = INCREMENTAL_SCENARIOS[scenario_name]
+    project = make_incremental_project(
+        workdir=tmp_path_factory.mktemp("benchmark_incremental"),
+        input_dir=large_import_dir,
+        import_doc=large_import_doc,
+        generated_records=benchmark_generated_records,
+        scenario=scenario,
+    )
+    report_path = project.workdir / "report.json"
+    args = [
+        "import",
+        "--config",
+        str(project.workdir / ".beanhub" / "imports.yaml"),
+        "--workdir",
+        str(project.workdir),
+        "--beanfile",
+        "main.bean",
+        "--report-json",
+        str(report_path),
+    ]
+    if scenario.remove_dangling:
+        args.append("--remove-dangling")
+    if not use_cache:
+        args.append("--no-cache")
+    if BENCHMARK_PROFILE_MEMORY:
+        args.append("--profile-memory")
+
+    def run_import():
+        result = cli_runner.invoke(cli, args, catch_exceptions=False)
+        assert result.exit_code == 0, result.output
+
+    if use_cache:
+        # warm up the import result cache and the existing transaction index, the
+        # same as a ledger imported before
+        run_import()
+
+    benchmark.pedantic(run_import, setup=project.restore, rounds=1, iterations=1)
+
+    record_import_memory(benchmark, report_path)
+    report = json.loads(report_path.read_text())
+    bean_files = report["bean_files"]
+    assert sum(bean_file["add"] for bean_file in bean_files) == project.new_count
+    assert (
+        sum(bean_file["dangling"] for bean_file in bean_files) == project.dangling_count
+    )
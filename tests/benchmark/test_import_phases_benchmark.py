@@ -0,0 +1,189 @@
+import dataclasses
+import pathlib
+import shutil
+
+import pytest
+from beanhub_import.data_types import ChangeSet
+from beanhub_import.data_types import DeletedTransaction
+from beanhub_import.data_types import ImportDoc
+from beanhub_import.post_processor import compute_changes
+from beanhub_import.processor import collect_import_files
+from beanhub_import.processor import ImportFile
+from pytest_benchmark.fixture import BenchmarkFixture
+
+from .conftest import BenchmarkCsvFile
+from .conftest import extract_benchmark_ledger
+from .conftest import write_benchmark_ledger
+from beanhub_cli.bean_index import ExistingTransactionIndex
+from beanhub_cli.bean_index import extract_existing_transactions
+from beanhub_cli.format_cache import hash_content
+from beanhub_cli.import_cli import _apply_change_set_to_file
+from beanhub_cli.import_records import ExistingRecord
+from beanhub_cli.import_records import GeneratedRecord
+from beanhub_cli.import_records import ImportTask
+from beanhub_cli.import_records import process_import_task
+from beanhub_cli.import_rules import ImportRuleMatcher
+from beanhub_cli.workers import get_parser
+
+APPLY_TARGET_FILE = "mercury-output.bean"
+
+
+@pytest.mark.benchmark(group="collect_import_files")
+def test_collect_import_files(
+    benchmark: BenchmarkFixture,
+    large_import_dir: pathlib.Path,
+    large_import_doc: ImportDoc,
+    benchmark_csv_files: list[BenchmarkCsvFile],
+) -> None:
+    import_files = benchmark(
+        collect_import_files, import_doc=large_import_doc, input_dir=large_import_dir
+    )
+    assert len(import_files) == len(benchmark_csv_files)
+
+
+@pytest.mark.benchmark(group="process_import_file")
+@pytest.mark.parametrize("bank_dirname", ["mercury", "chase", "citi"])
+def test_process_import_file(
+    benchmark: BenchmarkFixture,
+    benchmark_import_files: list[ImportFile],
+    large_import_doc: ImportDoc,
+    bank_dirname: str,
+) -> None:
+    import_file = max(
+        (
+            import_file
+            for import_file in benchmark_import_files
+            if import_file.filepath.relative_to(import_file.input_dir).parts[0]
+            == bank_dirname
+        ),
+        key=lambda import_file: import_file.filepath.stat().st_size,
+    )
+    task = ImportTask(
+        import_file=import_file, matcher=ImportRuleMatcher(large_import_doc.imports)
+    )
+    task_result = benchmark.pedantic(process_import_task, args=(task,), rounds=3)
+    assert task_result.results
+
+
+@pytest.mark.benchmark(group="extract_existing_transactions")
+def test_extract_existing_transactions(
+    benchmark: BenchmarkFixture,
+    benchmark_ledger: pathlib.Path,
+    benchmark_num_txns: int,
+) -> None:
+    def extract() -> int:
+        # a new index for every round, so that all the bean files are parsed
+        index = ExistingTransactionIndex(index_path=None)
+        return sum(
+            1
+            for _ in extract_existing_transactions(
+                parser=get_parser(), index=index, bean_file=benchmark_ledger
+            )
+        )
+
+    assert benchmark.pedantic(extract, rounds=1, iterations=1) == benchmark_num_txns
+
+
+@pytest.mark.benchmark(group="compute_changes")
+@pytest.mark.parametrize("existing", [False, True], ids=["new", "existing"])
+def test_compute_changes(
+    benchmark: BenchmarkFixture,
+    benchmark_ledger: pathlib.Path,
+    benchmark_generated_records: list[GeneratedRecord],
+    benchmark_existing_records: list[ExistingRecord],
+    existing: bool,
+) -> None:
+    change_sets = benchmark(
+        compute_changes,
+        generated_txns=benchmark_generated_records,
+        imported_txns=benchmark_existing_records if existing else [],
+        work_dir=benchmark_ledger.parent,
+    )
+    total_add = sum(len(change_set.add) for change_set in change_sets.values())
+    assert total_add == (0 if existing else len(benchmark_generated_records))
+
+
+def make_apply_change_set(
+    kind: str,
+    workdir: pathlib.Path,
+    ledger: pathlib.Path,
+    generated_records: list[GeneratedRecord],
+    existing_records: list[ExistingRecord],
+) -> tuple[pathlib.Path, ChangeSet]:
+    target_file = workdir / APPLY_TARGET_FILE
+    generated_records = [
+        record for record in generated_records if record.file == APPLY_TARGET_FILE
+    ]
+    deleted_txns = []
+    if kind == "add-only":
+        # the target file has 90% of the transactions, the rest are new
+        existing_count = len(generated_records) * 9 // 10
+        write_benchmark_ledger(workdir, generated_records[:existing_count])
+        existing_records = extract_benchmark_ledger(workdir / "main.bean")
+        generated_txns = generated_records
+    else:
+        shutil.copyfile(ledger.parent / APPLY_TARGET_FILE, target_file)
+        existing_records = [
+            dataclasses.replace(record, file=target_file)
+            for record in existing_records
+            if record.file.name == APPLY_TARGET_FILE
+        ]
+        if kind == "update-heavy":
+            generated_txns = []
+            for record in generated_records:
+                txn = record.to_model()
+                generated_txns.append(
+                    txn.model_copy(update=dict(narration=f"Updated {txn.narration}"))
+                )
+        elif kind == "remove-heavy":
+            deleted_txns = [
+                DeletedTransaction(id=record.id) for record in existing_records[::2]
+            ]
+            generated_txns = generated_records
+        else:
+            raise ValueError(f"Unexpected kind {kind}")
+    change_sets = compute_changes(
+        generated_txns=generated_txns,
+        imported_txns=existing_records,
+        deleted_txns=deleted_txns,
+        work_dir=workdir,
+    )
+    return target_file, change_sets[target_file.resolve()]
+
+
+@pytest.mark.benchmark(group="apply_change_set")
+@pytest.mark.parametrize("kind", ["add-only", "update-heavy", "remove-heavy"])
+def test_apply_change_set_to_file(
+    benchmark: BenchmarkFixture,
+    tmp_path: pathlib.Path,
+    benchmark_ledger: pathlib.Path,
+    benchmark_generated_records: list[GeneratedRecord],
+    benchmark_existing_records: list[ExistingRecord],
+    kind: str,
+) -> None:
+    target_file, change_set = make_apply_change_set(
+        kind,
+        workdir=tmp_path,
+        ledger=benchmark_ledger,
+        generated_records=benchmark_generated_records,
+        existing_records=benchmark_existing_records,
+    )
+    original_content = target_file.read_text()
+
+    def reset_target_file():
+        target_file.write_text(original_content)
+
+    # the ledger is written by the formatter, so new transactions can be spliced in
+    written, _ = benchmark.pedantic(
+        _apply_change_set_to_file,
+        args=(
+            target_file,
+            change_set,
+            False,
+            hash_content(original_content.encode("utf8")),
+        ),
+        setup=reset_target_file,
+        rounds=1,
+        iterations=1,
+    )
+    assert written
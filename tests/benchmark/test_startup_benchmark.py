@@ -0,0 +1,27 @@
+import subprocess
+import sys
+
+import pytest
+from pytest_benchmark.fixture import BenchmarkFixture
+
+
+@pytest.mark.benchmark(group="startup")
+@pytest.mark.parametrize(
+    "args",
+    [
+        ["--version"],
+        ["format", "--help"],
+        ["import", "--help"],
+    ],
+    ids=["version", "format", "import"],
+)
+def test_startup(benchmark: BenchmarkFixture, args: list[str]) -> None:
+    # run in a new interpreter every round, as the imports are what we measure
+    def run_bh():
+        subprocess.run(
+            [sys.executable, "-m", "beanhub_cli.main", *args],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+
+    benchmark.pedantic(run_bh, rounds=5, iterations=1, warmup_rounds=1)
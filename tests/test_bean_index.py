@@ -0,0 +1,215 @@
+import concurrent.futures
+import dataclasses
+import json
+import multiprocessing
+import pathlib
+import textwrap
+
+from beancount_parser.parser import make_parser
+from beanhub_import.post_processor import (
+    extract_existing_transactions as upstream_extract_existing_transactions,
+)
+
+from beanhub_cli.bean_index import ExistingTransactionIndex
+from beanhub_cli.bean_index import extract_existing_transactions
+from beanhub_cli.includes import scan_includes
+
+MAIN_BEAN = textwrap.dedent(
+    """\
+    include "books/*.bean"
+
+    2024-01-01 open Assets:Cash
+    """
+)
+BOOK_BEAN = textwrap.dedent(
+    """\
+    2024-04-17 * "Coffee"
+      import-id: "mercury.csv:-1"
+      Assets:Cash  -5.00 USD
+      Expenses:Food
+
+    2024-04-18 * "Lunch"
+      import-id: "mercury.csv:-2"
+      import-override: "narration,postings"
+      Assets:Cash  -15.00 USD
+      Expenses:Food
+
+    2024-04-19 * "Manual"
+      Assets:Cash  -1.00 USD
+      Expenses:Food
+    """
+)
+
+
+def write_books(root: pathlib.Path):
+    (root / "main.bean").write_text(MAIN_BEAN)
+    books_dir = root / "books"
+    books_dir.mkdir()
+    (books_dir / "2024.bean").write_text(BOOK_BEAN)
+    (books_dir / "2023.bean").write_text(
+        BOOK_BEAN.replace("2024-", "2023-").replace("mercury.csv", "old.csv")
+    )
+
+
+def test_extract_existing_transactions(tmp_path: pathlib.Path):
+    write_books(tmp_path)
+    parser = make_parser()
+    expected = sorted(
+        map(
+            dataclasses.astuple,
+            upstream_extract_existing_transactions(
+                parser=parser, bean_file=tmp_path / "main.bean", root_dir=tmp_path
+            ),
+        ),
+        key=lambda txn: (str(txn[0]), txn[1]),
+    )
+    assert len(expected) == 4
+
+    index_path = tmp_path / "index.json"
+    index = ExistingTransactionIndex(index_path=index_path)
+    txns = list(
+        extract_existing_transactions(
+            parser=parser,
+            index=index,
+            bean_file=tmp_path / "main.bean",
+            root_dir=tmp_path,
+        )
+    )
+    assert (
+        sorted(map(dataclasses.astuple, txns), key=lambda txn: (str(txn[0]), txn[1]))
+        == expected
+    )
+    assert index.scanned_count == 3
+
+    index = ExistingTransactionIndex(index_path=index_path)
+    txns = list(
+        extract_existing_transactions(
+            parser=parser,
+            index=index,
+            bean_file=tmp_path / "main.bean",
+            root_dir=tmp_path,
+        )
+    )
+    assert (
+        sorted(map(dataclasses.astuple, txns), key=lambda txn: (str(txn[0]), txn[1]))
+        == expected
+    )
+    assert index.scanned_count == 0
+
+
+def test_extract_existing_transactions_changed_file(tmp_path: pathlib.Path):
+    write_books(tmp_path)
+    parser = make_parser()
+    index_path = tmp_path / "index.json"
+    index = ExistingTransactionIndex(index_path=index_path)
+    list(
+        extract_existing_transactions(
+            parser=parser, index=index, bean_file=tmp_path / "main.bean"
+        )
+    )
+
+    book_file = tmp_path / "books" / "2024.bean"
+    book_file.write_text(
+        BOOK_BEAN.replace('"Manual"', '"Manual"\n  import-id: "mercury.csv:-3"')
+    )
+    index = ExistingTransactionIndex(index_path=index_path)
+    txns = list(
+        extract_existing_transactions(
+            parser=parser, index=index, bean_file=tmp_path / "main.bean"
+        )
+    )
+    assert index.scanned_count == 1
+    assert sorted(txn.id for txn in txns if txn.file == book_file) == [
+        "mercury.csv:-1",
+        "mercury.csv:-2",
+        "mercury.csv:-3",
+    ]
+
+    # removed files are dropped from the index
+    book_file.unlink()
+    index = ExistingTransactionIndex(index_path=index_path)
+    list(
+        extract_existing_transactions(
+            parser=parser, index=index, bean_file=tmp_path / "main.bean"
+        )
+    )
+    assert ExistingTransactionIndex(index_path=index_path).entries.keys() == {
+        (tmp_path / "main.bean").as_posix(),
+        (tmp_path / "books" / "2023.bean").resolve().as_posix(),
+    }
+
+
+def test_formatted_hashes(tmp_path: pathlib.Path):
+    index_path = tmp_path / "index.json"
+    book_file = tmp_path / "book.bean"
+    other_file = tmp_path / "other.bean"
+    index = ExistingTransactionIndex(index_path=index_path)
+    index.put_formatted_hash(book_file, "book-hash")
+    index.put_formatted_hash(other_file, "other-hash")
+    index.save()
+
+    index = ExistingTransactionIndex(index_path=index_path)
+    assert index.get_formatted_hash(book_file) == "book-hash"
+    # formatted hashes of files no longer visited are dropped
+    index.save(visited_files=[book_file])
+    index = ExistingTransactionIndex(index_path=index_path)
+    assert index.get_formatted_hash(book_file) == "book-hash"
+    assert index.get_formatted_hash(other_file) is None
+
+    # a different formatter may output differently
+    payload = json.loads(index_path.read_text())
+    payload["formatter"] = "other-formatter"
+    index_path.write_text(json.dumps(payload))
+    index = ExistingTransactionIndex(index_path=index_path)
+    assert index.get_formatted_hash(book_file) is None
+
+
+def test_extract_existing_transactions_with_executor(tmp_path: pathlib.Path):
+    write_books(tmp_path)
+    books_dir = tmp_path / "books"
+    for month in range(1, 13):
+        (books_dir / f"2022-{month:02d}.bean").write_text(
+            BOOK_BEAN.replace("2024-", "2022-").replace(
+                "mercury.csv", f"2022-{month:02d}.csv"
+            )
+        )
+    parser = make_parser()
+    expected = list(
+        extract_existing_transactions(
+            parser=parser,
+            index=ExistingTransactionIndex(),
+            bean_file=tmp_path / "main.bean",
+        )
+    )
+    assert len(expected) == 28
+
+    index = ExistingTransactionIndex()
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=2, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        txns = list(
+            extract_existing_transactions(
+                parser=parser,
+                index=index,
+                bean_file=tmp_path / "main.bean",
+                executor=executor,
+            )
+        )
+    assert txns == expected
+    assert index.scanned_count == 15
+
+
+def test_scan_includes():
+    content = textwrap.dedent(
+        """\
+        ; include "commented.bean"
+        include "books/*.bean"
+        option "title" "include \\"nope.bean\\""
+
+        include   "escaped \\"quote\\".bean"
+        """
+    )
+    assert scan_includes(content) == [
+        ("books/*.bean", 2),
+        ('escaped "quote".bean', 5),
+    ]
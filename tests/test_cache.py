@@ -0,0 +1,57 @@
+import datetime
+import decimal
+
+import pytest
+from beanhub_extract.data_types import Transaction
+from beanhub_import.data_types import Amount
+from beanhub_import.data_types import DeletedTransaction
+from beanhub_import.data_types import GeneratedPosting
+from beanhub_import.data_types import GeneratedTransaction
+from beanhub_import.data_types import UnprocessedTransaction
+
+from beanhub_cli.cache import dump_import_result
+from beanhub_cli.cache import load_import_result
+
+
+@pytest.mark.parametrize(
+    "result",
+    [
+        GeneratedTransaction(
+            file="output.bean",
+            id="mercury.csv:-1",
+            sources=["mercury.csv"],
+            date="2024-04-17",
+            flag="*",
+            narration="Coffee",
+            postings=[
+                GeneratedPosting(
+                    account="Assets:Cash",
+                    amount=Amount(number="-5.00", currency="USD"),
+                ),
+                GeneratedPosting(account="Expenses:Food"),
+            ],
+        ),
+        DeletedTransaction(id="mercury.csv:-2"),
+        UnprocessedTransaction(
+            import_id="mercury.csv:-3",
+            txn=Transaction(
+                extractor="mercury",
+                file="mercury.csv",
+                lineno=3,
+                date=datetime.date(2024, 4, 17),
+                timestamp=datetime.datetime(
+                    2024, 4, 17, 21, 30, 40, tzinfo=datetime.timezone.utc
+                ),
+                amount=decimal.Decimal("-353.63"),
+                desc="Amazon Web Services",
+                extra=dict(foo="bar"),
+            ),
+            output_file="output.bean",
+            prepending_postings=[GeneratedPosting(account="Assets:Cash")],
+        ),
+    ],
+)
+def test_import_result_round_trip(
+    result: GeneratedTransaction | DeletedTransaction | UnprocessedTransaction,
+):
+    assert load_import_result(dump_import_result(result)) == result
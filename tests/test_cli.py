@@ -0,0 +1,63 @@
+import subprocess
+import sys
+
+import pytest
+from click.testing import CliRunner
+
+from beanhub_cli.cli import LAZY_COMMANDS
+from beanhub_cli.main import cli
+
+
+def test_startup_imports_no_subcommands():
+    code = "; ".join(
+        [
+            "import sys",
+            "from beanhub_cli.main import cli",
+            "print('\\n'.join(sys.modules))",
+        ]
+    )
+    output = subprocess.check_output([sys.executable, "-c", code], text=True)
+    modules = set(output.splitlines())
+    for module in [
+        "fastapi",
+        "fastapi_mcp",
+        "uvicorn",
+        "beanhub_inbox",
+        "beanhub_import",
+        "beanhub_cli.format",
+        "beanhub_cli.import_cli",
+        "beanhub_cli.forms.main",
+        "beanhub_cli.mcp.main",
+    ]:
+        assert module not in modules
+
+
+def test_help_lists_lazy_commands(cli_runner: CliRunner):
+    cli_runner.mix_stderr = False
+    result = cli_runner.invoke(cli, ["--help"], catch_exceptions=False)
+    assert result.exit_code == 0, result.output
+    for name in LAZY_COMMANDS:
+        assert name in result.stdout
+
+
+@pytest.mark.parametrize(
+    "args, expected",
+    [
+        (["format", "--help"], "Format Beancount files"),
+        (["fmt", "--help"], "Format Beancount files"),
+        (["imp", "--help"], "Import data into Beancount files"),
+        (["form", "--help"], "Validating BeanHub Forms"),
+    ],
+)
+def test_lazy_command(cli_runner: CliRunner, args: list[str], expected: str):
+    cli_runner.mix_stderr = False
+    result = cli_runner.invoke(cli, args, catch_exceptions=False)
+    assert result.exit_code == 0, result.output
+    assert expected in result.stdout
+
+
+def test_ambiguous_command(cli_runner: CliRunner):
+    cli_runner.mix_stderr = False
+    result = cli_runner.invoke(cli, ["fo", "--help"])
+    assert result.exit_code == 2
+    assert "Too many matches: form, format" in result.stderr
@@ -0,0 +1,75 @@
+import os
+import pathlib
+
+import pytest
+
+from beanhub_cli.file_io import write_atomic
+from beanhub_cli.file_io import write_if_changed
+
+
+def test_write_atomic(tmp_path: pathlib.Path):
+    target = tmp_path / "main.bean"
+    write_atomic(target, "hello\n")
+    assert target.read_text() == "hello\n"
+
+    target.chmod(0o640)
+    write_atomic(target, b"world\n")
+    assert target.read_bytes() == b"world\n"
+    assert target.stat().st_mode & 0o777 == 0o640
+    assert list(tmp_path.iterdir()) == [target]
+
+
+def test_write_atomic_symlink(tmp_path: pathlib.Path):
+    books_dir = tmp_path / "books"
+    books_dir.mkdir()
+    real_target = books_dir / "main.bean"
+    real_target.write_text("hello\n")
+    link = tmp_path / "main.bean"
+    link.symlink_to(real_target)
+
+    write_atomic(link, "world\n")
+    assert link.is_symlink()
+    assert real_target.read_text() == "world\n"
+    # the temp file is created next to the real target
+    assert list(books_dir.iterdir()) == [real_target]
+    assert set(tmp_path.iterdir()) == {books_dir, link}
+
+
+def test_write_atomic_hardlink(tmp_path: pathlib.Path):
+    target = tmp_path / "main.bean"
+    target.write_text("hello\n")
+    other = tmp_path / "other.bean"
+    other.hardlink_to(target)
+
+    write_atomic(target, "world\n")
+    assert target.read_text() == "world\n"
+    assert other.read_text() == "world\n"
+    assert target.stat().st_ino == other.stat().st_ino
+
+
+@pytest.mark.skipif(
+    not hasattr(os, "geteuid") or os.geteuid() != 0,
+    reason="only root can change the owner of files",
+)
+def test_write_atomic_owner(tmp_path: pathlib.Path):
+    target = tmp_path / "main.bean"
+    target.write_text("hello\n")
+    os.chown(target, 1234, 5678)
+
+    write_atomic(target, "world\n")
+    assert target.read_text() == "world\n"
+    assert (target.stat().st_uid, target.stat().st_gid) == (1234, 5678)
+
+
+def test_write_if_changed(tmp_path: pathlib.Path):
+    target = tmp_path / "main.bean"
+    assert write_if_changed(target, "hello\n")
+    assert target.read_text() == "hello\n"
+    inode = target.stat().st_ino
+
+    assert not write_if_changed(target, "hello\n")
+    assert target.stat().st_ino == inode
+
+    assert write_if_changed(target, "world\n")
+    assert target.read_text() == "world\n"
+    assert target.stat().st_ino != inode
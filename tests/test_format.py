@@ -1,9 +1,16 @@
+import os
 import pathlib
+import textwrap
 
+import pytest
 from click.testing import CliRunner
 
 from .helper import switch_cwd
+from beanhub_cli.format import find_rules_containing
+from beanhub_cli.format import rename_tree
+from beanhub_cli.format import TokenRename
 from beanhub_cli.main import cli
+from beanhub_cli.workers import get_parser
 
 
 def test_format_cmd(tmp_path: pathlib.Path, cli_runner: CliRunner):
@@ -35,3 +42,358 @@ def test_format_cmd_without_args(tmp_path: pathlib.Path, cli_runner: CliRunner):
         result = cli_runner.invoke(cli, ["format"])
     assert result.exit_code == 0
     assert included_bean.read_text() == "2024-06-27 open Assets:Cash\n"
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_format_cmd_workers(
+    tmp_path: pathlib.Path, cli_runner: CliRunner, workers: int
+):
+    books_dir = tmp_path / "books"
+    books_dir.mkdir()
+    (tmp_path / "main.bean").write_text(
+        'include "books/*.bean"\n2024-06-27   open   Assets:Cash\n'
+    )
+    (books_dir / "2024.bean").write_text(
+        'include "2024/*.bean"\n2024-06-27   open   Assets:Bank\n'
+    )
+    (books_dir / "2025.bean").write_text("2025-01-01 open Assets:Bank2\n")
+    (books_dir / "2024").mkdir()
+    for month in range(1, 4):
+        (books_dir / "2024" / f"{month:02d}.bean").write_text(
+            f"2024-{month:02d}-01   open   Expenses:Month{month}"
+        )
+
+    cli_runner.mix_stderr = False
+    with switch_cwd(tmp_path):
+        result = cli_runner.invoke(
+            cli,
+            ["format", "-b", "-j", str(workers)],
+            env={"COLUMNS": "300"},
+            catch_exceptions=False,
+        )
+    assert result.exit_code == 0, result.stderr
+    assert (tmp_path / "main.bean").read_text() == (
+        'include "books/*.bean"\n\n2024-06-27 open Assets:Cash\n'
+    )
+    for month in range(1, 4):
+        assert (books_dir / "2024" / f"{month:02d}.bean").read_text() == (
+            f"2024-{month:02d}-01 open Expenses:Month{month}\n"
+        )
+    assert not (books_dir / "2025.bean.backup").exists()
+    assert sorted(path.name for path in tmp_path.rglob("*.backup")) == [
+        "01.bean.backup",
+        "02.bean.backup",
+        "03.bean.backup",
+        "2024.bean.backup",
+        "main.bean.backup",
+    ]
+    # files are processed in the same order as traversing sequentially
+    processed_files = [
+        pathlib.Path(line.split("Processing file ")[1].split()[0])
+        for line in result.stderr.splitlines()
+        if "Processing file " in line
+    ]
+    assert processed_files == [
+        (tmp_path / "main.bean").absolute(),
+        (books_dir / "2024.bean").resolve(),
+        (books_dir / "2025.bean").resolve(),
+        (books_dir / "2024" / "01.bean").resolve(),
+        (books_dir / "2024" / "02.bean").resolve(),
+        (books_dir / "2024" / "03.bean").resolve(),
+    ]
+
+
+def test_format_cmd_cache(tmp_path: pathlib.Path, cli_runner: CliRunner):
+    (tmp_path / ".beanhub").mkdir()
+    main_bean = tmp_path / "main.bean"
+    main_bean.write_text('include "books.bean"\n2024-06-27   open   Assets:Cash')
+    books_bean = tmp_path / "books.bean"
+    books_bean.write_text("2024-06-27 open Assets:Bank\n")
+
+    def run_format(*args: str) -> list[str]:
+        cli_runner.mix_stderr = False
+        with switch_cwd(tmp_path):
+            result = cli_runner.invoke(
+                cli,
+                ["format", *args],
+                env={"COLUMNS": "300"},
+                catch_exceptions=False,
+            )
+        assert result.exit_code == 0, result.stderr
+        return [
+            pathlib.Path(line.split("File ")[1].split()[0]).name
+            for line in result.stderr.splitlines()
+            if "formatted according to the cache" in line
+        ]
+
+    assert run_format() == []
+    assert (tmp_path / ".beanhub" / "cache" / "format.json").exists()
+    # main.bean was changed by the first run, so only books.bean was cached
+    assert run_format() == ["books.bean"]
+    assert run_format() == ["main.bean", "books.bean"]
+
+    books_bean.write_text("2024-06-27   open   Assets:Bank")
+    assert run_format() == ["main.bean"]
+    assert books_bean.read_text() == "2024-06-27 open Assets:Bank\n"
+
+    assert run_format("--no-cache") == []
+    # files with nothing to rename are still skipped with the cache
+    assert run_format("-ra", "Assets:Bank", "Assets:Bank2") == ["main.bean"]
+    assert books_bean.read_text() == "2024-06-27 open Assets:Bank2\n"
+
+    # entries of the files not visited are dropped
+    assert run_format("books.bean") == []
+    assert run_format() == ["books.bean"]
+
+
+def test_format_cmd_cache_outside_project(
+    tmp_path: pathlib.Path, cli_runner: CliRunner
+):
+    main_bean = tmp_path / "main.bean"
+    main_bean.write_text("2024-06-27   open   Assets:Cash")
+
+    cli_runner.mix_stderr = False
+    with switch_cwd(tmp_path):
+        result = cli_runner.invoke(cli, ["format"], catch_exceptions=False)
+    assert result.exit_code == 0, result.stderr
+    assert main_bean.read_text() == "2024-06-27 open Assets:Cash\n"
+    assert list(tmp_path.iterdir()) == [main_bean]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_format_cmd_check(tmp_path: pathlib.Path, cli_runner: CliRunner, workers: int):
+    formatted = "2024-06-27 open Assets:Cash\n"
+    (tmp_path / "a.bean").write_text("2024-06-27   open   Assets:Cash")
+    (tmp_path / "b.bean").write_text(formatted)
+    (tmp_path / "c.bean").write_text("2024-06-27  open Assets:Cash")
+
+    cli_runner.mix_stderr = False
+    with switch_cwd(tmp_path):
+        result = cli_runner.invoke(
+            cli,
+            ["format", "--check", "--diff", "-b", "-j", str(workers)]
+            + ["a.bean", "b.bean", "c.bean"],
+            env={"COLUMNS": "300"},
+            catch_exceptions=False,
+        )
+    assert result.exit_code != 0
+    assert "2 files would be reformatted" in result.stderr
+    assert result.stdout == (
+        "--- a.bean\n"
+        "+++ a.bean\n"
+        "@@ -1 +1 @@\n"
+        "-2024-06-27   open   Assets:Cash\n"
+        "\\ No newline at end of file\n"
+        "+2024-06-27 open Assets:Cash\n"
+        "--- c.bean\n"
+        "+++ c.bean\n"
+        "@@ -1 +1 @@\n"
+        "-2024-06-27  open Assets:Cash\n"
+        "\\ No newline at end of file\n"
+        "+2024-06-27 open Assets:Cash\n"
+    )
+    # nothing is written in check mode
+    assert (tmp_path / "a.bean").read_text() == "2024-06-27   open   Assets:Cash"
+    assert (tmp_path / "c.bean").read_text() == "2024-06-27  open Assets:Cash"
+    assert not list(tmp_path.glob("*.backup"))
+
+    with switch_cwd(tmp_path):
+        result = cli_runner.invoke(
+            cli,
+            ["format", "--check", "--fail-fast", "-j", str(workers)]
+            + ["a.bean", "b.bean", "c.bean"],
+            env={"COLUMNS": "300"},
+            catch_exceptions=False,
+        )
+    assert result.exit_code != 0
+    assert "a.bean would be reformatted" in result.stderr
+    assert "c.bean" not in result.stderr
+
+    with switch_cwd(tmp_path):
+        result = cli_runner.invoke(
+            cli,
+            ["format", "--check", "b.bean"],
+            catch_exceptions=False,
+        )
+    assert result.exit_code == 0
+    assert "All files are formatted" in result.stderr
+
+
+def test_format_cmd_check_usage(cli_runner: CliRunner):
+    cli_runner.mix_stderr = False
+    result = cli_runner.invoke(cli, ["format", "--fail-fast"])
+    assert result.exit_code == 2
+    assert "--fail-fast requires --check" in result.stderr
+
+
+def test_format_cmd_writes_only_changed_files(
+    tmp_path: pathlib.Path, cli_runner: CliRunner
+):
+    changed_bean = tmp_path / "changed.bean"
+    changed_bean.write_text("2024-06-27   open   Assets:Cash")
+    changed_bean.chmod(0o600)
+    unchanged_bean = tmp_path / "unchanged.bean"
+    unchanged_bean.write_text("2024-06-27 open Assets:Cash\n")
+    os.utime(unchanged_bean, ns=(0, 0))
+
+    cli_runner.mix_stderr = False
+    with switch_cwd(tmp_path):
+        result = cli_runner.invoke(
+            cli,
+            ["format", "--no-cache", "changed.bean", "unchanged.bean"],
+            catch_exceptions=False,
+        )
+    assert result.exit_code == 0, result.stderr
+    assert changed_bean.read_text() == "2024-06-27 open Assets:Cash\n"
+    assert changed_bean.stat().st_mode & 0o777 == 0o600
+    assert unchanged_bean.stat().st_mtime_ns == 0
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "changed.bean",
+        "unchanged.bean",
+    ]
+
+
+def test_format_cmd_symlink(tmp_path: pathlib.Path, cli_runner: CliRunner):
+    ledger_dir = tmp_path / "ledger"
+    ledger_dir.mkdir()
+    real_bean = ledger_dir / "main.bean"
+    real_bean.write_text("2024-06-27   open   Assets:Cash")
+    project_dir = tmp_path / "project"
+    project_dir.mkdir()
+    main_bean = project_dir / "main.bean"
+    main_bean.symlink_to(real_bean)
+
+    cli_runner.mix_stderr = False
+    with switch_cwd(project_dir):
+        result = cli_runner.invoke(
+            cli, ["format", "--no-cache", "main.bean"], catch_exceptions=False
+        )
+    assert result.exit_code == 0, result.stderr
+    assert main_bean.is_symlink()
+    assert real_bean.read_text() == "2024-06-27 open Assets:Cash\n"
+    assert list(ledger_dir.iterdir()) == [real_bean]
+
+
+def test_format_cmd_rename(tmp_path: pathlib.Path, cli_runner: CliRunner):
+    bean_file = tmp_path / "main.bean"
+    bean_file.write_text(
+        textwrap.dedent(
+            """\
+            option "title" "Assets:Bank BTC"
+            2024-06-27 open Assets:Bank BTC
+            2024-06-28 * "Assets:Bank"
+              Assets:Bank    1 BTC {100 USD} @ 120 USD
+              Assets:Cash
+              document: Assets:Bank
+            2024-06-29 price BTC 120 USD
+            2024-06-30 balance Assets:Bank  1 BTC
+            2024-06-30 commodity BTC
+            """
+        )
+    )
+    other_file = tmp_path / "other.bean"
+    other_file.write_text("2024-06-27 open Assets:Cash\n")
+
+    cli_runner.mix_stderr = False
+    with switch_cwd(tmp_path):
+        result = cli_runner.invoke(
+            cli,
+            [
+                "format",
+                "-ra",
+                "Assets:Bank",
+                "Assets:Bank2",
+                "-rc",
+                "BTC",
+                "BITCOIN",
+                "main.bean",
+                "other.bean",
+            ],
+            env={"COLUMNS": "300"},
+            catch_exceptions=False,
+        )
+    assert result.exit_code == 0, result.stderr
+    assert bean_file.read_text() == textwrap.dedent(
+        """\
+        option "title" "Assets:Bank BTC"
+
+        2024-06-30 commodity BITCOIN
+
+        2024-06-27 open Assets:Bank2 BITCOIN
+
+        2024-06-28 * "Assets:Bank"
+          Assets:Bank2                                               1 BITCOIN {100 USD} @ 120 USD
+          Assets:Cash
+            document: Assets:Bank2
+
+        2024-06-29 price BITCOIN 120 USD
+
+        2024-06-30 balance Assets:Bank2                              1 BITCOIN
+        """
+    )
+    assert "Applied renames to file main.bean" in result.stderr
+    # the file has nothing to rename, so the renames are not applied to it at all
+    assert "Applied renames to file other.bean" not in result.stderr
+
+
+def test_rename_tree_in_place():
+    tree = get_parser().parse(
+        '2024-06-28 * "Coffee"\n  Assets:Bank  -5 USD\n  Expenses:Food\n'
+    )
+    txn_tree = tree.children[0].children[0]
+    posting_tree = tree.children[1].children[0].children[0]
+    food_token = tree.children[2].children[0].children[0].children[1]
+
+    rename_tree(
+        tree,
+        [TokenRename(token_type="ACCOUNT", replacements={"Assets:Bank": "Assets:B"})],
+    )
+    # only the renamed token is replaced, the rest of the tree stays the same
+    assert tree.children[0].children[0] is txn_tree
+    assert tree.children[1].children[0].children[0] is posting_tree
+    assert tree.children[2].children[0].children[0].children[1] is food_token
+    account_token = posting_tree.children[1]
+    assert account_token == "Assets:B"
+    assert account_token.value == "Assets:B"
+    assert account_token.line == 2
+
+
+def test_find_rules_containing():
+    rule_names = find_rules_containing(get_parser(), frozenset(["CURRENCY"]))
+    assert {"start", "statement", "posting", "amount", "price"} <= rule_names
+    assert not {"txn", "option", "include", "number_expr"} & rule_names
+
+
+def test_format_cmd_column_widths_per_file(
+    tmp_path: pathlib.Path, cli_runner: CliRunner
+):
+    wide_bean = tmp_path / "wide.bean"
+    wide_bean.write_text(
+        '2024-06-28 * "Coffee"\n'
+        "  Assets:Bank:Checking:Very:Long:Account:Name  -5 USD\n"
+        "  Expenses:Food\n"
+    )
+    narrow_bean = tmp_path / "narrow.bean"
+    narrow_content = '2024-06-28 * "Tea"\n  Assets:Bank  -5 USD\n  Expenses:Food\n'
+    narrow_bean.write_text(narrow_content)
+
+    cli_runner.mix_stderr = False
+    with switch_cwd(tmp_path):
+        result = cli_runner.invoke(
+            cli,
+            ["format", "--no-cache", "narrow.bean"],
+            catch_exceptions=False,
+        )
+    assert result.exit_code == 0, result.stderr
+    expected = narrow_bean.read_text()
+
+    narrow_bean.write_text(narrow_content)
+    with switch_cwd(tmp_path):
+        result = cli_runner.invoke(
+            cli,
+            ["format", "--no-cache", "wide.bean", "narrow.bean"],
+            catch_exceptions=False,
+        )
+    assert result.exit_code == 0, result.stderr
+    # column widths of the wide file don't leak into the next one
+    assert narrow_bean.read_text() == expected
@@ -0,0 +1,52 @@
+import pathlib
+
+from beanhub_cli.format_cache import FormatCache
+from beanhub_cli.format_cache import hash_content
+from beanhub_cli.format_cache import make_config_hash
+
+
+def test_format_cache(tmp_path: pathlib.Path):
+    cache_path = tmp_path / "format.json"
+    bean_file = tmp_path / "main.bean"
+    content_hash = hash_content(b'include "books/*.bean"\n')
+    config_hash = make_config_hash()
+
+    with FormatCache(cache_path=cache_path, config_hash=config_hash) as cache:
+        assert cache.get(bean_file, content_hash) is None
+        cache.put(bean_file, content_hash, [("books/*.bean", 1)])
+
+    cache = FormatCache(cache_path=cache_path, config_hash=config_hash)
+    assert cache.get(bean_file, content_hash) == [("books/*.bean", 1)]
+    assert cache.get(bean_file, hash_content(b"")) is None
+    assert cache.hit_count == 1
+
+    # a different config, such as another beancount-black version, invalidates
+    # all the entries
+    cache = FormatCache(cache_path=cache_path, config_hash="other")
+    assert cache.get(bean_file, content_hash) is None
+
+
+def test_format_cache_prune(tmp_path: pathlib.Path):
+    cache_path = tmp_path / "format.json"
+    main_bean = tmp_path / "main.bean"
+    books_bean = tmp_path / "books.bean"
+    content_hash = hash_content(b"")
+    config_hash = make_config_hash()
+    with FormatCache(cache_path=cache_path, config_hash=config_hash) as cache:
+        cache.put(main_bean, content_hash, [])
+        cache.put(books_bean, content_hash, [])
+
+    # only main.bean is visited in this run
+    with FormatCache(cache_path=cache_path, config_hash=config_hash) as cache:
+        assert cache.get(main_bean, content_hash) == []
+
+    cache = FormatCache(cache_path=cache_path, config_hash=config_hash)
+    assert cache.get(main_bean, content_hash) == []
+    assert cache.get(books_bean, content_hash) is None
+
+
+def test_format_cache_invalid(tmp_path: pathlib.Path):
+    cache_path = tmp_path / "format.json"
+    cache_path.write_text("{")
+    cache = FormatCache(cache_path=cache_path, config_hash=make_config_hash())
+    assert cache.entries == {}
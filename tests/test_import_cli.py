@@ -0,0 +1,512 @@
+import csv
+import json
+import pathlib
+import pstats
+import textwrap
+import tracemalloc
+
+import pytest
+from beanhub_import.data_types import Amount
+from beanhub_import.data_types import ChangeSet
+from beanhub_import.data_types import GeneratedPosting
+from beanhub_import.data_types import GeneratedTransaction
+from click.testing import CliRunner
+
+from beanhub_cli.bean_index import ExistingTransactionIndex
+from beanhub_cli.bean_index import INDEX_FILENAME
+from beanhub_cli.file_io import CACHE_DIR
+from beanhub_cli.format_cache import hash_content
+from beanhub_cli.import_cli import _render_change_set
+from beanhub_cli.main import cli
+
+IMPORTS_YAML = textwrap.dedent(
+    """\
+    inputs:
+      - match: "import-data/mercury/*.csv"
+        config:
+          extractor: mercury
+          default_file: "books.bean"
+          prepend_postings:
+            - account: Assets:Bank:US:Mercury
+              amount:
+                number: "{{ amount }}"
+                currency: "{{ currency | default('USD', true) }}"
+    imports:
+      - name: Gusto payroll
+        match:
+          desc: GUSTO
+        actions:
+          - txn:
+              narration: "Payroll"
+              postings:
+                - account: Expenses:Payroll
+                  amount:
+                    number: "{{ -amount }}"
+                    currency: "{{ currency | default('USD', true) }}"
+    """
+)
+MERCURY_CSV_HEADER = (
+    "Date (UTC),Description,Amount,Status,Source Account,Bank Description,"
+    "Reference,Note,Last Four Digits,Name On Card,Category,GL Code,"
+    "Timestamp,Original Currency"
+)
+
+
+def write_mercury_csv(csv_path: pathlib.Path, rows: list[tuple[str, str, str]]):
+    csv_path.parent.mkdir(parents=True, exist_ok=True)
+    lines = [MERCURY_CSV_HEADER]
+    for date, desc, amount in rows:
+        lines.append(
+            f"{date},{desc},{amount},Sent,Mercury Checking xx1234,{desc},,,,,,,"
+            f"{date} 21:30:40,"
+        )
+    csv_path.write_text("\n".join(lines) + "\n")
+
+
+@pytest.fixture
+def import_project(tmp_path: pathlib.Path) -> pathlib.Path:
+    beanhub_dir = tmp_path / ".beanhub"
+    beanhub_dir.mkdir()
+    (beanhub_dir / "imports.yaml").write_text(IMPORTS_YAML)
+    (tmp_path / "main.bean").write_text('include "books.bean"\n')
+    write_mercury_csv(
+        tmp_path / "import-data" / "mercury" / "2024.csv",
+        [
+            ("04-17-2024", "GUSTO", "-1500.00"),
+            ("04-16-2024", "Amazon Web Services", "-353.63"),
+        ],
+    )
+    return tmp_path
+
+
+def run_import(
+    cli_runner: CliRunner, project: pathlib.Path, *args: str
+) -> tuple[int, str]:
+    cli_runner.mix_stderr = False
+    result = cli_runner.invoke(
+        cli,
+        [
+            "import",
+            "--config",
+            str(project / ".beanhub" / "imports.yaml"),
+            "--workdir",
+            str(project),
+            "-j",
+            "1",
+            *args,
+        ],
+        # avoid log lines being wrapped by rich
+        env={"COLUMNS": "300"},
+        catch_exceptions=False,
+    )
+    return result.exit_code, result.output
+
+
+def test_import_cmd(import_project: pathlib.Path, cli_runner: CliRunner):
+    exit_code, output = run_import(cli_runner, import_project)
+    assert exit_code == 0, output
+    assert "Generated 1 transactions" in output
+    assert "Skipped 1 transactions" in output
+    bean_content = (import_project / "books.bean").read_text()
+    assert 'import-id: "import-data/mercury/2024.csv:-2"' in bean_content
+    assert "Expenses:Payroll" in bean_content
+
+
+def test_import_cmd_result_cache(import_project: pathlib.Path, cli_runner: CliRunner):
+    exit_code, output = run_import(cli_runner, import_project)
+    assert exit_code == 0, output
+    assert "Reused cached results for 0 of 1 import files" in output
+    cache_entries = list((import_project / CACHE_DIR / "imports").rglob("*.json"))
+    assert len(cache_entries) == 1
+    bean_file = import_project / "books.bean"
+    first_content = bean_file.read_text()
+
+    exit_code, output = run_import(cli_runner, import_project)
+    assert exit_code == 0, output
+    assert "Reused cached results for 1 of 1 import files" in output
+    assert "Generated 1 transactions" in output
+    assert "Wrote 0 of 1 bean files" in output
+    assert bean_file.read_text() == first_content
+
+    # changing the input file invalidates its cache entry and prunes the stale one
+    write_mercury_csv(
+        import_project / "import-data" / "mercury" / "2024.csv",
+        [("04-17-2024", "GUSTO", "-1500.00")],
+    )
+    exit_code, output = run_import(cli_runner, import_project)
+    assert exit_code == 0, output
+    assert "Reused cached results for 0 of 1 import files" in output
+    new_cache_entries = list((import_project / CACHE_DIR / "imports").rglob("*.json"))
+    assert len(new_cache_entries) == 1
+    assert new_cache_entries != cache_entries
+
+
+def test_import_cmd_result_cache_per_config(
+    import_project: pathlib.Path, cli_runner: CliRunner
+):
+    config_path = import_project / ".beanhub" / "imports.yaml"
+    other_config_path = import_project / ".beanhub" / "other-imports.yaml"
+    other_config_path.write_text(IMPORTS_YAML.replace("Payroll", "Salary"))
+
+    def run_import_with_config(path: pathlib.Path) -> str:
+        exit_code, output = run_import(
+            cli_runner, import_project, "--config", str(path)
+        )
+        assert exit_code == 0, output
+        return output
+
+    run_import_with_config(config_path)
+    run_import_with_config(other_config_path)
+    # alternating the configs doesn't prune the entries of each other
+    output = run_import_with_config(config_path)
+    assert "Reused cached results for 1 of 1 import files" in output
+    output = run_import_with_config(other_config_path)
+    assert "Reused cached results for 1 of 1 import files" in output
+    assert len(list((import_project / CACHE_DIR / "imports").rglob("*.json"))) == 2
+
+
+def test_import_cmd_no_cache(import_project: pathlib.Path, cli_runner: CliRunner):
+    exit_code, output = run_import(cli_runner, import_project, "--no-cache")
+    assert exit_code == 0, output
+    assert "Reused cached results" not in output
+    assert not (import_project / CACHE_DIR / "imports").exists()
+
+
+def test_import_cmd_existing_txn_index(
+    import_project: pathlib.Path, cli_runner: CliRunner
+):
+    exit_code, output = run_import(cli_runner, import_project)
+    assert exit_code == 0, output
+    assert (import_project / CACHE_DIR / "existing-txns.json").exists()
+
+    # books.bean was just created by the previous run
+    exit_code, output = run_import(cli_runner, import_project)
+    assert exit_code == 0, output
+    assert "Scanned 1 changed Beancount files" in output
+    assert "Found 1 existing imported transactions" in output
+
+    exit_code, output = run_import(cli_runner, import_project)
+    assert exit_code == 0, output
+    assert "Scanned 0 changed Beancount files" in output
+    assert "Found 1 existing imported transactions" in output
+
+    # the hash of the formatter output is recorded for splicing next time
+    books_bean = (import_project / "books.bean").resolve()
+    index = ExistingTransactionIndex(
+        index_path=import_project / CACHE_DIR / INDEX_FILENAME
+    )
+    assert index.get_formatted_hash(books_bean) == hash_content(books_bean.read_bytes())
+
+
+def test_import_cmd_detailed_report(
+    import_project: pathlib.Path, cli_runner: CliRunner
+):
+    exit_code, output = run_import(cli_runner, import_project, "--detailed-report")
+    assert exit_code == 0, output
+    assert "Generated transactions" in output
+    assert "Open transactions" in output
+    assert "Amazon Web Services" in output
+    assert "-353.63" in output
+
+
+def test_import_cmd_append_new_rows(
+    import_project: pathlib.Path, tmp_path_factory: pytest.TempPathFactory
+):
+    cli_runner = CliRunner()
+    exit_code, output = run_import(cli_runner, import_project)
+    assert exit_code == 0, output
+    rows = [
+        ("04-18-2024", "GUSTO", "-2500.00"),
+        ("04-17-2024", "GUSTO", "-1500.00"),
+        ("04-16-2024", "Amazon Web Services", "-353.63"),
+    ]
+    write_mercury_csv(import_project / "import-data" / "mercury" / "2024.csv", rows)
+    exit_code, output = run_import(cli_runner, import_project)
+    assert exit_code == 0, output
+
+    # should be the same as importing all the rows from scratch
+    fresh_project = tmp_path_factory.mktemp("fresh")
+    (fresh_project / ".beanhub").mkdir()
+    (fresh_project / ".beanhub" / "imports.yaml").write_text(IMPORTS_YAML)
+    (fresh_project / "main.bean").write_text('include "books.bean"\n')
+    write_mercury_csv(fresh_project / "import-data" / "mercury" / "2024.csv", rows)
+    exit_code, output = run_import(cli_runner, fresh_project)
+    assert exit_code == 0, output
+    assert (import_project / "books.bean").read_text() == (
+        fresh_project / "books.bean"
+    ).read_text()
+
+
+def test_import_cmd_dry_run(import_project: pathlib.Path, cli_runner: CliRunner):
+    exit_code, output = run_import(cli_runner, import_project, "--dry-run")
+    assert exit_code == 0, output
+    assert "Would create new bean file" in output
+    assert "Dry run, no Beancount files were changed" in output
+    assert not (import_project / "books.bean").exists()
+
+
+def test_import_cmd_diff(import_project: pathlib.Path, cli_runner: CliRunner):
+    exit_code, output = run_import(cli_runner, import_project, "--diff")
+    assert exit_code == 0, output
+    assert not (import_project / "books.bean").exists()
+    assert f"+++ {import_project / 'books.bean'}" in output
+    assert '+  import-id: "import-data/mercury/2024.csv:-2"' in output
+
+    exit_code, output = run_import(cli_runner, import_project)
+    assert exit_code == 0, output
+    exit_code, output = run_import(cli_runner, import_project, "--diff")
+    assert exit_code == 0, output
+    assert "+++" not in output
+
+
+def test_import_cmd_report_json(import_project: pathlib.Path, cli_runner: CliRunner):
+    report_path = import_project / "report.json"
+    exit_code, output = run_import(
+        cli_runner, import_project, "--report-json", str(report_path)
+    )
+    assert exit_code == 0, output
+    report = json.loads(report_path.read_text())
+    assert report["version"] == 1
+    assert not report["dry_run"]
+    assert [phase["name"] for phase in report["phases"]] == [
+        "load_config",
+        "collect_import_files",
+        "process_import_files",
+        "extract_existing_transactions",
+        "compute_changes",
+        "apply_change_sets",
+    ]
+    assert report["counts"]["generated"] == 1
+    assert report["counts"]["skipped"] == 1
+    (import_file,) = report["import_files"]
+    assert import_file["file"] == "import-data/mercury/2024.csv"
+    assert not import_file["cached"]
+    assert import_file["generated"] == 1
+    assert import_file["unprocessed"] == 1
+    assert import_file["wall_time"] >= 0
+    assert report["bean_files"] == [
+        dict(
+            file=str((import_project / "books.bean").resolve()),
+            add=1,
+            update=0,
+            remove=0,
+            dangling=0,
+            written=True,
+        )
+    ]
+
+    exit_code, output = run_import(
+        cli_runner, import_project, "--report-json", str(report_path)
+    )
+    assert exit_code == 0, output
+    report = json.loads(report_path.read_text())
+    (import_file,) = report["import_files"]
+    assert import_file["cached"]
+    assert import_file["wall_time"] is None
+    assert report["bean_files"][0]["update"] == 1
+    assert not report["bean_files"][0]["written"]
+
+
+def test_import_cmd_detailed_report_rows(
+    import_project: pathlib.Path, cli_runner: CliRunner
+):
+    write_mercury_csv(
+        import_project / "import-data" / "mercury" / "2024.csv",
+        [(f"04-{day:02d}-2024", f"Shop {day}", "-1.00") for day in range(1, 4)],
+    )
+    exit_code, output = run_import(
+        cli_runner, import_project, "--detailed-report", "--detailed-report-rows", "1"
+    )
+    assert exit_code == 0, output
+    assert "2 more rows not shown" in output
+    assert sum(f"Shop {day}" in output for day in range(1, 4)) == 1
+
+
+def test_import_cmd_detailed_report_csv(
+    import_project: pathlib.Path, cli_runner: CliRunner
+):
+    csv_path = import_project / "report.csv"
+    exit_code, output = run_import(
+        cli_runner, import_project, "--detailed-report-csv", str(csv_path)
+    )
+    assert exit_code == 0, output
+    assert "Open transactions" not in output
+    with csv_path.open(newline="") as fo:
+        rows = list(csv.DictReader(fo))
+    assert [(row["section"], row["id"]) for row in rows] == [
+        ("generated", "import-data/mercury/2024.csv:-2"),
+        ("open", "import-data/mercury/2024.csv:-1"),
+    ]
+    assert rows[1]["desc"] == "Amazon Web Services"
+    assert rows[1]["amount"] == "-353.63"
+
+
+def test_import_cmd_watch(
+    import_project: pathlib.Path,
+    cli_runner: CliRunner,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    csv_path = import_project / "import-data" / "mercury" / "2024.csv"
+    wait_calls = []
+
+    def wait_for_changes(get_paths, snapshot, interval):
+        wait_calls.append(interval)
+        if len(wait_calls) > 1:
+            raise KeyboardInterrupt()
+        assert csv_path.absolute() in snapshot
+        assert (import_project / "books.bean").absolute() in snapshot
+        write_mercury_csv(
+            csv_path,
+            [
+                ("04-18-2024", "GUSTO", "-1600.00"),
+                ("04-17-2024", "GUSTO", "-1500.00"),
+                ("04-16-2024", "Amazon Web Services", "-353.63"),
+            ],
+        )
+        return snapshot, [csv_path]
+
+    monkeypatch.setattr("beanhub_cli.import_cli.wait_for_changes", wait_for_changes)
+    exit_code, output = run_import(
+        cli_runner, import_project, "--watch", "--watch-interval", "0.5"
+    )
+    assert exit_code == 0, output
+    assert wait_calls == [0.5, 0.5]
+    assert "Detected changes in 1 files, importing again" in output
+    assert "Stopped watching" in output
+    bean_content = (import_project / "books.bean").read_text()
+    assert "1,600.00 USD" in bean_content
+
+
+def test_import_cmd_watch_recover(
+    import_project: pathlib.Path,
+    cli_runner: CliRunner,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    config_path = import_project / ".beanhub" / "imports.yaml"
+    csv_path = import_project / "import-data" / "mercury" / "2024.csv"
+    wait_calls = []
+
+    def wait_for_changes(get_paths, snapshot, interval):
+        wait_calls.append(interval)
+        if len(wait_calls) == 1:
+            # a half-edited config
+            config_path.write_text(IMPORTS_YAML + "imports: [\n")
+            return snapshot, [config_path]
+        elif len(wait_calls) == 2:
+            config_path.write_text(IMPORTS_YAML)
+            write_mercury_csv(
+                csv_path,
+                [
+                    ("04-18-2024", "GUSTO", "-1600.00"),
+                    ("04-17-2024", "GUSTO", "-1500.00"),
+                    ("04-16-2024", "Amazon Web Services", "-353.63"),
+                ],
+            )
+            return snapshot, [config_path, csv_path]
+        raise KeyboardInterrupt()
+
+    monkeypatch.setattr("beanhub_cli.import_cli.wait_for_changes", wait_for_changes)
+    exit_code, output = run_import(cli_runner, import_project, "--watch")
+    assert exit_code == 0, output
+    assert len(wait_calls) == 3
+    assert "Failed to import, waiting for the next change" in output
+    assert "Stopped watching" in output
+    bean_content = (import_project / "books.bean").read_text()
+    assert "1,600.00 USD" in bean_content
+
+
+def test_import_cmd_profile_memory(import_project: pathlib.Path, cli_runner: CliRunner):
+    report_path = import_project / "report.json"
+    exit_code, output = run_import(
+        cli_runner,
+        import_project,
+        "--profile-memory",
+        "--report-json",
+        str(report_path),
+    )
+    assert exit_code == 0, output
+    assert "Phase process_import_files peak memory" in output
+    assert not tracemalloc.is_tracing()
+    report = json.loads(report_path.read_text())
+    for phase in report["phases"]:
+        assert phase["memory"]["traced_peak"] > 0
+        assert phase["memory"]["max_rss"] > 0
+    process_phase = next(
+        phase for phase in report["phases"] if phase["name"] == "process_import_files"
+    )
+    assert process_phase["memory"]["workers_max_rss"] > 0
+    (import_file,) = report["import_files"]
+    assert import_file["max_rss"] > 0
+
+
+def test_import_cmd_profile_workers(
+    import_project: pathlib.Path, cli_runner: CliRunner
+):
+    profile_path = import_project / "bh.prof"
+    cli_runner.mix_stderr = False
+    result = cli_runner.invoke(
+        cli,
+        [
+            "--profile",
+            str(profile_path),
+            "--profile-workers",
+            "import",
+            "--workdir",
+            str(import_project),
+            "--config",
+            str(import_project / ".beanhub" / "imports.yaml"),
+            "-j",
+            "1",
+        ],
+        catch_exceptions=False,
+    )
+    assert result.exit_code == 0, result.output
+    pstats.Stats(str(profile_path))
+    (worker_profile_path,) = import_project.glob("bh.prof.worker-*")
+    stats = pstats.Stats(str(worker_profile_path))
+    assert any(
+        function_name == "process_import_task" for _, _, function_name in stats.stats
+    )
+
+
+def test_render_change_set_column_widths_per_file(tmp_path: pathlib.Path):
+    def make_change_set(account: str) -> ChangeSet:
+        return ChangeSet(
+            add=[
+                GeneratedTransaction(
+                    file="output.bean",
+                    id="mercury.csv:-1",
+                    sources=["mercury.csv"],
+                    date="2024-04-17",
+                    flag="*",
+                    narration="Coffee",
+                    postings=[
+                        GeneratedPosting(
+                            account=account,
+                            amount=Amount(number="-5.00", currency="USD"),
+                        ),
+                        GeneratedPosting(account="Expenses:Food"),
+                    ],
+                )
+            ],
+            update={},
+            remove=[],
+            dangling=[],
+        )
+
+    narrow_change_set = make_change_set("Assets:Bank")
+    narrow_content = _render_change_set(
+        tmp_path / "narrow.bean", narrow_change_set, remove_dangling=False
+    )
+    _render_change_set(
+        tmp_path / "wide.bean",
+        make_change_set("Assets:Bank:Checking:Very:Long:Account:Name"),
+        remove_dangling=False,
+    )
+    # column widths of the wide file don't leak into the next one
+    assert (
+        _render_change_set(
+            tmp_path / "narrow.bean", narrow_change_set, remove_dangling=False
+        )
+        == narrow_content
+    )
@@ -0,0 +1,96 @@
+import datetime
+import decimal
+import pickle
+
+import pytest
+from beanhub_extract.data_types import Transaction
+from beanhub_import.data_types import Amount
+from beanhub_import.data_types import ChangeSet
+from beanhub_import.data_types import DeletedTransaction
+from beanhub_import.data_types import GeneratedPosting
+from beanhub_import.data_types import GeneratedTransaction
+from beanhub_import.data_types import MetadataItem
+from beanhub_import.data_types import TransactionUpdate
+from beanhub_import.data_types import UnprocessedTransaction
+
+from beanhub_cli.import_records import decode_result
+from beanhub_cli.import_records import encode_result
+from beanhub_cli.import_records import GeneratedRecord
+from beanhub_cli.import_records import make_record
+from beanhub_cli.import_records import materialize_change_set
+
+GENERATED_TXN = GeneratedTransaction(
+    file="output.bean",
+    id="mercury.csv:-1",
+    sources=["mercury.csv"],
+    date="2024-04-17",
+    flag="*",
+    narration="Coffee",
+    tags=["food"],
+    metadata=[MetadataItem(name="category", value="coffee")],
+    postings=[
+        GeneratedPosting(
+            account="Assets:Cash",
+            amount=Amount(number="-5.00", currency="USD"),
+        ),
+        GeneratedPosting(account="Expenses:Food"),
+    ],
+)
+
+
+@pytest.mark.parametrize(
+    "result",
+    [
+        GENERATED_TXN,
+        DeletedTransaction(id="mercury.csv:-2"),
+        UnprocessedTransaction(
+            import_id="mercury.csv:-3",
+            txn=Transaction(
+                extractor="mercury",
+                file="mercury.csv",
+                lineno=3,
+                date=datetime.date(2024, 4, 17),
+                timestamp=datetime.datetime(
+                    2024, 4, 17, 21, 30, 40, tzinfo=datetime.timezone.utc
+                ),
+                amount=decimal.Decimal("-353.63"),
+                desc="Amazon Web Services",
+                extra=dict(foo="bar"),
+            ),
+            output_file="output.bean",
+            prepending_postings=[GeneratedPosting(account="Assets:Cash")],
+        ),
+    ],
+)
+def test_encode_result_round_trip(
+    result: GeneratedTransaction | DeletedTransaction | UnprocessedTransaction,
+):
+    assert decode_result(encode_result(result)) == result
+
+
+def test_generated_record():
+    record = make_record(encode_result(GENERATED_TXN))
+    assert isinstance(record, GeneratedRecord)
+    assert record.id == GENERATED_TXN.id
+    assert record.file == GENERATED_TXN.file
+    assert record.date == GENERATED_TXN.date
+    assert record.narration == GENERATED_TXN.narration
+    assert list(record.sources) == GENERATED_TXN.sources
+    assert record.to_model() == GENERATED_TXN
+    assert pickle.loads(pickle.dumps(record)) == record
+
+
+def test_materialize_change_set():
+    record = make_record(encode_result(GENERATED_TXN))
+    change_set = ChangeSet(
+        remove=[],
+        update={1: TransactionUpdate(txn=record)},
+        add=[record],
+        dangling=[],
+    )
+    assert materialize_change_set(change_set) == ChangeSet(
+        remove=[],
+        update={1: TransactionUpdate(txn=GENERATED_TXN)},
+        add=[GENERATED_TXN],
+        dangling=[],
+    )
@@ -0,0 +1,184 @@
+import pathlib
+import pickle
+import textwrap
+
+import pytest
+import yaml
+from beanhub_import.data_types import ImportDoc
+from beanhub_import.processor import collect_import_files
+from beanhub_import.processor import process_import_file
+
+from beanhub_cli.import_rules import CachedTemplateEnvironment
+from beanhub_cli.import_rules import ImportRuleMatcher
+from beanhub_cli.import_rules import make_template_environment
+from beanhub_cli.import_rules import process_import_file as process_with_matcher
+
+MERCURY_CSV = textwrap.dedent(
+    """\
+    Date (UTC),Description,Amount,Status,Source Account,Bank Description,Reference,Note,Last Four Digits,Name On Card,Category,GL Code,Timestamp,Original Currency
+    04-20-2024,Coffee Shop,-5.00,Sent,Mercury Checking xx1234,Coffee Shop,,,,,,,04-20-2024 21:30:40,
+    04-19-2024,Amazon Web Services,-353.63,Sent,Mercury Checking xx1234,AWS,,,,,,,04-19-2024 21:30:40,
+    04-18-2024,Send Money transaction initiated on Mercury,-1000.00,Sent,Mercury Checking xx1234,Transfer to savings,,,,,,,04-18-2024 21:30:40,
+    04-17-2024,GUSTO,-1500.00,Sent,Mercury Checking xx1234,GUSTO PAYROLL,,,,,,,04-17-2024 21:30:40,
+    04-16-2024,Stripe,250.00,Sent,Mercury Checking xx1234,STRIPE TRANSFER,,,,,,,04-16-2024 21:30:40,
+    04-15-2024,Netflix,-15.99,Sent,Mercury Checking xx1234,NETFLIX.COM,,,,,,,04-15-2024 21:30:40,
+    04-14-2024,Unknown,-1.00,Sent,Mercury Checking xx1234,UNKNOWN,,,,,,,04-14-2024 21:30:40,
+    """
+)
+IMPORTS_YAML = textwrap.dedent(
+    """\
+    context:
+      routine_expenses:
+        "Amazon Web Services":
+          account: Expenses:Cloud
+    inputs:
+      - match: "import-data/mercury/*.csv"
+        config:
+          extractor: mercury
+          default_file: "books/{{ date.year }}.bean"
+          prepend_postings:
+            - account: Assets:Bank:US:Mercury
+              amount:
+                number: "{{ amount }}"
+                currency: "{{ currency | default('USD', true) }}"
+      - match: "import-data/tagged/*.csv"
+        extra_attrs:
+          bank: "mercury-{{ source_account }}"
+        config:
+          extractor: mercury
+          default_file: "tagged.bean"
+    imports:
+      - name: Ignore small ones
+        match:
+          extractor:
+            equals: mercury
+          desc:
+            one_of:
+              - unknown
+            ignore_case: true
+        actions:
+          - type: ignore
+      - name: Tagged bank
+        match:
+          bank:
+            prefix: "mercury-"
+          desc:
+            suffix: "Shop"
+        actions:
+          - txn:
+              narration: "Tagged {{ bank }}"
+              postings:
+                - account: Expenses:Tagged
+                  amount:
+                    number: "{{ -amount }}"
+                    currency: USD
+      - name: Routine expenses
+        common_cond:
+          extractor:
+            equals: mercury
+        match:
+          - cond:
+              desc: "(?P<vendor>Amazon Web Services)"
+            vars:
+              account: "{{ routine_expenses[vendor].account }}"
+          - cond:
+              desc:
+                one_of:
+                  - "^Net.*"
+                regex: true
+            vars:
+              account: Expenses:Entertainment
+        actions:
+          - txn:
+              narration: "{{ desc }}"
+              postings:
+                - account: "{{ account }}"
+                  amount:
+                    number: "{{ -amount }}"
+                    currency: USD
+      - name: Transfer
+        match:
+          desc:
+            contains: "Send Money"
+          file: "import-data/mercury/.*"
+        actions:
+          - type: del_txn
+            txn:
+              id: "{{ file }}:{{ lineno }}"
+      - name: Payroll
+        match:
+          bank_desc:
+            equals: GUSTO PAYROLL
+        actions:
+          - txn:
+              narration: Payroll
+              tags:
+                - payroll
+              postings:
+                - account: Expenses:Payroll
+                  amount:
+                    number: "{{ -amount }}"
+                    currency: USD
+    """
+)
+
+
+@pytest.fixture
+def import_doc(tmp_path: pathlib.Path) -> ImportDoc:
+    for input_dir in ("mercury", "tagged"):
+        csv_dir = tmp_path / "import-data" / input_dir
+        csv_dir.mkdir(parents=True)
+        (csv_dir / "2024.csv").write_text(MERCURY_CSV)
+    return ImportDoc.model_validate(yaml.safe_load(IMPORTS_YAML))
+
+
+def test_process_import_file(tmp_path: pathlib.Path, import_doc: ImportDoc):
+    import_files = collect_import_files(import_doc=import_doc, input_dir=tmp_path)
+    assert len(import_files) == 2
+    matcher = ImportRuleMatcher(import_doc.imports)
+    for import_file in import_files:
+        expected = process_import_file(import_file)
+        assert process_with_matcher(import_file, matcher) == expected
+        # the matcher is shipped to the workers
+        assert (
+            process_with_matcher(import_file, pickle.loads(pickle.dumps(matcher)))
+            == expected
+        )
+
+
+def test_find_rule(tmp_path: pathlib.Path, import_doc: ImportDoc):
+    import_files = collect_import_files(import_doc=import_doc, input_dir=tmp_path)
+    matcher = ImportRuleMatcher(import_doc.imports)
+    (results,) = [
+        process_with_matcher(import_file, matcher)
+        for import_file in import_files
+        if import_file.filepath.parent.name == "mercury"
+    ]
+    narrations = [getattr(result, "narration", None) for result in results]
+    assert narrations == [
+        None,
+        "Amazon Web Services",
+        None,
+        "Payroll",
+        None,
+        "Netflix",
+    ]
+
+
+def test_make_template_environment():
+    template_env = make_template_environment()
+    assert isinstance(template_env, CachedTemplateEnvironment)
+    template = template_env.from_string("{{ path | as_posix_path }}")
+    assert template_env.from_string("{{ path | as_posix_path }}") is template
+    assert template.render(path=pathlib.PurePosixPath("a/b")) == "a/b"
+
+
+def test_process_import_file_extra_attrs(tmp_path: pathlib.Path, import_doc: ImportDoc):
+    import_files = collect_import_files(import_doc=import_doc, input_dir=tmp_path)
+    matcher = ImportRuleMatcher(import_doc.imports)
+    (results,) = [
+        process_with_matcher(import_file, matcher)
+        for import_file in import_files
+        if import_file.filepath.parent.name == "tagged"
+    ]
+    assert results[0].narration == "Tagged mercury-Mercury Checking xx1234"
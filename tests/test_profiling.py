@@ -0,0 +1,66 @@
+import json
+import pathlib
+import pstats
+
+import pytest
+from click.testing import CliRunner
+
+from .helper import switch_cwd
+from beanhub_cli.main import cli
+from beanhub_cli.profiling import worker_profile_path
+
+
+def test_worker_profile_path():
+    assert worker_profile_path(pathlib.Path("out/bh.prof"), 1234) == pathlib.Path(
+        "out/bh.prof.worker-1234"
+    )
+
+
+def test_profile(tmp_path: pathlib.Path, cli_runner: CliRunner):
+    bean_file = tmp_path / "main.bean"
+    bean_file.write_text("2024-06-27   open   Assets:Cash")
+    profile_path = tmp_path / "bh.prof"
+
+    cli_runner.mix_stderr = False
+    with switch_cwd(tmp_path):
+        result = cli_runner.invoke(
+            cli, ["--profile", str(profile_path), "format", str(bean_file)]
+        )
+    assert result.exit_code == 0, result.output
+    assert bean_file.read_text() == "2024-06-27 open Assets:Cash\n"
+    stats = pstats.Stats(str(profile_path))
+    assert any(
+        function_name == "main" and filename.endswith("format.py")
+        for filename, _, function_name in stats.stats
+    )
+
+
+def test_profile_speedscope(tmp_path: pathlib.Path, cli_runner: CliRunner):
+    pytest.importorskip("pyinstrument")
+    bean_file = tmp_path / "main.bean"
+    bean_file.write_text("2024-06-27   open   Assets:Cash")
+    profile_path = tmp_path / "bh.speedscope.json"
+
+    cli_runner.mix_stderr = False
+    with switch_cwd(tmp_path):
+        result = cli_runner.invoke(
+            cli,
+            [
+                "--profile",
+                str(profile_path),
+                "--profile-format",
+                "speedscope",
+                "format",
+                str(bean_file),
+            ],
+        )
+    assert result.exit_code == 0, result.output
+    profile = json.loads(profile_path.read_text())
+    assert profile["$schema"] == "https://www.speedscope.app/file-format-schema.json"
+
+
+def test_profile_workers_without_profile(cli_runner: CliRunner):
+    cli_runner.mix_stderr = False
+    result = cli_runner.invoke(cli, ["--profile-workers", "format", "--help"])
+    assert result.exit_code == 2
+    assert "--profile-workers requires --profile" in result.stderr
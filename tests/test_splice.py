@@ -0,0 +1,317 @@
+import io
+import pathlib
+
+import pytest
+from beancount_black.formatter import Formatter
+from beancount_parser.parser import make_parser
+from beanhub_import.data_types import Amount
+from beanhub_import.data_types import BeancountTransaction
+from beanhub_import.data_types import ChangeSet
+from beanhub_import.data_types import GeneratedPosting
+from beanhub_import.data_types import GeneratedTransaction
+from beanhub_import.data_types import ImportOverrideFlag
+from beanhub_import.data_types import MetadataItem
+from beanhub_import.data_types import TransactionUpdate
+from beanhub_import.post_processor import apply_change_set
+from beanhub_import.post_processor import txn_to_text
+
+from beanhub_cli.format_cache import hash_content
+from beanhub_cli.import_cli import _render_change_set
+from beanhub_cli.splice import try_splice_change_set
+
+
+def make_txn(
+    index: int,
+    date: str = "2024-04-17",
+    account: str = "Expenses:Food",
+    number: str = "-5.00",
+    **kwargs,
+) -> GeneratedTransaction:
+    return GeneratedTransaction(
+        file="output.bean",
+        id=f"mercury.csv:-{index}",
+        sources=["mercury.csv"],
+        date=date,
+        flag="*",
+        narration=f"Txn {index}",
+        postings=[
+            GeneratedPosting(
+                account="Assets:Bank:US:Mercury",
+                amount=Amount(number=number, currency="USD"),
+            ),
+            GeneratedPosting(account=account),
+        ],
+        **kwargs,
+    )
+
+
+def format_text(text: str) -> str:
+    output = io.StringIO()
+    Formatter().format(make_parser().parse(text), output)
+    return output.getvalue()
+
+
+def full_apply(content: str, change_set: ChangeSet, remove_dangling: bool) -> str:
+    new_tree = apply_change_set(
+        tree=make_parser().parse(content),
+        change_set=change_set,
+        remove_dangling=remove_dangling,
+    )
+    output = io.StringIO()
+    Formatter().format(new_tree, output)
+    return output.getvalue()
+
+
+EXISTING_TXNS = [
+    make_txn(1, date="2024-04-15", number="-1500.00"),
+    make_txn(2, date="2024-04-16", payee="Cafe", tags=["food", "coffee"]),
+    make_txn(
+        3,
+        date="2024-04-16",
+        links=["receipt"],
+        metadata=[MetadataItem(name="note", value='with "quote"')],
+    ),
+]
+EXISTING_CONTENT = format_text(
+    "2024-01-01 open Assets:Bank:US:Mercury\n\n"
+    + "\n\n".join(map(txn_to_text, EXISTING_TXNS))
+    + "\n\n2024-04-16 balance Assets:Bank:US:Mercury  -1505.00 USD\n"
+)
+
+
+def noop_updates() -> dict[int, TransactionUpdate]:
+    lines = EXISTING_CONTENT.splitlines()
+    updates = {}
+    for txn in EXISTING_TXNS:
+        lineno = next(
+            i
+            for i, line in enumerate(lines, 1)
+            if f'"{txn.narration}"' in line and line[0].isdigit()
+        )
+        updates[lineno] = TransactionUpdate(txn=txn)
+    return updates
+
+
+@pytest.mark.parametrize(
+    "add",
+    [
+        [],
+        [make_txn(4, date="2024-04-17")],
+        [
+            make_txn(5, date="2024-04-18", number="10").model_copy(
+                update=dict(
+                    postings=[
+                        GeneratedPosting(
+                            account="Assets:Bank:US:Mercury",
+                            amount=Amount(number="10", currency="EUR"),
+                            price=Amount(number="1.08", currency="USD"),
+                        ),
+                        GeneratedPosting(account="Income:Refund"),
+                    ]
+                )
+            ),
+            make_txn(4, date="2024-04-16", number="-123456.78"),
+        ],
+    ],
+    ids=["no-add", "add-one", "add-many"],
+)
+def test_try_splice_change_set(add: list[GeneratedTransaction]):
+    change_set = ChangeSet(remove=[], update=noop_updates(), add=add, dangling=[])
+    new_content = try_splice_change_set(
+        EXISTING_CONTENT, change_set=change_set, remove_dangling=False
+    )
+    assert new_content == full_apply(
+        EXISTING_CONTENT, change_set=change_set, remove_dangling=False
+    )
+    if not add:
+        assert new_content == EXISTING_CONTENT
+
+
+@pytest.mark.parametrize(
+    "content, change_set, remove_dangling",
+    [
+        # new transaction goes in between existing ones
+        (
+            EXISTING_CONTENT,
+            ChangeSet(remove=[], update={}, add=[make_txn(4, date="2024-04-01")]),
+            False,
+        ),
+        # new account wider than the current column
+        (
+            EXISTING_CONTENT,
+            ChangeSet(
+                remove=[],
+                update={},
+                add=[make_txn(4, account="Expenses:" + "A" * 40)],
+            ),
+            False,
+        ),
+        # new number wider than the current column
+        (
+            EXISTING_CONTENT,
+            ChangeSet(
+                remove=[],
+                update={},
+                add=[make_txn(4, number="-123456789012.00")],
+            ),
+            False,
+        ),
+        # updated transaction
+        (
+            EXISTING_CONTENT,
+            ChangeSet(
+                remove=[],
+                update={
+                    lineno: TransactionUpdate(
+                        txn=update.txn.model_copy(update=dict(narration="Changed"))
+                    )
+                    for lineno, update in noop_updates().items()
+                },
+                add=[],
+            ),
+            False,
+        ),
+        # partial override
+        (
+            EXISTING_CONTENT,
+            ChangeSet(
+                remove=[],
+                update={
+                    lineno: TransactionUpdate(
+                        txn=update.txn,
+                        override=frozenset([ImportOverrideFlag.NARRATION]),
+                    )
+                    for lineno, update in noop_updates().items()
+                },
+                add=[],
+            ),
+            False,
+        ),
+        # removal
+        (
+            EXISTING_CONTENT,
+            ChangeSet(
+                remove=[
+                    BeancountTransaction(
+                        file="output.bean", lineno=3, id="mercury.csv:-1"
+                    )
+                ],
+                update={},
+                add=[],
+            ),
+            False,
+        ),
+        # removing dangling
+        (
+            EXISTING_CONTENT,
+            ChangeSet(
+                remove=[],
+                update={},
+                add=[],
+                dangling=[
+                    BeancountTransaction(
+                        file="output.bean", lineno=3, id="mercury.csv:-1"
+                    )
+                ],
+            ),
+            True,
+        ),
+        # tailing comments
+        (
+            EXISTING_CONTENT + "; the end\n",
+            ChangeSet(remove=[], update={}, add=[make_txn(4)]),
+            False,
+        ),
+        # not formatted
+        (
+            EXISTING_CONTENT.replace("  -1,500.00", "-1500.00   "),
+            ChangeSet(remove=[], update={}, add=[make_txn(4)]),
+            False,
+        ),
+    ],
+    ids=[
+        "add-earlier",
+        "wider-account",
+        "wider-number",
+        "update",
+        "partial-override",
+        "remove",
+        "remove-dangling",
+        "tailing-comments",
+        "not-formatted",
+    ],
+)
+def test_try_splice_change_set_fallback(
+    content: str, change_set: ChangeSet, remove_dangling: bool
+):
+    assert (
+        try_splice_change_set(
+            content, change_set=change_set, remove_dangling=remove_dangling
+        )
+        is None
+    )
+
+
+def reorder_entries(content: str, order: list[int]) -> str:
+    entries = content.rstrip("\n").split("\n\n")
+    return "\n\n".join(entries[index] for index in order) + "\n"
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        reorder_entries(EXISTING_CONTENT, [0, 3, 2, 1, 4]),
+        reorder_entries(EXISTING_CONTENT, [1, 2, 3, 4, 0]),
+        EXISTING_CONTENT.replace("\n\n", "\n\n\n", 1),
+        EXISTING_CONTENT.replace("\n", "  \n", 1),
+        EXISTING_CONTENT.replace("\n  ", "\n    "),
+        EXISTING_CONTENT.replace("\n", "\r\n"),
+    ],
+    ids=[
+        "out-of-order",
+        "open-after-txns",
+        "double-blank-lines",
+        "trailing-whitespace",
+        "four-space-indent",
+        "crlf",
+    ],
+)
+def test_render_change_set_not_formatted(tmp_path: pathlib.Path, content: str):
+    target_file = tmp_path / "output.bean"
+    target_file.write_bytes(content.encode("utf8"))
+    change_set = ChangeSet(remove=[], update={}, add=[make_txn(4)], dangling=[])
+    # the file was formatted, but it has been edited since then
+    new_content = _render_change_set(
+        target_file,
+        change_set=change_set,
+        remove_dangling=False,
+        formatted_hash=hash_content(EXISTING_CONTENT.encode("utf8")),
+    )
+    assert new_content == full_apply(
+        target_file.read_text(), change_set=change_set, remove_dangling=False
+    )
+
+
+def test_render_change_set_formatted(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+):
+    target_file = tmp_path / "output.bean"
+    target_file.write_text(EXISTING_CONTENT)
+    change_set = ChangeSet(remove=[], update={}, add=[make_txn(4)], dangling=[])
+    expected = full_apply(
+        EXISTING_CONTENT, change_set=change_set, remove_dangling=False
+    )
+
+    def apply_change_set(*args, **kwargs):
+        raise AssertionError("Expected the new transactions to be spliced in")
+
+    monkeypatch.setattr("beanhub_cli.import_cli.apply_change_set", apply_change_set)
+    assert (
+        _render_change_set(
+            target_file,
+            change_set=change_set,
+            remove_dangling=False,
+            formatted_hash=hash_content(EXISTING_CONTENT.encode("utf8")),
+        )
+        == expected
+    )
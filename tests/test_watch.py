@@ -0,0 +1,51 @@
+import pathlib
+
+from beanhub_cli.watch import diff_snapshots
+from beanhub_cli.watch import take_snapshot
+from beanhub_cli.watch import wait_for_changes
+
+
+def test_take_snapshot(tmp_path: pathlib.Path):
+    existing = tmp_path / "main.bean"
+    existing.write_text("hello\n")
+    missing = tmp_path / "missing.bean"
+    snapshot = take_snapshot([existing, missing])
+    assert snapshot == {
+        existing: (existing.stat().st_mtime_ns, 6),
+        missing: None,
+    }
+
+
+def test_diff_snapshots():
+    a = pathlib.Path("a.bean")
+    b = pathlib.Path("b.bean")
+    c = pathlib.Path("c.bean")
+    d = pathlib.Path("d.bean")
+    old = {a: (1, 1), b: (1, 1), c: None}
+    new = {a: (1, 1), b: (2, 1), c: (1, 1), d: None}
+    assert diff_snapshots(old, old) == []
+    # d is not there in both snapshots, so it's not a change
+    assert diff_snapshots(old, new) == [b, c]
+    assert diff_snapshots(new, old) == [b, c]
+
+
+def test_wait_for_changes(tmp_path: pathlib.Path):
+    bean_file = tmp_path / "main.bean"
+    bean_file.write_text("hello\n")
+    new_file = tmp_path / "new.bean"
+    paths = [bean_file]
+    snapshot = take_snapshot(paths)
+    sleeps = []
+
+    def sleep(interval: float):
+        sleeps.append(interval)
+        if len(sleeps) == 3:
+            new_file.write_text("new\n")
+            paths.append(new_file)
+
+    new_snapshot, changed_paths = wait_for_changes(
+        lambda: paths, snapshot=snapshot, interval=0.5, sleep=sleep
+    )
+    assert sleeps == [0.5, 0.5, 0.5]
+    assert changed_paths == [new_file]
+    assert new_snapshot == take_snapshot(paths)
@@ -0,0 +1,47 @@
+import concurrent.futures
+
+from beanhub_cli.workers import get_parser
+from beanhub_cli.workers import submit_largest_first
+from beanhub_cli.workers import WorkerPool
+
+
+def parse_statement_count(content: str) -> int:
+    tree = get_parser().parse(content)
+    return sum(1 for child in tree.children if child is not None)
+
+
+def test_worker_pool():
+    with WorkerPool(max_workers=2) as pool:
+        assert not pool.started
+        results = list(
+            pool.executor.map(
+                parse_statement_count,
+                ["2024-01-01 open Assets:Cash\n", 'option "title" "x"\n' * 2],
+            )
+        )
+        assert pool.started
+        # the same warm executor is reused for the following tasks
+        executor = pool.executor
+        assert (
+            executor.submit(parse_statement_count, "2024-01-01 open A:B\n").result()
+            == 1
+        )
+        assert pool.executor is executor
+    assert results == [1, 2]
+    assert not pool.started
+
+
+def test_submit_largest_first():
+    submitted: list[str] = []
+
+    class RecordingExecutor(concurrent.futures.ThreadPoolExecutor):
+        def submit(self, fn, /, *args, **kwargs):
+            submitted.append(args[0])
+            return super().submit(fn, *args, **kwargs)
+
+    items = ["b" * 2, "a" * 5, "c", "d" * 3]
+    with RecordingExecutor(max_workers=1) as executor:
+        futures = submit_largest_first(executor, str.upper, items, size=len)
+        results = [future.result() for future in futures]
+    assert submitted == ["aaaaa", "ddd", "bb", "c"]
+    assert results == ["BB", "AAAAA", "C", "DDD"]